@@ -0,0 +1,252 @@
+import logging
+import os
+import queue
+import signal
+import statistics
+import threading
+import time
+import traceback
+LLM_CONCURRENCY = int(os.environ.get('LLM_CONCURRENCY', 4))
+LLM_REQUESTS_PER_MINUTE = float(os.environ.get('LLM_REQUESTS_PER_MINUTE', 0))
+PIPELINE_QUEUE_SIZE = int(os.environ.get('PIPELINE_QUEUE_SIZE', 0))
+QUEUE_POLL_SECONDS = 0.5
+logger = logging.getLogger(__name__)
+_DONE = object()
+
+
+class RateLimiter:
+    """Spaces calls at least 60 / requests_per_minute seconds apart."""
+
+    def __init__(self, requests_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.interval = (60.0 / requests_per_minute if requests_per_minute >
+            0 else 0.0)
+        self._next_time = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, stop_event):
+        """Wait for a slot; False if stop_event was set while waiting."""
+        if not self.interval:
+            return not stop_event.is_set()
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_time)
+            self._next_time = slot + self.interval
+        delay = slot - time.monotonic()
+        if delay > 0 and stop_event.wait(delay):
+            return False
+        return not stop_event.is_set()
+
+
+class BatchPipeline:
+    """Three-stage batch runner: claim/prepare -> LLM calls -> parse/insert.
+
+    One thread claims batches from `work_queue` and builds their prompts,
+    `concurrency` threads send prompts to the model (optionally
+    rate-limited), and the calling thread hands each response to
+    `handle(conn, records, responses)`, which returns the (succeeded,
+    failed) record counts, or, when the call returned nothing, to
+    `fail(conn, records)`, then releases the batch's leases. Stages are
+    joined by bounded queues, so claiming runs at most a few batches ahead
+    of the model. The claim stage and the handler each use a connection
+    of their own. `batch_size` may be a callable, read before each claim.
+
+    SIGINT/SIGTERM (or `stop()`) stops claiming; calls already in flight
+    are finished and stored, and batches still waiting for a call slot are
+    put back to ready. `run()` returns a report with records/sec.
+    """
+
+    def __init__(self, name, work_queue, connect, prepare, call, handle,
+        fail, batch_size, concurrency=None, requests_per_minute=None,
+        queue_size=None, max_batches=None):
+        self.name = name
+        self.work_queue = work_queue
+        self.connect = connect
+        self.prepare = prepare
+        self.call = call
+        self.handle = handle
+        self.fail = fail
+        self.batch_size = batch_size
+        self.concurrency = max(1, concurrency or LLM_CONCURRENCY)
+        self.rate_limiter = RateLimiter(LLM_REQUESTS_PER_MINUTE if
+            requests_per_minute is None else requests_per_minute)
+        queue_size = queue_size or PIPELINE_QUEUE_SIZE or self.concurrency
+        self.prompts = queue.Queue(maxsize=queue_size)
+        self.responses = queue.Queue(maxsize=queue_size)
+        self.max_batches = max_batches
+        self.stop_event = threading.Event()
+        self.latencies = []
+        self.stats = {'batches': 0, 'records': 0, 'succeeded': 0, 'failed':
+            0, 'requeued': 0, 'call_errors': 0}
+        self._stats_lock = threading.Lock()
+
+    def stop(self, *_):
+        if not self.stop_event.is_set():
+            logger.info(f'{self.name}: stopping after in-flight batches')
+        self.stop_event.set()
+
+    def _put(self, target, item):
+        """Blocking put; a new batch is dropped (False) once stop() is called.
+
+        The handler always drains `responses`, so only prompt puts give up.
+        """
+        while True:
+            try:
+                target.put(item, timeout=QUEUE_POLL_SECONDS)
+                return True
+            except queue.Full:
+                if (self.stop_event.is_set() and target is self.prompts and
+                    item is not _DONE):
+                    return False
+
+    def _claim_stage(self):
+        conn = None
+        claimed = 0
+        try:
+            conn = self.connect()
+            while not self.stop_event.is_set() and claimed != self.max_batches:
+                batch_size = self.batch_size() if callable(self.batch_size
+                    ) else self.batch_size
+                records = self.work_queue.claim(conn, batch_size)
+                if not records:
+                    logger.info(f'{self.name}: no more records to claim')
+                    break
+                claimed += 1
+                try:
+                    prompt = self.prepare(records)
+                except Exception as e:
+                    logger.error(
+                        f'{self.name}: failed to prepare batch {claimed}: {str(e)}'
+                        )
+                    logger.error(traceback.format_exc())
+                    prompt = None
+                if not self._put(self.prompts, (claimed, records, prompt)):
+                    self._put(self.responses, (claimed, records, None,
+                        'requeue'))
+                    break
+        except Exception as e:
+            logger.error(f'{self.name}: claim stage failed: {str(e)}')
+            logger.error(traceback.format_exc())
+            self.stop()
+        finally:
+            if conn is not None:
+                conn.close()
+            for _ in range(self.concurrency):
+                self._put(self.prompts, _DONE)
+
+    def _call_stage(self):
+        while True:
+            item = self.prompts.get()
+            if item is _DONE:
+                self._put(self.responses, _DONE)
+                return
+            batch_number, records, prompt = item
+            if prompt is None:
+                self._put(self.responses, (batch_number, records, None,
+                    'fail'))
+                continue
+            if not self.rate_limiter.acquire(self.stop_event):
+                self._put(self.responses, (batch_number, records, None,
+                    'requeue'))
+                continue
+            start_time = time.time()
+            try:
+                responses = self.call(prompt)
+            except Exception as e:
+                logger.error(
+                    f'{self.name}: model call for batch {batch_number} failed: {str(e)}'
+                    )
+                responses = None
+                with self._stats_lock:
+                    self.stats['call_errors'] += 1
+            with self._stats_lock:
+                self.latencies.append(time.time() - start_time)
+            self._put(self.responses, (batch_number, records, responses,
+                'handle' if responses else 'fail'))
+
+    def _handle_stage(self, conn):
+        finished_callers = 0
+        while finished_callers < self.concurrency:
+            try:
+                item = self.responses.get(timeout=QUEUE_POLL_SECONDS)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                finished_callers += 1
+                continue
+            batch_number, records, responses, action = item
+            ids = [record['id'] for record in records]
+            if action == 'requeue':
+                try:
+                    self.work_queue.requeue(conn, ids)
+                    self.stats['requeued'] += len(ids)
+                except Exception as e:
+                    logger.error(
+                        f'{self.name}: failed to requeue batch {batch_number}: {str(e)}'
+                        )
+                continue
+            try:
+                if action == 'handle':
+                    succeeded, failed = self.handle(conn, records, responses)
+                else:
+                    logger.error(
+                        f'{self.name}: no valid responses for batch {batch_number}'
+                        )
+                    self.fail(conn, records)
+                    succeeded, failed = 0, len(records)
+                self.stats['succeeded'] += succeeded
+                self.stats['failed'] += failed
+                self.stats['batches'] += 1
+                self.stats['records'] += len(records)
+            except Exception as e:
+                logger.error(
+                    f'{self.name}: failed to store batch {batch_number}: {str(e)}'
+                    )
+                logger.error(traceback.format_exc())
+            finally:
+                try:
+                    self.work_queue.release(conn, ids)
+                except Exception as e:
+                    logger.error(
+                        f'{self.name}: failed to release batch {batch_number}: {str(e)}'
+                        )
+
+    def run(self):
+        """Drain the queue and return the run report."""
+        start_time = time.time()
+        previous_handlers = {}
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                previous_handlers[signum] = signal.signal(signum, self.stop)
+        conn = self.connect()
+        self.work_queue.start_heartbeat(self.connect)
+        threads = [threading.Thread(target=self._claim_stage, name=
+            f'{self.name}-claim', daemon=True)]
+        threads += [threading.Thread(target=self._call_stage, name=
+            f'{self.name}-call-{index}', daemon=True) for index in range(
+            self.concurrency)]
+        try:
+            for thread in threads:
+                thread.start()
+            self._handle_stage(conn)
+            for thread in threads:
+                thread.join()
+        finally:
+            self.work_queue.stop_heartbeat()
+            conn.close()
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+        elapsed_time = time.time() - start_time
+        report = dict(self.stats)
+        report.update({'elapsed_seconds': round(elapsed_time, 2),
+            'records_per_second': round(report['records'] / elapsed_time, 3
+            ) if elapsed_time else 0.0, 'concurrency': self.concurrency,
+            'requests_per_minute_limit': self.rate_limiter.
+            requests_per_minute or None, 'stopped_early': self.
+            stop_event.is_set()})
+        if self.latencies:
+            report['llm_latency_p50_seconds'] = round(statistics.median(self
+                .latencies), 2)
+            report['llm_latency_max_seconds'] = round(max(self.latencies), 2)
+        logger.info(f'{self.name}: pipeline finished {report}')
+        return report
@@ -0,0 +1,173 @@
+import json
+import logging
+import os
+import threading
+CHARS_PER_TOKEN = 4
+BATCH_HEADROOM = float(os.environ.get('BATCH_HEADROOM', 0.9))
+BATCH_MAX_SPLITS = int(os.environ.get('BATCH_MAX_SPLITS', 3))
+ESTIMATE_SMOOTHING = 0.3
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token)."""
+    if not text:
+        return 0
+    if not isinstance(text, str):
+        text = json.dumps(text)
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def salvage_json_array(text):
+    """Complete elements of the first JSON array in `text`.
+
+    Returns (items, closed); `closed` is False when the array was cut off,
+    in which case `items` holds every element that was fully written.
+    """
+    start = text.find('[') if text else -1
+    if start == -1:
+        return [], False
+    decoder = json.JSONDecoder()
+    items = []
+    position = start + 1
+    while True:
+        while position < len(text) and text[position] in ' \t\r\n,':
+            position += 1
+        if position >= len(text):
+            return items, False
+        if text[position] == ']':
+            return items, True
+        try:
+            item, position = decoder.raw_decode(text, position)
+        except ValueError:
+            return items, False
+        items.append(item)
+
+
+class BatchPlanner:
+    """Packs records into model calls that fit a token budget.
+
+    `batch_size()` is the number of records whose expected output fits in
+    `output_budget` (with BATCH_HEADROOM to spare); the expected output per
+    record starts at `output_tokens_per_record` and follows what the model
+    actually returns. `pack` splits claimed records further so that no
+    prompt exceeds `input_budget`. `submit` sends one batch through
+    `call(records) -> (responses, truncated, output_tokens)`; when the
+    response was cut off or left some records out, only the missing
+    records are re-sent, split in half, up to BATCH_MAX_SPLITS levels deep.
+    """
+
+    def __init__(self, name, output_budget, output_tokens_per_record,
+        input_budget=None, max_records=None, record_id='id', response_id=
+        'dataset_id', headroom=None, max_splits=None):
+        self.name = name
+        self.output_budget = output_budget
+        self.output_tokens_per_record = float(output_tokens_per_record)
+        self.input_budget = input_budget
+        self.max_records = max_records
+        self.record_id = record_id
+        self.response_id = response_id
+        self.headroom = BATCH_HEADROOM if headroom is None else headroom
+        self.max_splits = (BATCH_MAX_SPLITS if max_splits is None else
+            max_splits)
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'records_submitted': 0,
+            'records_returned': 0, 'truncated_calls': 0,
+            'truncated_records': 0, 'salvaged_records': 0, 'splits': 0,
+            'resubmitted_records': 0, 'unrecovered_records': 0}
+
+    def batch_size(self):
+        with self._lock:
+            per_record = self.output_tokens_per_record
+        size = max(1, int(self.output_budget * self.headroom // per_record))
+        if self.max_records:
+            size = min(size, self.max_records)
+        return size
+
+    def pack(self, records, record_tokens=None, base_tokens=0):
+        """Split `records` into batches within the input and output budgets."""
+        limit = self.batch_size()
+        batches = []
+        current = []
+        current_tokens = base_tokens
+        for record in records:
+            tokens = record_tokens(record) if record_tokens else 0
+            over_budget = (self.input_budget is not None and current_tokens +
+                tokens > self.input_budget)
+            if current and (len(current) >= limit or over_budget):
+                batches.append(current)
+                current = []
+                current_tokens = base_tokens
+            current.append(record)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def run(self, records, call, record_tokens=None, base_tokens=0):
+        """Pack `records`, submit every batch and return all responses."""
+        responses = []
+        batches = self.pack(records, record_tokens, base_tokens)
+        if len(batches) > 1:
+            logger.info(
+                f'{self.name}: packed {len(records)} records into {len(batches)} calls'
+                )
+        for batch in batches:
+            responses.extend(self.submit(batch, call))
+        return responses
+
+    def submit(self, records, call, depth=0):
+        responses, truncated, output_tokens = call(records)
+        responses = list(responses or [])
+        ids = {record[self.record_id] for record in records}
+        returned = {response.get(self.response_id) for response in
+            responses if isinstance(response, dict)} & ids
+        missing = [record for record in records if record[self.record_id] not in
+            returned]
+        self._record_call(len(records), len(returned), truncated,
+            output_tokens)
+        if not missing:
+            return responses
+        if len(records) == 1 or not (truncated or returned
+            ) or depth >= self.max_splits:
+            with self._lock:
+                self._stats['unrecovered_records'] += len(missing)
+            return responses
+        middle = (len(missing) + 1) // 2
+        halves = [half for half in (missing[:middle], missing[middle:]) if half
+            ]
+        logger.warning(
+            f"{self.name}: {'truncated' if truncated else 'partial'} response for {len(records)} records, re-sending {len(missing)} in {len(halves)} smaller calls"
+            )
+        with self._lock:
+            self._stats['splits'] += 1
+            self._stats['resubmitted_records'] += len(missing)
+        for half in halves:
+            responses.extend(self.submit(half, call, depth + 1))
+        return responses
+
+    def _record_call(self, submitted, returned, truncated, output_tokens):
+        with self._lock:
+            self._stats['calls'] += 1
+            self._stats['records_submitted'] += submitted
+            self._stats['records_returned'] += returned
+            if truncated:
+                self._stats['truncated_calls'] += 1
+                self._stats['truncated_records'] += submitted
+                self._stats['salvaged_records'] += returned
+            if output_tokens and (returned or truncated):
+                sample = output_tokens / max(returned, 1)
+                self.output_tokens_per_record += ESTIMATE_SMOOTHING * (sample -
+                    self.output_tokens_per_record)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            per_record = self.output_tokens_per_record
+        stats['records_per_call'] = round(stats['records_returned'] / stats[
+            'calls'], 2) if stats['calls'] else 0.0
+        stats['salvage_rate'] = round(stats['salvaged_records'] / stats[
+            'truncated_records'], 3) if stats['truncated_records'] else None
+        stats['output_tokens_per_record'] = round(per_record)
+        stats['batch_size'] = self.batch_size()
+        return stats
@@ -0,0 +1,143 @@
+import argparse
+import json
+import logging
+import os
+import threading
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+    'data')
+EVIDENCE_FILE_PATH = os.path.join(DATA_DIR, 'all_evidence.json')
+INDEX_FILE_PATH = os.path.join(DATA_DIR, 'evidence_index.json')
+INDEX_VERSION = 1
+logger = logging.getLogger(__name__)
+_indexes = {}
+_lock = threading.Lock()
+
+
+class EvidenceIndex:
+    """BIRD question id -> evidence lookup built from all_evidence.json.
+
+    Evidence texts are stored once, in file order and de-duplicated; each
+    question id maps to the positions of its evidence. Looking up several
+    ids returns their combined evidence in file order, which is what the
+    batch prompts used to get from scanning the whole file.
+    """
+
+    def __init__(self, evidence, by_id, source=None):
+        self.evidence = evidence
+        self.by_id = by_id
+        self.source = source or {}
+
+    @classmethod
+    def build(cls, evidence_data, source=None):
+        evidence = []
+        positions = {}
+        by_id = {}
+        for evidence_obj in evidence_data:
+            for evidence_text, question_ids in evidence_obj.items():
+                position = positions.get(evidence_text)
+                if position is None:
+                    position = positions[evidence_text] = len(evidence)
+                    evidence.append(evidence_text)
+                for question_id in question_ids:
+                    entries = by_id.setdefault(str(question_id), [])
+                    if position not in entries:
+                        entries.append(position)
+        for entries in by_id.values():
+            entries.sort()
+        return cls(evidence, by_id, source)
+
+    def lookup(self, bird_id):
+        if bird_id is None:
+            return []
+        return [self.evidence[position] for position in self.by_id.get(str
+            (bird_id), [])]
+
+    def lookup_many(self, bird_ids):
+        positions = set()
+        for bird_id in bird_ids:
+            if bird_id is not None:
+                positions.update(self.by_id.get(str(bird_id), []))
+        return [self.evidence[position] for position in sorted(positions)]
+
+    def to_dict(self):
+        return {'version': INDEX_VERSION, 'source': self.source, 'evidence':
+            self.evidence, 'by_id': self.by_id}
+
+
+def _source_signature(evidence_path):
+    stat = os.stat(evidence_path)
+    return {'path': os.path.basename(evidence_path), 'mtime_ns': stat.
+        st_mtime_ns, 'size': stat.st_size}
+
+
+def build_index_file(evidence_path=EVIDENCE_FILE_PATH, index_path=
+    INDEX_FILE_PATH):
+    with open(evidence_path, 'r') as f:
+        evidence_data = json.load(f)
+    index = EvidenceIndex.build(evidence_data, _source_signature(evidence_path)
+        )
+    temp_path = f'{index_path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(index.to_dict(), f, separators=(',', ':'))
+    os.replace(temp_path, index_path)
+    logger.info(
+        f'Wrote evidence index with {len(index.evidence)} evidence entries for {len(index.by_id)} question ids to {index_path}'
+        )
+    return index
+
+
+def _read_index_file(evidence_path, index_path):
+    try:
+        with open(index_path, 'r') as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if data.get('version') != INDEX_VERSION or data.get('source'
+        ) != _source_signature(evidence_path):
+        logger.info(f'Evidence index {index_path} is stale, rebuilding')
+        return None
+    return EvidenceIndex(data['evidence'], data['by_id'], data['source'])
+
+
+def load_index(evidence_path=EVIDENCE_FILE_PATH, index_path=None):
+    """Load the index artifact, rebuilding it when the evidence file changed.
+
+    The index is kept per process, so callers can call this for every batch.
+    """
+    index_path = index_path or os.path.join(os.path.dirname(evidence_path),
+        os.path.basename(INDEX_FILE_PATH))
+    key = os.path.abspath(evidence_path), os.path.abspath(index_path)
+    with _lock:
+        index = _indexes.get(key)
+        if index is not None and index.source == _source_signature(
+            evidence_path):
+            return index
+        index = _read_index_file(evidence_path, index_path)
+        if index is None:
+            try:
+                index = build_index_file(evidence_path, index_path)
+            except OSError as e:
+                logger.warning(
+                    f'Could not write evidence index {index_path}, keeping it in memory: {str(e)}'
+                    )
+                with open(evidence_path, 'r') as f:
+                    index = EvidenceIndex.build(json.load(f),
+                        _source_signature(evidence_path))
+        _indexes[key] = index
+        return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=
+        'Build the BIRD question id to evidence index artifact')
+    parser.add_argument('--evidence', default=EVIDENCE_FILE_PATH)
+    parser.add_argument('--output', default=INDEX_FILE_PATH)
+    args = parser.parse_args()
+    index = build_index_file(args.evidence, args.output)
+    print(
+        f'Indexed {len(index.evidence)} evidence entries for {len(index.by_id)} question ids -> {args.output}'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+import bisect
+import json
+import logging
+import re
+WILDCARD = '*'
+STRING_SPECIAL = re.compile('["\\\\]')
+logger = logging.getLogger(__name__)
+
+
+def _matches(pattern, path):
+    return len(pattern) == len(path) and all(part == WILDCARD or part ==
+        step for part, step in zip(pattern, path))
+
+
+class JsonStreamParser:
+    """Incremental JSON scanner for streamed model output.
+
+    Feed it chunks as they arrive; `feed` returns (path, value) for every
+    object or array at one of the watched `paths` that closed inside the
+    chunk. A path is a tuple of object keys and array indexes, where '*'
+    matches any key or index: ('*',) is each element of a top-level array,
+    ('refinement_questions', '*') each element of that array. Chunks are
+    kept in a list and joined once by `text()`, and each element is parsed
+    once when it closes, so the work stays linear in the response size.
+    """
+
+    def __init__(self, *paths):
+        self.paths = [tuple(path) for path in paths]
+        self.complete = False
+        self.elements = []
+        self._parts = []
+        self._part_offsets = []
+        self._offset = 0
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+        self._key_start = None
+
+    def text(self):
+        return ''.join(self._parts)
+
+    def _slice(self, start, end):
+        first = bisect.bisect_right(self._part_offsets, start) - 1
+        last = bisect.bisect_right(self._part_offsets, end - 1) - 1
+        text = ''.join(self._parts[first:last + 1])
+        base = self._part_offsets[first]
+        return text[start - base:end - base]
+
+    def _child_path(self):
+        if not self._stack:
+            return ()
+        frame = self._stack[-1]
+        if frame['kind'] == '[':
+            return frame['path'] + (frame['index'],)
+        return frame['path'] + (frame['key'],)
+
+    def feed(self, chunk):
+        if not chunk:
+            return []
+        self._parts.append(chunk)
+        self._part_offsets.append(self._offset)
+        base = self._offset
+        self._offset += len(chunk)
+        emitted = []
+        position = 0
+        length = len(chunk)
+        while position < length:
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                    position += 1
+                    continue
+                match = STRING_SPECIAL.search(chunk, position)
+                if match is None:
+                    break
+                position = match.start()
+                if chunk[position] == '\\':
+                    self._escaped = True
+                else:
+                    self._in_string = False
+                    if self._key_start is not None:
+                        frame = self._stack[-1]
+                        frame['key'] = json.loads(self._slice(self.
+                            _key_start, base + position + 1))
+                        self._key_start = None
+                position += 1
+                continue
+            char = chunk[position]
+            frame = self._stack[-1] if self._stack else None
+            if char == '"':
+                self._in_string = True
+                if frame is not None and frame['kind'] == '{' and frame[
+                    'expect_key']:
+                    frame['expect_key'] = False
+                    self._key_start = base + position
+            elif char in '{[':
+                path = self._child_path()
+                watched = any(_matches(pattern, path) for pattern in self.
+                    paths)
+                self._stack.append({'kind': char, 'path': path, 'index': 0,
+                    'key': None, 'expect_key': char == '{', 'start': base +
+                    position if watched else None})
+            elif char in '}]' and frame is not None:
+                self._stack.pop()
+                if frame['start'] is not None:
+                    try:
+                        value = json.loads(self._slice(frame['start'], base +
+                            position + 1))
+                    except ValueError as e:
+                        logger.warning(
+                            f"Could not parse streamed element at {frame['path']}: {str(e)}"
+                            )
+                    else:
+                        self.elements.append((frame['path'], value))
+                        emitted.append((frame['path'], value))
+                if not self._stack:
+                    self.complete = True
+            elif char == ',' and frame is not None:
+                if frame['kind'] == '[':
+                    frame['index'] += 1
+                else:
+                    frame['expect_key'] = True
+            position += 1
+        return emitted
+
+    def values(self, path=None):
+        """Values of every element emitted so far (optionally at `path`)."""
+        return [value for element_path, value in self.elements if path is
+            None or _matches(path, element_path)]
+
+    def finish(self):
+        """Parse the whole response; None if it is not complete JSON."""
+        try:
+            return json.loads(self.text())
+        except ValueError:
+            return None
+
+
+def parse_chunks(chunks, *paths, on_element=None):
+    """Run `chunks` through a parser, calling on_element(path, value)."""
+    parser = JsonStreamParser(*paths)
+    for chunk in chunks:
+        for path, value in parser.feed(chunk):
+            if on_element is not None:
+                on_element(path, value)
+    return parser
@@ -0,0 +1,220 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+CACHE_PATH = os.environ.get('LLM_CACHE_PATH', os.path.join(REPO_ROOT,
+    '.cache', 'llm_responses.db'))
+CACHE_MODE = os.environ.get('LLM_CACHE_MODE', 'on').lower()
+TTL_SECONDS = float(os.environ.get('LLM_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+MAX_BYTES = int(os.environ.get('LLM_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+EVICT_TO_FRACTION = 0.9
+EVICT_EVERY_PUTS = int(os.environ.get('LLM_CACHE_EVICT_EVERY', 100))
+KEY_VERSION = 1
+logger = logging.getLogger(__name__)
+_local = threading.local()
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'skipped_stores': 0,
+    'expired': 0, 'evictions': 0, 'bypassed': 0, 'errors': 0}
+_since_evict = {'puts': 0, 'bytes': 0}
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def _normalize(value):
+    """JSON-friendly form of SDK config objects, used only for hashing."""
+    if hasattr(value, 'model_dump'):
+        return _normalize(value.model_dump(mode='json', exclude_none=True))
+    if isinstance(value, dict):
+        return {str(key): _normalize(item) for key, item in value.items() if
+            item is not None}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return repr(value)
+
+
+def make_key(model, config, prompt, response_schema=None):
+    """Content address of one model call.
+
+    `config` is the generation config (a google.genai GenerateContentConfig
+    or the keyword arguments sent to Anthropic); any response schema inside
+    it is part of the key as well.
+    """
+    payload = json.dumps({'version': KEY_VERSION, 'model': model, 'config':
+        _normalize(config), 'response_schema': _normalize(response_schema),
+        'prompt': prompt}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def is_json(text):
+    try:
+        json.loads(text)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def _connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'path', None) != CACHE_PATH:
+        cache_dir = os.path.dirname(CACHE_PATH)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        conn = sqlite3.connect(CACHE_PATH, timeout=10.0, isolation_level=
+            None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+            """
+            )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS llm_responses_last_access ON llm_responses (last_access)'
+            )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS llm_responses_created ON llm_responses (created)'
+            )
+        _local.conn = conn
+        _local.path = CACHE_PATH
+    return conn
+
+
+def get(key, bypass=False):
+    """Cached response text for `key`, or None on a miss or when bypassed."""
+    if CACHE_MODE == 'off':
+        return None
+    if bypass or CACHE_MODE == 'refresh':
+        _count('bypassed')
+        return None
+    try:
+        conn = _connection()
+        row = conn.execute(
+            'SELECT response, created FROM llm_responses WHERE key = ?', (
+            key,)).fetchone()
+        now = time.time()
+        if row and TTL_SECONDS > 0 and now - row[1] > TTL_SECONDS:
+            conn.execute('DELETE FROM llm_responses WHERE key = ?', (key,))
+            _count('expired')
+            row = None
+        if row is None:
+            _count('misses')
+            return None
+        conn.execute(
+            'UPDATE llm_responses SET last_access = ?, hits = hits + 1 WHERE key = ?'
+            , (now, key))
+        _count('hits')
+        logger.info(f'LLM cache hit {key[:12]} ({len(row[0])} chars)')
+        return row[0]
+    except sqlite3.Error as e:
+        _count('errors')
+        logger.warning(f'LLM cache read failed: {str(e)}')
+        return None
+
+
+def put(key, response_text, model=None, validate=None):
+    """Store a response; empty or invalid responses are never cached."""
+    if CACHE_MODE == 'off':
+        return False
+    if not response_text or validate is not None and not validate(
+        response_text):
+        _count('skipped_stores')
+        return False
+    try:
+        conn = _connection()
+        now = time.time()
+        size = len(response_text.encode('utf-8'))
+        conn.execute(
+            'INSERT OR REPLACE INTO llm_responses (key, model, response, size, created, last_access, hits) VALUES (?, ?, ?, ?, ?, ?, 0)'
+            , (key, model, response_text, size, now, now))
+        _count('stores')
+        if _eviction_due(size):
+            _evict(conn)
+        return True
+    except sqlite3.Error as e:
+        _count('errors')
+        logger.warning(f'LLM cache write failed: {str(e)}')
+        return False
+
+
+def discard(key):
+    try:
+        _connection().execute('DELETE FROM llm_responses WHERE key = ?', (key,)
+            )
+    except sqlite3.Error as e:
+        _count('errors')
+        logger.warning(f'LLM cache delete failed: {str(e)}')
+
+
+def _eviction_due(size):
+    """True every EVICT_EVERY_PUTS stores, or sooner once this process has
+    written the eviction headroom (10% of MAX_BYTES) since the last sweep.
+
+    Other processes write to the same file, so the total is only known
+    from the sweep itself; this just keeps it off the path of every put.
+    """
+    with _stats_lock:
+        _since_evict['puts'] += 1
+        _since_evict['bytes'] += size
+        if _since_evict['puts'] < EVICT_EVERY_PUTS and _since_evict['bytes'
+            ] < MAX_BYTES * (1 - EVICT_TO_FRACTION):
+            return False
+        _since_evict.update(puts=0, bytes=0)
+        return True
+
+
+def _evict(conn):
+    if TTL_SECONDS > 0:
+        expired = conn.execute('DELETE FROM llm_responses WHERE created < ?',
+            (time.time() - TTL_SECONDS,)).rowcount
+        if expired:
+            _count('expired', expired)
+    total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM llm_responses'
+        ).fetchone()[0]
+    if total <= MAX_BYTES:
+        return
+    target = MAX_BYTES * EVICT_TO_FRACTION
+    evicted = 0
+    for key, size in conn.execute(
+        'SELECT key, size FROM llm_responses ORDER BY last_access ASC'
+        ).fetchall():
+        if total <= target:
+            break
+        conn.execute('DELETE FROM llm_responses WHERE key = ?', (key,))
+        total -= size
+        evicted += 1
+    _count('evictions', evicted)
+    logger.info(f'LLM cache evicted {evicted} entries to stay under {MAX_BYTES} bytes')
+
+
+def get_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    stats.update({'mode': CACHE_MODE, 'path': os.path.abspath(CACHE_PATH),
+        'ttl_seconds': TTL_SECONDS, 'max_bytes': MAX_BYTES})
+    try:
+        entries, total_bytes = _connection().execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_responses'
+            ).fetchone()
+        stats.update({'entries': entries, 'bytes': total_bytes})
+    except sqlite3.Error as e:
+        stats['storage_error'] = str(e)
+    return stats
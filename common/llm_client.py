@@ -0,0 +1,503 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from common import llm_cache
+from common import llm_fake
+DEADLINE_SECONDS = float(os.environ.get('LLM_DEADLINE_SECONDS', 900))
+INTERACTIVE_DEADLINE_SECONDS = float(os.environ.get(
+    'LLM_INTERACTIVE_DEADLINE_SECONDS', 120))
+ATTEMPT_TIMEOUT_SECONDS = float(os.environ.get('LLM_ATTEMPT_TIMEOUT_SECONDS',
+    0))
+MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 3))
+BACKOFF_BASE_SECONDS = float(os.environ.get('LLM_BACKOFF_BASE_SECONDS', 1.0))
+BACKOFF_MAX_SECONDS = float(os.environ.get('LLM_BACKOFF_MAX_SECONDS', 30.0))
+HEDGE_ENABLED = os.environ.get('LLM_HEDGE', '0').lower() in ('1', 'true',
+    'yes')
+HEDGE_PERCENTILE = float(os.environ.get('LLM_HEDGE_PERCENTILE', 95))
+HEDGE_MIN_SAMPLES = int(os.environ.get('LLM_HEDGE_MIN_SAMPLES', 20))
+MODEL_CONCURRENCY = int(os.environ.get('LLM_MODEL_CONCURRENCY', 8))
+MODEL_LIMITS = os.environ.get('LLM_MODEL_LIMITS', '')
+LATENCY_WINDOW = 200
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+SAFETY_CATEGORIES = ['HARM_CATEGORY_HATE_SPEECH',
+    'HARM_CATEGORY_DANGEROUS_CONTENT', 'HARM_CATEGORY_SEXUALLY_EXPLICIT',
+    'HARM_CATEGORY_HARASSMENT']
+logger = logging.getLogger(__name__)
+_lock = threading.Lock()
+_semaphores = {}
+_latencies = {}
+_stats = {}
+_hooks = []
+
+
+class LLMError(Exception):
+    pass
+
+
+class LLMTimeoutError(LLMError, TimeoutError):
+    pass
+
+
+class AttemptCancelled(LLMError):
+    pass
+
+
+class StreamInterrupted(LLMError):
+    """The call failed after part of its output was handed to the caller."""
+
+
+def _model_limits():
+    limits = {}
+    for item in MODEL_LIMITS.split(','):
+        name, _, value = item.partition('=')
+        if name.strip() and value.strip():
+            limits[name.strip()] = int(value)
+    return limits
+
+
+def _semaphore(model):
+    with _lock:
+        semaphore = _semaphores.get(model)
+        if semaphore is None:
+            limit = _model_limits().get(model, MODEL_CONCURRENCY)
+            semaphore = _semaphores[model] = threading.BoundedSemaphore(max
+                (1, limit))
+        return semaphore
+
+
+def _model_stats(model):
+    stats = _stats.get(model)
+    if stats is None:
+        stats = _stats[model] = {'calls': 0, 'succeeded': 0, 'failed': 0,
+            'cache_hits': 0, 'attempts': 0, 'retries': 0, 'timeouts': 0,
+            'hedges': 0, 'hedge_wins': 0, 'input_tokens': 0,
+            'output_tokens': 0}
+    return stats
+
+
+def add_metrics_hook(hook):
+    """Call hook(event) after every model call; see `call` for the fields."""
+    with _lock:
+        _hooks.append(hook)
+
+
+def remove_metrics_hook(hook):
+    with _lock:
+        if hook in _hooks:
+            _hooks.remove(hook)
+
+
+def _percentile(values, percentile):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percentile / 100.0 * (len(
+        ordered) - 1))))
+    return ordered[index]
+
+
+def hedge_delay(model):
+    """Seconds after which a hedged second request is sent, or None."""
+    with _lock:
+        samples = list(_latencies.get(model, ()))
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+    return _percentile(samples, HEDGE_PERCENTILE)
+
+
+def is_retryable(error):
+    if isinstance(error, (StreamInterrupted, AttemptCancelled)):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, 'code', None) or getattr(error, 'status_code',
+        None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS
+    name = type(error).__name__
+    return any(marker in name for marker in ('Timeout', 'Connection',
+        'Overloaded', 'RateLimit', 'ServerError', 'Unavailable'))
+
+
+def backoff_seconds(retry):
+    """Full-jitter exponential backoff for the `retry`-th retry (from 0)."""
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS *
+        2 ** retry))
+
+
+def _start_attempt(model, attempt, semaphore, cancel, timeout):
+    future = Future()
+    future.set_running_or_notify_cancel()
+
+    def run():
+        started_at = time.monotonic()
+        try:
+            result = attempt(cancel, timeout)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            with _lock:
+                _latencies.setdefault(model, deque(maxlen=LATENCY_WINDOW)
+                    ).append(time.monotonic() - started_at)
+            future.set_result(result)
+        finally:
+            semaphore.release()
+    threading.Thread(target=run, name=f'llm-{model}', daemon=True).start()
+    return future
+
+
+def _run_attempt(model, attempt, deadline_at, hedge, event, delivered=None):
+    """One attempt (plus an optional hedge) bounded by the deadline.
+
+    When `delivered` is set the attempt has already handed output to the
+    caller, so running out of time raises StreamInterrupted instead of a
+    retryable LLMTimeoutError.
+    """
+    semaphore = _semaphore(model)
+    remaining = deadline_at - time.monotonic()
+    if remaining <= 0 or not semaphore.acquire(timeout=remaining):
+        raise LLMTimeoutError(f'No {model} slot free before the deadline')
+    timeout = deadline_at - time.monotonic()
+    if ATTEMPT_TIMEOUT_SECONDS:
+        timeout = min(timeout, ATTEMPT_TIMEOUT_SECONDS)
+    cancels = [threading.Event()]
+    futures = [_start_attempt(model, attempt, semaphore, cancels[0],
+        timeout)]
+    delay = hedge_delay(model) if hedge else None
+    started_at = time.monotonic()
+    try:
+        if delay is not None and delay < timeout:
+            done, _ = wait(futures, timeout=delay)
+            if not done and semaphore.acquire(blocking=False):
+                logger.info(
+                    f'{model} call still running after {delay:.1f}s; sending a hedged request'
+                    )
+                event['hedged'] = True
+                cancels.append(threading.Event())
+                futures.append(_start_attempt(model, attempt, semaphore,
+                    cancels[1], timeout - delay))
+        pending = list(futures)
+        while pending:
+            remaining = timeout - (time.monotonic() - started_at)
+            done, _ = wait(pending, timeout=max(remaining, 0),
+                return_when=FIRST_COMPLETED)
+            if not done:
+                for cancel in cancels:
+                    cancel.set()
+                if delivered is not None and delivered.is_set():
+                    raise StreamInterrupted(
+                        f'{model} stream did not finish within {timeout:.1f}s after output was delivered'
+                        )
+                raise LLMTimeoutError(
+                    f'{model} call did not finish within {timeout:.1f}s')
+            for future in done:
+                pending.remove(future)
+                if future.exception() is None:
+                    event['hedge_won'] = futures.index(future) == 1
+                    return future.result()
+                if not pending:
+                    raise future.exception()
+    finally:
+        for cancel in cancels:
+            cancel.set()
+
+
+def call(model, attempt, cache_key=None, validate=None, deadline=None,
+    max_retries=None, hedge=None, label=None, details=False, delivered=None):
+    """Run `attempt(cancel, timeout) -> (text, usage)` under the client policy.
+
+    A cached response for `cache_key` is returned straight away. Otherwise
+    the attempt runs on its own thread, holding one of the model's
+    LLM_MODEL_CONCURRENCY slots, and the caller waits at most `deadline`
+    seconds in total. Retryable failures (timeouts, connection errors,
+    429/5xx) are retried up to `max_retries` times with full-jitter
+    exponential backoff. With `hedge`, a second request is sent once the
+    first has run longer than the model's recent p95 latency and the
+    first to finish wins. `cancel` is set when the caller stops waiting;
+    streaming attempts check it between chunks, and set `delivered` (a
+    threading.Event) once a chunk has reached the caller, after which a
+    timeout is not retried either. Each call reports an event
+    (model, label, ok, cached, attempts, hedged, hedge_won,
+    latency_seconds, input_tokens, output_tokens, error) to the metrics
+    hooks. Returns the text, or (text, usage) with `details`; usage is the
+    winning attempt's dict and is empty for cached responses. While
+    LLM_FAKE_MODE=replay the response cache is left alone, so every call
+    goes through the replayed latency; while recording, cache hits are
+    recorded too (without a latency).
+    """
+    deadline = DEADLINE_SECONDS if deadline is None else deadline
+    max_retries = MAX_RETRIES if max_retries is None else max_retries
+    hedge = HEDGE_ENABLED if hedge is None else hedge
+    started_at = time.monotonic()
+    deadline_at = started_at + deadline
+    event = {'model': model, 'label': label, 'ok': False, 'cached': False,
+        'attempts': 0, 'hedged': False, 'hedge_won': False,
+        'latency_seconds': 0.0, 'input_tokens': None, 'output_tokens':
+        None, 'error': None}
+    try:
+        if cache_key is not None and not llm_fake.replaying():
+            text = llm_cache.get(cache_key)
+            if text is not None:
+                event.update(ok=True, cached=True)
+                if llm_fake.recording():
+                    llm_fake.record(cache_key, model, label, None, text)
+                return (text, {}) if details else text
+        retry = 0
+        while True:
+            event['attempts'] += 1
+            try:
+                text, usage = _run_attempt(model, attempt, deadline_at,
+                    hedge, event, delivered)
+                break
+            except Exception as e:
+                remaining = deadline_at - time.monotonic()
+                if retry >= max_retries or not is_retryable(e
+                    ) or remaining <= 0:
+                    raise
+                pause = min(backoff_seconds(retry), remaining)
+                logger.warning(
+                    f'{label or model} attempt {retry + 1} failed ({type(e).__name__}: {str(e)}); retrying in {pause:.1f}s'
+                    )
+                retry += 1
+                time.sleep(pause)
+        usage = usage or {}
+        event.update(ok=True, input_tokens=usage.get('input_tokens'),
+            output_tokens=usage.get('output_tokens'))
+        if cache_key is not None and not llm_fake.replaying():
+            llm_cache.put(cache_key, text, model, validate)
+        return (text, usage) if details else text
+    except Exception as e:
+        event['error'] = f'{type(e).__name__}: {str(e)}'
+        raise
+    finally:
+        event['latency_seconds'] = round(time.monotonic() - started_at, 3)
+        _record(event)
+
+
+def _record(event):
+    with _lock:
+        stats = _model_stats(event['model'])
+        stats['calls'] += 1
+        stats['succeeded' if event['ok'] else 'failed'] += 1
+        stats['cache_hits'] += event['cached']
+        stats['attempts'] += event['attempts']
+        stats['retries'] += max(event['attempts'] - 1, 0)
+        stats['timeouts'] += bool(event['error'] and event['error'].
+            startswith('LLMTimeoutError'))
+        stats['hedges'] += event['hedged']
+        stats['hedge_wins'] += event['hedge_won']
+        stats['input_tokens'] += event['input_tokens'] or 0
+        stats['output_tokens'] += event['output_tokens'] or 0
+        hooks = list(_hooks)
+    for hook in hooks:
+        try:
+            hook(dict(event))
+        except Exception as e:
+            logger.error(f'LLM metrics hook failed: {str(e)}')
+
+
+def get_stats():
+    with _lock:
+        stats = {model: dict(values) for model, values in _stats.items()}
+        latencies = {model: list(values) for model, values in _latencies.
+            items()}
+    for model, values in stats.items():
+        samples = latencies.get(model)
+        if samples:
+            values['latency_p50_seconds'] = round(_percentile(samples, 50), 3)
+            values['latency_p95_seconds'] = round(_percentile(samples, 95), 3)
+    return {'models': stats, 'deadline_seconds': DEADLINE_SECONDS,
+        'max_retries': MAX_RETRIES, 'hedge_enabled': HEDGE_ENABLED,
+        'fake_backend': llm_fake.get_stats()}
+
+
+def _with_fake_backend(attempt, model, key, prompt, label, on_text=None):
+    """`attempt`, recorded or replaced by a replay under LLM_FAKE_MODE."""
+    if llm_fake.replaying():
+
+        def replayed(cancel, timeout):
+            result = llm_fake.replay(key, model, label, cancel, on_text)
+            if result is None:
+                raise AttemptCancelled(f'{model} replay abandoned')
+            return result
+        return replayed
+    if llm_fake.recording():
+
+        def recorded(cancel, timeout):
+            started_at = time.monotonic()
+            text, usage = attempt(cancel, timeout)
+            llm_fake.record(key, model, label, prompt, text, usage, time.
+                monotonic() - started_at)
+            return text, usage
+        return recorded
+    return attempt
+
+
+def flash_config(response_schema=None, max_output_tokens=8192, temperature
+    =0, top_p=0.95):
+    """GenerateContentConfig used by every Flash call (JSON, safety off)."""
+    from google.genai import types
+    return types.GenerateContentConfig(temperature=temperature, top_p=top_p,
+        max_output_tokens=max_output_tokens, response_modalities=['TEXT'],
+        safety_settings=[types.SafetySetting(category=category, threshold=
+        'OFF') for category in SAFETY_CATEGORIES], response_mime_type=
+        'application/json', response_schema=response_schema)
+
+
+def _with_timeout(config, timeout):
+    """Copy of `config` whose HTTP request gives up after `timeout` seconds.
+
+    Without it a non-streaming call that outlives its attempt keeps running
+    on the abandoned attempt thread, holding the model's slot.
+    """
+    from google.genai import types
+    config = config or types.GenerateContentConfig()
+    milliseconds = max(1, int(timeout * 1000))
+    http_options = config.http_options.model_copy(update={'timeout':
+        milliseconds}) if config.http_options else types.HttpOptions(timeout
+        =milliseconds)
+    return config.model_copy(update={'http_options': http_options})
+
+
+def _flash_usage(metadata):
+    if metadata is None:
+        return {}
+    return {'input_tokens': getattr(metadata, 'prompt_token_count', None),
+        'output_tokens': getattr(metadata, 'candidates_token_count', None)}
+
+
+def generate_flash(client, model, prompt, config, deadline=None, stream=
+    True, on_text=None, hedge=None, validate=llm_cache.is_json, label=None):
+    """Text of one Gemini call, through the cache and the client policy.
+
+    `on_text(chunk)` receives streamed chunks as they arrive. Once a chunk
+    has been handed over the call is no longer retried or hedged, so the
+    caller never sees the same output twice; on a cache hit nothing is
+    streamed and the caller should use the returned text. Each request
+    carries the attempt's remaining time as its HTTP timeout. Under
+    LLM_FAKE_MODE the call is recorded to, or replayed from, llm_fake.
+    """
+    from google.genai import types
+    contents = [types.Content(role='user', parts=[types.Part.from_text(
+        text=prompt)])]
+    delivered = threading.Event()
+
+    def deliver(chunk):
+        delivered.set()
+        on_text(chunk)
+    emit = deliver if on_text is not None else None
+
+    def attempt(cancel, timeout):
+        attempt_config = _with_timeout(config, timeout)
+        if not stream:
+            response = client.models.generate_content(model=model,
+                contents=contents, config=attempt_config)
+            return response.text or '', _flash_usage(getattr(response,
+                'usage_metadata', None))
+        parts = []
+        metadata = None
+        started_at = time.monotonic()
+        first_chunk_seconds = None
+        try:
+            for chunk in client.models.generate_content_stream(model=model,
+                contents=contents, config=attempt_config):
+                if cancel.is_set():
+                    raise AttemptCancelled(f'{model} attempt abandoned')
+                metadata = getattr(chunk, 'usage_metadata', None) or metadata
+                if chunk.text:
+                    if first_chunk_seconds is None:
+                        first_chunk_seconds = time.monotonic() - started_at
+                    parts.append(chunk.text)
+                    if emit is not None:
+                        emit(chunk.text)
+        except LLMError:
+            raise
+        except Exception as e:
+            if delivered.is_set():
+                raise StreamInterrupted(str(e)) from e
+            raise
+        usage = _flash_usage(metadata)
+        usage.update(chunk_sizes=[len(part) for part in parts],
+            first_chunk_seconds=first_chunk_seconds)
+        return ''.join(parts), usage
+    key = llm_cache.make_key(model, config, prompt)
+    return call(model, _with_fake_backend(attempt, model, key, prompt,
+        label, emit), key, validate, deadline, hedge=False if on_text is not
+        None else hedge, label=label, delivered=delivered)
+
+
+def generate_claude(client, model, prompt, config, deadline=None, hedge=
+    None, label=None):
+    """(text, thinking) of one streamed Anthropic call.
+
+    `config` holds the keyword arguments for `beta.messages.stream`. The
+    thinking text is not cached, so it is empty on a cache hit; a replay
+    returns the recorded thinking.
+    """
+
+    def attempt(cancel, timeout):
+        text_parts = []
+        thinking_parts = []
+        usage = {}
+        started_at = time.monotonic()
+        with client.beta.messages.stream(model=model, messages=[{'role':
+            'user', 'content': prompt}], timeout=timeout, **config) as stream:
+            for event in stream:
+                if cancel.is_set():
+                    raise AttemptCancelled(f'{model} attempt abandoned')
+                if event.type == 'content_block_delta':
+                    if event.delta.type == 'thinking_delta':
+                        thinking_parts.append(event.delta.thinking)
+                    elif event.delta.type == 'text_delta':
+                        if not text_parts:
+                            usage['first_chunk_seconds'
+                                ] = time.monotonic() - started_at
+                        text_parts.append(event.delta.text)
+                elif event.type == 'content_block_stop':
+                    logger.info('Content block complete')
+                elif event.type == 'message_start':
+                    usage['input_tokens'] = getattr(event.message.usage,
+                        'input_tokens', None)
+                elif event.type == 'message_delta':
+                    usage['output_tokens'] = getattr(event.usage,
+                        'output_tokens', None)
+        usage['thinking'] = ''.join(thinking_parts)
+        usage['chunk_sizes'] = [len(part) for part in text_parts]
+        return ''.join(text_parts), usage
+    key = llm_cache.make_key(model, config, prompt)
+    text, usage = call(model, _with_fake_backend(attempt, model, key,
+        prompt, label), key, deadline=deadline, hedge=hedge, label=label,
+        details=True)
+    return text, usage.get('thinking', '')
+
+
+def parse_json(text):
+    """JSON value in a model response, or None.
+
+    Tries the whole text, then a ```json fenced block, then any fenced
+    block, then the outermost [...] and {...} spans.
+    """
+    if not text:
+        return None
+    candidates = [text]
+    for fence in ('```json', '```'):
+        start = text.find(fence)
+        if start != -1:
+            start += len(fence)
+            end = text.find('```', start)
+            if end != -1:
+                candidates.append(text[start:end])
+    for opener, closer in (('[', ']'), ('{', '}')):
+        start = text.find(opener)
+        end = text.rfind(closer)
+        if start != -1 and end > start:
+            candidates.append(text[start:end + 1])
+    for candidate in candidates:
+        try:
+            return json.loads(candidate.strip())
+        except ValueError:
+            continue
+    return None
@@ -0,0 +1,281 @@
+import json
+import logging
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+MODE = os.environ.get('LLM_FAKE_MODE', 'off').lower()
+STORE_PATH = os.environ.get('LLM_FAKE_PATH', os.path.join(REPO_ROOT,
+    '.cache', 'llm_recordings.db'))
+ON_MISS = os.environ.get('LLM_FAKE_ON_MISS', 'error').lower()
+LATENCY = os.environ.get('LLM_FAKE_LATENCY', 'recorded')
+MODEL_LATENCY = os.environ.get('LLM_FAKE_MODEL_LATENCY', '')
+LATENCY_SCALE = float(os.environ.get('LLM_FAKE_LATENCY_SCALE', 1.0))
+DEFAULT_LATENCY_SECONDS = float(os.environ.get(
+    'LLM_FAKE_DEFAULT_LATENCY_SECONDS', 1.0))
+FIRST_CHUNK_FRACTION = float(os.environ.get('LLM_FAKE_FIRST_CHUNK_FRACTION',
+    0.3))
+CHUNK_CHARS = int(os.environ.get('LLM_FAKE_CHUNK_CHARS', 0))
+DEFAULT_CHUNK_CHARS = 256
+ERROR_RATE = float(os.environ.get('LLM_FAKE_ERROR_RATE', 0))
+SEED = os.environ.get('LLM_FAKE_SEED', '0')
+logger = logging.getLogger(__name__)
+_local = threading.local()
+_lock = threading.Lock()
+_replays = {}
+_stats = {'recorded': 0, 'replayed': 0, 'fallbacks': 0, 'misses': 0,
+    'injected_errors': 0, 'errors': 0}
+
+
+class ReplayMiss(LookupError):
+    """No recording matches the call and LLM_FAKE_ON_MISS is 'error'."""
+
+
+class InjectedServerError(Exception):
+    """Synthetic 503 raised at LLM_FAKE_ERROR_RATE to exercise retries."""
+    code = 503
+
+
+def recording():
+    return MODE == 'record'
+
+
+def replaying():
+    return MODE == 'replay'
+
+
+def _count(name, amount=1):
+    with _lock:
+        _stats[name] += amount
+
+
+def _connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'path', None) != STORE_PATH:
+        store_dir = os.path.dirname(STORE_PATH)
+        if store_dir:
+            os.makedirs(store_dir, exist_ok=True)
+        conn = sqlite3.connect(STORE_PATH, timeout=10.0, isolation_level=
+            None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_recordings (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                label TEXT,
+                prompt_chars INTEGER,
+                response TEXT NOT NULL,
+                usage TEXT,
+                latency_seconds REAL,
+                first_chunk_seconds REAL,
+                chunk_sizes TEXT,
+                recorded REAL NOT NULL
+            )
+            """
+            )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS llm_recordings_label ON llm_recordings (label, model)'
+            )
+        _local.conn = conn
+        _local.path = STORE_PATH
+    return conn
+
+
+def record(key, model, label, prompt, text, usage=None, latency_seconds=None
+    ):
+    """Store one response under its prompt fingerprint `key`.
+
+    `usage` may carry 'chunk_sizes' and 'first_chunk_seconds' from a
+    streamed call; they shape the replayed stream. `latency_seconds` is
+    None for responses taken from the response cache.
+    """
+    usage = dict(usage or {})
+    chunk_sizes = usage.pop('chunk_sizes', None)
+    first_chunk_seconds = usage.pop('first_chunk_seconds', None)
+    try:
+        _connection().execute(
+            'INSERT OR REPLACE INTO llm_recordings (key, model, label, prompt_chars, response, usage, latency_seconds, first_chunk_seconds, chunk_sizes, recorded) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+            , (key, model, label, None if prompt is None else len(prompt),
+            text, json.dumps(usage), latency_seconds, first_chunk_seconds,
+            json.dumps(chunk_sizes) if chunk_sizes else None, time.time()))
+        _count('recorded')
+        return True
+    except sqlite3.Error as e:
+        _count('errors')
+        logger.warning(f'LLM recording write failed: {str(e)}')
+        return False
+
+
+def _row_to_recording(row):
+    return {'key': row[0], 'model': row[1], 'label': row[2], 'response':
+        row[3], 'usage': json.loads(row[4]) if row[4] else {},
+        'latency_seconds': row[5], 'first_chunk_seconds': row[6],
+        'chunk_sizes': json.loads(row[7]) if row[7] else None}
+
+
+def lookup(key, model=None, label=None):
+    """Recording for `key`; with LLM_FAKE_ON_MISS=label, one for the label.
+
+    The fallback picks among recordings with the same label (or, failing
+    that, the same model) by the fingerprint, so a given prompt always
+    gets the same stand-in response.
+    """
+    columns = (
+        'key, model, label, response, usage, latency_seconds, first_chunk_seconds, chunk_sizes'
+        )
+    conn = _connection()
+    row = conn.execute(f'SELECT {columns} FROM llm_recordings WHERE key = ?',
+        (key,)).fetchone()
+    if row is not None:
+        return _row_to_recording(row)
+    if ON_MISS != 'label':
+        return None
+    for column, value in (('label', label), ('model', model)):
+        if value is None:
+            continue
+        keys = [found for found, in conn.execute(
+            f'SELECT key FROM llm_recordings WHERE {column} = ? ORDER BY key',
+            (value,))]
+        if keys:
+            chosen = keys[int(key[:12], 16) % len(keys)]
+            _count('fallbacks')
+            return _row_to_recording(conn.execute(
+                f'SELECT {columns} FROM llm_recordings WHERE key = ?', (
+                chosen,)).fetchone())
+    return None
+
+
+def parse_latency(spec):
+    """Sampler for a latency spec, or None for 'recorded'.
+
+    Specs: 'recorded', 'none', 'fixed:S', 'uniform:LOW,HIGH',
+    'lognormal:MEDIAN,SIGMA' and 'exponential:MEAN' (all in seconds).
+    """
+    kind, _, args = spec.strip().partition(':')
+    kind = kind.lower()
+    values = [float(value) for value in args.split(',') if value.strip()]
+    if kind in ('', 'recorded'):
+        return None
+    if kind == 'none':
+        return lambda rng: 0.0
+    if kind == 'fixed':
+        return lambda rng: values[0]
+    if kind == 'uniform':
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == 'lognormal':
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    if kind == 'exponential':
+        return lambda rng: rng.expovariate(1.0 / values[0])
+    raise ValueError(f'Unknown LLM_FAKE_LATENCY spec: {spec}')
+
+
+def _model_latency():
+    specs = {}
+    for item in MODEL_LATENCY.split(';'):
+        name, _, spec = item.partition('=')
+        if name.strip() and spec.strip():
+            specs[name.strip()] = spec.strip()
+    return specs
+
+
+def _sampler(model):
+    return parse_latency(_model_latency().get(model, LATENCY))
+
+
+def _latency(recording, model, rng):
+    sampler = _sampler(model)
+    if sampler is None:
+        latency = recording['latency_seconds']
+        if latency is None:
+            latency = DEFAULT_LATENCY_SECONDS
+    else:
+        latency = sampler(rng)
+    return max(0.0, latency * LATENCY_SCALE)
+
+
+def _chunks(text, recording):
+    if not text:
+        return []
+    sizes = None if CHUNK_CHARS else recording['chunk_sizes']
+    if not sizes or sum(sizes) != len(text):
+        size = CHUNK_CHARS or DEFAULT_CHUNK_CHARS
+        sizes = [size] * math.ceil(len(text) / size)
+    chunks = []
+    position = 0
+    for size in sizes:
+        chunks.append(text[position:position + size])
+        position += size
+    return [chunk for chunk in chunks if chunk]
+
+
+def replay(key, model, label, cancel, on_text=None):
+    """(text, usage) of a recorded call, paced like a live one.
+
+    The latency comes from the recording or the LLM_FAKE_LATENCY spec;
+    LLM_FAKE_FIRST_CHUNK_FRACTION of it (or the recorded time to first
+    chunk) passes before the first chunk and the rest is spread evenly
+    over the chunks handed to `on_text`. Draws are seeded by LLM_FAKE_SEED,
+    the fingerprint and how often it has been replayed. Returns None when
+    `cancel` is set part way through.
+    """
+    try:
+        recording = lookup(key, model, label)
+    except sqlite3.Error as e:
+        _count('errors')
+        raise ReplayMiss(f'LLM recording store unavailable: {str(e)}'
+            ) from e
+    if recording is None:
+        _count('misses')
+        raise ReplayMiss(
+            f'No recording for {label or model} call {key[:12]} in {STORE_PATH}'
+            )
+    with _lock:
+        replay_number = _replays.get(key, 0)
+        _replays[key] = replay_number + 1
+    rng = random.Random(f'{SEED}:{key}:{replay_number}')
+    latency = _latency(recording, model, rng)
+    if ERROR_RATE and rng.random() < ERROR_RATE:
+        _count('injected_errors')
+        if cancel.wait(latency * FIRST_CHUNK_FRACTION):
+            return None
+        raise InjectedServerError(f'Injected {model} server error')
+    text = recording['response']
+    usage = dict(recording['usage'])
+    chunks = _chunks(text, recording) if on_text is not None else [text]
+    first_chunk = recording['first_chunk_seconds']
+    if _sampler(model) is not None or first_chunk is None or not recording[
+        'latency_seconds']:
+        first_chunk = latency * FIRST_CHUNK_FRACTION
+    else:
+        first_chunk = min(latency, first_chunk * LATENCY_SCALE)
+    if cancel.wait(first_chunk):
+        return None
+    gap = (latency - first_chunk) / max(len(chunks) - 1, 1)
+    for index, chunk in enumerate(chunks):
+        if index and cancel.wait(gap):
+            return None
+        if on_text is not None:
+            on_text(chunk)
+    if len(chunks) < 2 and cancel.wait(latency - first_chunk):
+        return None
+    _count('replayed')
+    return text, usage
+
+
+def get_stats():
+    with _lock:
+        stats = dict(_stats)
+    stats.update({'mode': MODE, 'path': os.path.abspath(STORE_PATH),
+        'on_miss': ON_MISS, 'latency': LATENCY, 'latency_scale':
+        LATENCY_SCALE, 'error_rate': ERROR_RATE})
+    if MODE != 'off':
+        try:
+            stats['recordings'] = _connection().execute(
+                'SELECT COUNT(*) FROM llm_recordings').fetchone()[0]
+        except sqlite3.Error as e:
+            stats['storage_error'] = str(e)
+    return stats
@@ -0,0 +1,125 @@
+import threading
+from collections import deque
+_cached = None
+_lock = threading.Lock()
+
+
+class AhoCorasick:
+    """Multi-pattern substring matcher; one pass over the text per search."""
+
+    def __init__(self, patterns):
+        self.transitions = [{}]
+        self.fail = [0]
+        self.outputs = [[]]
+        for pattern, value in patterns:
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                next_state = self.transitions[state].get(char)
+                if next_state is None:
+                    next_state = len(self.transitions)
+                    self.transitions[state][char] = next_state
+                    self.transitions.append({})
+                    self.fail.append(0)
+                    self.outputs.append([])
+                state = next_state
+            self.outputs[state].append(value)
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.transitions[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.transitions[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.transitions[fallback].get(char, 0)
+                self.outputs[next_state] = self.outputs[next_state
+                    ] + self.outputs[self.fail[next_state]]
+
+    def search(self, text):
+        found = set()
+        state = 0
+        transitions = self.transitions
+        fail = self.fail
+        outputs = self.outputs
+        for char in text:
+            while state and char not in transitions[state]:
+                state = fail[state]
+            state = transitions[state].get(char, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+        return found
+
+
+class SchemaMatcher:
+    """Finds the tables and columns of compact_dataset_stats named in text.
+
+    Aliases are the table name, the table name with underscores read as
+    spaces, and qualified `table.column` names, all matched
+    case-insensitively as substrings. The table -> column_groups layout is
+    precomputed so building the relevant stats only touches matched tables.
+    """
+
+    def __init__(self, stats_data):
+        self.tables = stats_data.get('tables', {})
+        self.table_order = {name: position for position, name in enumerate
+            (self.tables)}
+        patterns = []
+        for table_name in self.tables:
+            lowered = table_name.lower()
+            patterns.append((lowered, ('table', table_name)))
+            spaced = lowered.replace('_', ' ')
+            if spaced != lowered:
+                patterns.append((spaced, ('table', table_name)))
+        self.group_order = list(stats_data.get('column_groups', {}))
+        self.group_columns = {}
+        for group_type, columns in stats_data.get('column_groups', {}).items():
+            for position, column in enumerate(columns):
+                table_name = column.split('.')[0]
+                self.group_columns.setdefault(table_name, {}).setdefault(
+                    group_type, []).append((position, column))
+        column_names = set(stats_data.get('column_samples', {}))
+        for columns in stats_data.get('column_groups', {}).values():
+            column_names.update(columns)
+        for column in column_names:
+            patterns.append((column.lower(), ('column', column)))
+        self.automaton = AhoCorasick(patterns)
+
+    def match(self, *texts):
+        tables = set()
+        columns = set()
+        for text in texts:
+            for kind, name in self.automaton.search((text or '').lower()):
+                if kind == 'table':
+                    tables.add(name)
+                else:
+                    columns.add(name)
+                    table_name = name.split('.')[0]
+                    if table_name in self.tables:
+                        tables.add(table_name)
+        return tables, columns
+
+    def relevant_stats(self, relevant_tables):
+        ordered_tables = sorted((name for name in relevant_tables if name in
+            self.tables), key=self.table_order.get)
+        relevant_stats = {'tables': {name: self.tables[name] for name in
+            ordered_tables}, 'column_groups': {}}
+        for group_type in self.group_order:
+            positioned = []
+            for table_name in ordered_tables:
+                positioned.extend(self.group_columns.get(table_name, {}).get
+                    (group_type, []))
+            if positioned:
+                relevant_stats['column_groups'][group_type] = [column for _,
+                    column in sorted(positioned)]
+        return relevant_stats
+
+
+def get_matcher(stats_data):
+    """Matcher for `stats_data`, rebuilt only when a different dict is passed."""
+    global _cached
+    with _lock:
+        if _cached is None or _cached[0] is not stats_data:
+            _cached = stats_data, SchemaMatcher(stats_data)
+        return _cached[1]
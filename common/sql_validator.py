@@ -0,0 +1,455 @@
+import csv
+import io
+import logging
+import re
+import threading
+logger = logging.getLogger(__name__)
+TOKEN_PATTERN = re.compile(
+    """
+    (?P<comment>--[^\\n]*|/\\*.*?(?:\\*/|$))
+    |(?P<string>'(?:[^']|'')*')
+    |(?P<quoted>"(?:[^"]|"")*"|`(?:[^`]|``)*`|\\[[^\\]]*\\])
+    |(?P<number>\\d+(?:\\.\\d*)?(?:[eE][-+]?\\d+)?|\\.\\d+)
+    |(?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+    |(?P<space>\\s+)
+    |(?P<punct>.)
+    """
+    , re.VERBOSE | re.DOTALL)
+KEYWORDS = {'abort', 'all', 'and', 'as', 'asc', 'between', 'by', 'case',
+    'cast', 'collate', 'cross', 'current', 'current_date', 'current_time',
+    'current_timestamp', 'desc', 'distinct', 'else', 'end', 'escape',
+    'except', 'exists', 'false', 'filter', 'first', 'following', 'from',
+    'full', 'glob', 'group', 'groups', 'having', 'if', 'in', 'indexed',
+    'inner', 'intersect', 'is', 'isnull', 'join', 'last', 'left', 'like',
+    'limit', 'match', 'materialized', 'natural', 'not', 'notnull', 'null',
+    'nulls', 'of', 'offset', 'on', 'or', 'order', 'outer', 'over',
+    'partition', 'preceding', 'range', 'recursive', 'regexp', 'right',
+    'row', 'rowid', 'rows', 'select', 'then', 'ties', 'true',
+    'unbounded', 'union', 'using', 'values', 'when', 'where', 'window',
+    'with', 'without', 'integer', 'int', 'real', 'text', 'numeric',
+    'blob', 'float', 'double', 'varchar', 'char', 'date', 'datetime',
+    'decimal', 'boolean', 'nocase', 'binary', 'rtrim'}
+TABLE_INTRODUCERS = {'from', 'join'}
+SIMPLE_IDENTIFIER = re.compile('[A-Za-z_][A-Za-z0-9_]*')
+_cached = None
+_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {'validated': 0, 'fixed_queries': 0, 'fixes': 0,
+    'unresolved_queries': 0, 'retries_avoided': 0, 'fixed_but_failed': 0}
+
+
+def _tokenize(sql_query):
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(sql_query):
+        kind = match.lastgroup
+        if kind in ('comment', 'space'):
+            continue
+        tokens.append(Token(kind, match.group(), match.start(), match.end()))
+    return tokens
+
+
+def _squash(name):
+    return re.sub('[^0-9a-z]', '', name.lower())
+
+
+def edit_distance(left, right, limit):
+    """Levenshtein distance, or limit + 1 once it is certain to exceed limit."""
+    if abs(len(left) - len(right)) > limit:
+        return limit + 1
+    previous = list(range(len(right) + 1))
+    for row, left_char in enumerate(left, start=1):
+        current = [row]
+        for column, right_char in enumerate(right, start=1):
+            current.append(min(previous[column] + 1, current[column - 1] +
+                1, previous[column - 1] + (left_char != right_char)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class Token:
+    __slots__ = 'kind', 'text', 'start', 'end'
+
+    def __init__(self, kind, text, start, end):
+        self.kind = kind
+        self.text = text
+        self.start = start
+        self.end = end
+
+    @property
+    def lower(self):
+        return self.text.lower()
+
+    @property
+    def is_identifier(self):
+        return (self.kind == 'quoted' or self.kind == 'word' and self.lower
+             not in KEYWORDS)
+
+    @property
+    def name(self):
+        if self.kind != 'quoted':
+            return self.text
+        inner = self.text[1:-1]
+        if self.text[0] in '"`':
+            inner = inner.replace(self.text[0] * 2, self.text[0])
+        return inner
+
+
+class ValidationResult:
+
+    def __init__(self, original_sql, sql, fixes, issues):
+        self.original_sql = original_sql
+        self.sql = sql
+        self.fixes = fixes
+        self.issues = issues
+
+    @property
+    def fixed(self):
+        return bool(self.fixes)
+
+    def to_dict(self):
+        return {'fixes': self.fixes, 'issues': self.issues, 'original_sql':
+            self.original_sql if self.fixed else None}
+
+
+class SqlValidator:
+    """Checks generated SQL against the BIRD schema and repairs obvious slips.
+
+    Tables come from BIRD_table_schema_info.json (plus compact stats
+    tables), columns from each table's schema CSV and the stats samples.
+    Table names after FROM/JOIN and column references, qualified through
+    an alias or table name or unqualified, are resolved case-insensitively.
+    A reference that misses is rewritten when exactly one candidate fits:
+    same name ignoring case, same name ignoring case and punctuation, or
+    the closest name by edit distance. Multi-word column names written
+    without quotes are quoted. Resolution is per statement rather than per
+    subquery, and CTE or derived-table columns are never flagged.
+    """
+
+    def __init__(self, schema_data, stats_data=None):
+        self.tables = {}
+        self.columns = {}
+        for table_name, table_csv in (schema_data or {}).items():
+            self._add_table(table_name)
+            try:
+                for row in csv.DictReader(io.StringIO(table_csv)):
+                    self._add_column(table_name, row.get(
+                        'original_column_name'))
+            except (csv.Error, TypeError):
+                logger.warning(f'Could not parse schema CSV for {table_name}')
+        stats_data = stats_data or {}
+        for table_name in stats_data.get('tables', {}):
+            self._add_table(table_name)
+        column_names = set(stats_data.get('column_samples', {}))
+        for columns in stats_data.get('column_groups', {}).values():
+            column_names.update(columns)
+        for qualified in column_names:
+            table_name, _, column_name = qualified.partition('.')
+            if table_name in self.columns:
+                self._add_column(table_name, column_name)
+        self.spaced = {}
+        for table_name, columns in self.columns.items():
+            for column_name in columns.values():
+                if not SIMPLE_IDENTIFIER.fullmatch(column_name):
+                    self.spaced.setdefault(table_name, []).append(column_name)
+        for names in self.spaced.values():
+            names.sort(key=len, reverse=True)
+
+    def _add_table(self, table_name):
+        self.tables.setdefault(table_name.lower(), table_name)
+        self.columns.setdefault(table_name, {})
+
+    def _add_column(self, table_name, column_name):
+        column_name = (column_name or '').strip()
+        if column_name:
+            self.columns[table_name].setdefault(column_name.lower(),
+                column_name)
+
+    def _closest(self, name, candidates, allow_distance=True):
+        """(canonical, reason) for the single best candidate, else (None, suggestions)."""
+        lowered = name.lower()
+        exact = {candidate for candidate in candidates if candidate.lower() ==
+            lowered}
+        if len(exact) == 1:
+            return exact.pop(), 'case'
+        squashed = _squash(name)
+        loose = {candidate for candidate in candidates if _squash(candidate
+            ) == squashed}
+        if len(loose) == 1 and squashed:
+            return loose.pop(), 'normalized'
+        limit = max(1, len(name) // 5)
+        scored = sorted((edit_distance(lowered, candidate.lower(), limit +
+            2), candidate) for candidate in candidates)
+        best = [candidate for distance, candidate in scored if distance <=
+            limit and distance == scored[0][0]]
+        if allow_distance and len(best) == 1:
+            return best[0], 'edit_distance'
+        return None, [candidate for distance, candidate in scored[:3] if
+            distance <= limit + 2]
+
+    def _scope(self, tokens):
+        """Table references, aliases and other names defined by the statement."""
+        refs = []
+        aliases = {}
+        opaque = set()
+        defined = set()
+        depth = 0
+        from_depths = set()
+        for index, token in enumerate(tokens):
+            following = tokens[index + 1] if index + 1 < len(tokens) else None
+            if token.text == '(':
+                depth += 1
+                continue
+            if token.text == ')':
+                from_depths.discard(depth)
+                depth -= 1
+                continue
+            if token.lower in ('where', 'group', 'order', 'having', 'limit',
+                'union', 'except', 'intersect', 'on', 'using', 'window'):
+                from_depths.discard(depth)
+            if not token.is_identifier:
+                if token.lower in TABLE_INTRODUCERS:
+                    from_depths.add(depth)
+                continue
+            previous = tokens[index - 1] if index else None
+            if following is not None and following.lower == 'as' and index + 2 < len(
+                tokens) and tokens[index + 2].text == '(':
+                opaque.add(token.name.lower())
+                continue
+            if following is not None and following.text == '(' and previous is not None and previous.lower in (
+                'with', ',') and self._is_cte_column_list(tokens, index + 1):
+                opaque.add(token.name.lower())
+                continue
+            if previous is not None and (previous.lower in TABLE_INTRODUCERS or
+                previous.text == ',' and depth in from_depths and self.
+                _follows_table(tokens, index - 1)):
+                refs.append(index)
+                alias = self._alias_after(tokens, index)
+                if alias is not None:
+                    aliases[tokens[alias].name.lower()] = index
+                continue
+            if previous is not None and previous.text == ')' and self._alias_of_subquery(
+                tokens, index):
+                opaque.add(token.name.lower())
+                continue
+            if previous is not None and previous.lower == 'as' or (previous
+                 is not None and (previous.kind in ('string', 'number') or
+                previous.text == ')') and (following is None or following.
+                text in (',', ')') or following.lower == 'from')):
+                defined.add(token.name.lower())
+        return refs, aliases, opaque, defined
+
+    @staticmethod
+    def _is_cte_column_list(tokens, open_index):
+        depth = 0
+        for index in range(open_index, len(tokens)):
+            if tokens[index].text == '(':
+                depth += 1
+            elif tokens[index].text == ')':
+                depth -= 1
+                if depth == 0:
+                    return index + 2 < len(tokens) and tokens[index + 1
+                        ].lower == 'as' and tokens[index + 2].text == '('
+        return False
+
+    @staticmethod
+    def _follows_table(tokens, comma_index):
+        """True when the comma continues a FROM list rather than a select list."""
+        for index in range(comma_index - 1, -1, -1):
+            token = tokens[index]
+            if token.lower in TABLE_INTRODUCERS:
+                return True
+            if token.text in ('(', ')') or token.kind in ('string', 'number'
+                ) or token.lower in ('select', 'where', 'on', 'by'):
+                return False
+        return False
+
+    @staticmethod
+    def _alias_after(tokens, index):
+        following = index + 1
+        if following < len(tokens) and tokens[following].lower == 'as':
+            following += 1
+        if following < len(tokens) and tokens[following].is_identifier:
+            return following
+        return None
+
+    @staticmethod
+    def _alias_of_subquery(tokens, index):
+        depth = 0
+        for position in range(index - 1, -1, -1):
+            text = tokens[position].text
+            if text == ')':
+                depth += 1
+            elif text == '(':
+                depth -= 1
+                if depth == 0:
+                    return position > 0 and tokens[position - 1].lower in (
+                        'from', 'join', ',') and position + 1 < len(tokens
+                        ) and tokens[position + 1].lower in ('select',
+                        'with', 'values')
+        return False
+
+    def validate(self, sql_query):
+        original_sql = sql_query or ''
+        tokens = _tokenize(original_sql)
+        refs, aliases, opaque, defined = self._scope(tokens)
+        edits = []
+        fixes = []
+        issues = []
+        resolved = {}
+        for index in refs:
+            token = tokens[index]
+            lowered = token.name.lower()
+            if lowered in opaque:
+                continue
+            if lowered in self.tables:
+                resolved[index] = self.tables[lowered]
+                continue
+            canonical, detail = self._closest(token.name, list(self.tables.
+                values()))
+            if canonical is None:
+                issues.append({'kind': 'unknown_table', 'name': token.name,
+                    'suggestions': detail})
+                continue
+            resolved[index] = canonical
+            edits.append((token.start, token.end, quote_identifier(canonical)))
+            fixes.append({'kind': 'table', 'from': token.text, 'to':
+                canonical, 'reason': detail})
+        tables_in_scope = list(dict.fromkeys(resolved.values()))
+        qualifiers = {}
+        for alias, index in aliases.items():
+            if index in resolved:
+                qualifiers[alias] = resolved[index]
+        for index in resolved:
+            qualifiers.setdefault(tokens[index].name.lower(), resolved[index])
+            qualifiers.setdefault(resolved[index].lower(), resolved[index])
+        has_opaque = bool(opaque) or len(resolved) < len(refs)
+        skip = set(refs)
+        skip.update(index + 1 for index in refs)
+        skip.update(index + 2 for index in refs if index + 1 < len(tokens) and
+            tokens[index + 1].lower == 'as')
+        position = 0
+        while position < len(tokens):
+            token = tokens[position]
+            previous = tokens[position - 1] if position else None
+            following = tokens[position + 1] if position + 1 < len(tokens
+                ) else None
+            if position in skip or not token.is_identifier or following is not None and following.text == '(':
+                position += 1
+                continue
+            if following is not None and following.text == '.':
+                position += 1
+                continue
+            table_name = None
+            if previous is not None and previous.text == '.':
+                qualifier = tokens[position - 2].name.lower(
+                    ) if position >= 2 else ''
+                if qualifier in opaque or qualifier not in qualifiers:
+                    position += 1
+                    continue
+                candidate_tables = [qualifiers[qualifier]]
+                table_name = qualifiers[qualifier]
+            else:
+                if previous is not None and previous.lower == 'as':
+                    position += 1
+                    continue
+                candidate_tables = tables_in_scope
+            spaced_end = self._spaced_match(original_sql, tokens, position,
+                candidate_tables, token)
+            if spaced_end is not None:
+                end_position, canonical = spaced_end
+                edits.append((token.start, tokens[end_position].end,
+                    quote_identifier(canonical)))
+                fixes.append({'kind': 'spaced_name', 'from': original_sql[
+                    token.start:tokens[end_position].end], 'to': canonical,
+                    'reason': 'unquoted_spaces'})
+                position = end_position + 1
+                continue
+            lowered = token.name.lower()
+            columns = {}
+            for candidate_table in candidate_tables:
+                columns.update({name.lower(): name for name in self.columns
+                    .get(candidate_table, {}).values()})
+            if lowered in columns or table_name is None and (lowered in
+                defined or lowered in qualifiers or lowered in opaque):
+                position += 1
+                continue
+            if table_name is None and (has_opaque or not candidate_tables):
+                position += 1
+                continue
+            canonical, detail = self._closest(token.name, list(columns.
+                values()), allow_distance=token.text[0] != '"')
+            if canonical is None:
+                if token.text[0] != '"':
+                    issues.append({'kind': 'unknown_column', 'name': token.
+                        name, 'table': table_name, 'suggestions': detail})
+            else:
+                edits.append((token.start, token.end, quote_identifier(
+                    canonical)))
+                fixes.append({'kind': 'column', 'from': token.text, 'to':
+                    canonical, 'table': table_name, 'reason': detail})
+            position += 1
+        sql = original_sql
+        for start, end, replacement in sorted(edits, reverse=True):
+            sql = sql[:start] + replacement + sql[end:]
+        result = ValidationResult(original_sql, sql, fixes, issues)
+        with _stats_lock:
+            _stats['validated'] += 1
+            _stats['fixed_queries'] += bool(fixes)
+            _stats['fixes'] += len(fixes)
+            _stats['unresolved_queries'] += bool(issues)
+        if fixes or issues:
+            logger.info(
+                f'SQL validation: {len(fixes)} fix(es), {len(issues)} unresolved issue(s)'
+                )
+        return result
+
+    def _spaced_match(self, sql_query, tokens, position, tables, token):
+        """(last token index, column) for an unquoted multi-word column name."""
+        if token.kind != 'word':
+            return None
+        for table_name in tables:
+            for column_name in self.spaced.get(table_name, []):
+                end = token.start + len(column_name)
+                if sql_query[token.start:end].lower() != column_name.lower():
+                    continue
+                if end < len(sql_query) and (sql_query[end].isalnum() or
+                    sql_query[end] == '_'):
+                    continue
+                for end_position in range(position, len(tokens)):
+                    if tokens[end_position].end == end:
+                        if end_position > position:
+                            return end_position, column_name
+                        break
+                    if tokens[end_position].end > end:
+                        break
+        return None
+
+
+def get_validator(schema_data, stats_data=None):
+    """Validator for these schema dicts, rebuilt only when different ones are passed."""
+    global _cached
+    with _lock:
+        if _cached is None or _cached[0] is not schema_data or _cached[1
+            ] is not stats_data:
+            _cached = schema_data, stats_data, SqlValidator(schema_data,
+                stats_data)
+        return _cached[2]
+
+
+def record_outcome(result, success):
+    """Count a repaired query that then ran; each one is a retry call avoided."""
+    if result is None or not result.fixed:
+        return
+    with _stats_lock:
+        _stats['retries_avoided' if success else 'fixed_but_failed'] += 1
+
+
+def get_stats():
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,275 @@
+import logging
+import os
+import re
+import socket
+import threading
+import uuid
+LEASE_SECONDS = int(os.environ.get('WORK_LEASE_SECONDS', 600))
+HEARTBEAT_SECONDS = float(os.environ.get('WORK_HEARTBEAT_SECONDS',
+    LEASE_SECONDS / 3))
+MAX_ATTEMPTS = int(os.environ.get('WORK_MAX_ATTEMPTS', 3))
+LEASE_TABLE = 'work_lease'
+LEASE_TABLE_DDL = f"""
+CREATE TABLE IF NOT EXISTS `{LEASE_TABLE}` (
+  `queue_name` varchar(128) NOT NULL,
+  `row_id` int NOT NULL,
+  `lease_owner` varchar(128) NOT NULL,
+  `lease_expires_at` datetime NOT NULL,
+  `attempts` int NOT NULL DEFAULT '1',
+  `claimed_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`queue_name`, `row_id`),
+  KEY `idx_work_lease_expiry` (`queue_name`, `lease_expires_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci
+"""
+IDENTIFIER = re.compile('[A-Za-z_][A-Za-z0-9_]*')
+logger = logging.getLogger(__name__)
+
+
+def _identifier(name):
+    if not IDENTIFIER.fullmatch(name):
+        raise ValueError(f'Invalid SQL identifier: {name!r}')
+    return f'`{name}`'
+
+
+def make_owner():
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+class WorkQueue:
+    """Lease-based work claiming over a status column, for parallel workers.
+
+    `claim` locks up to `limit` rows whose status is `ready_value` with
+    SELECT ... FOR UPDATE SKIP LOCKED, so concurrent workers never pick the
+    same row and never wait on each other, flips them to
+    `processing_value` and records a lease (owner, expiry) in work_lease.
+    A row left in `processing_value` whose lease has expired, or that has
+    no lease at all (a crash under the old scripts), is reclaimed by the
+    next claim; after `max_attempts` claims it is set to `failed_value`
+    instead. While a batch is being worked on, the heartbeat thread keeps
+    the worker's leases from expiring; `release` ends them once the
+    script has written a final status. `where` is an extra SQL condition
+    on the claimed table, which is aliased `t`.
+    """
+
+    def __init__(self, table, status_column, columns, ready_value='ready',
+        processing_value='processing', failed_value='failed', where=None,
+        lease_seconds=None, max_attempts=None, owner=None):
+        self.table = _identifier(table)
+        self.status_column = _identifier(status_column)
+        self.columns = ', '.join(f't.{_identifier(column)}' for column in
+            columns)
+        self.name = f'{table}.{status_column}'
+        self.ready_value = ready_value
+        self.processing_value = processing_value
+        self.failed_value = failed_value
+        self.where = where
+        self.lease_seconds = (LEASE_SECONDS if lease_seconds is None else
+            lease_seconds)
+        self.max_attempts = (MAX_ATTEMPTS if max_attempts is None else
+            max_attempts)
+        self.owner = owner or make_owner()
+        self.held = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat_thread = None
+        self._table_ready = False
+        self.stats = {'claimed': 0, 'reclaimed': 0, 'exhausted': 0,
+            'released': 0, 'heartbeats': 0, 'lost': 0}
+
+    def ensure_lease_table(self, conn):
+        if self._table_ready:
+            return
+        cursor = conn.cursor()
+        cursor.execute(LEASE_TABLE_DDL)
+        cursor.close()
+        conn.commit()
+        self._table_ready = True
+
+    def claim(self, conn, limit):
+        """Lease up to `limit` rows to this worker and return them as dicts."""
+        self.ensure_lease_table(conn)
+        conn.commit()
+        extra = f' AND ({self.where})' if self.where else ''
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(
+                f"""
+                SELECT {self.columns}, t.{self.status_column} AS claim_status,
+                    l.attempts AS claim_attempts
+                FROM {self.table} t
+                LEFT JOIN `{LEASE_TABLE}` l
+                    ON l.queue_name = %s AND l.row_id = t.id
+                WHERE (t.{self.status_column} = %s
+                    OR (t.{self.status_column} = %s
+                        AND (l.row_id IS NULL OR l.lease_expires_at < NOW()))){extra}
+                ORDER BY t.id
+                LIMIT %s
+                FOR UPDATE OF t SKIP LOCKED
+                """
+                , (self.name, self.ready_value, self.processing_value, limit))
+            rows = cursor.fetchall()
+            claimed = []
+            exhausted = []
+            leases = []
+            for row in rows:
+                reclaimed = row.pop('claim_status') != self.ready_value
+                previous_attempts = row.pop('claim_attempts') or 0
+                attempts = previous_attempts + 1 if reclaimed else 1
+                if attempts > self.max_attempts:
+                    exhausted.append(row['id'])
+                    continue
+                if reclaimed:
+                    logger.warning(
+                        f'Reclaiming {self.name} row {row["id"]} (attempt {attempts})'
+                        )
+                    self.stats['reclaimed'] += 1
+                claimed.append(row)
+                leases.append((self.name, row['id'], self.owner, self.
+                    lease_seconds, attempts))
+            if exhausted:
+                placeholders = ', '.join(['%s'] * len(exhausted))
+                cursor.execute(
+                    f'UPDATE {self.table} SET {self.status_column} = %s WHERE id IN ({placeholders})'
+                    , [self.failed_value] + exhausted)
+                logger.error(
+                    f'Marked {self.name} rows {exhausted} as {self.failed_value} after {self.max_attempts} attempts'
+                    )
+                self.stats['exhausted'] += len(exhausted)
+            if claimed:
+                ids = [row['id'] for row in claimed]
+                placeholders = ', '.join(['%s'] * len(ids))
+                cursor.execute(
+                    f'UPDATE {self.table} SET {self.status_column} = %s WHERE id IN ({placeholders})'
+                    , [self.processing_value] + ids)
+                cursor.executemany(
+                    f"""
+                    INSERT INTO `{LEASE_TABLE}`
+                        (queue_name, row_id, lease_owner, lease_expires_at, attempts)
+                    VALUES (%s, %s, %s, NOW() + INTERVAL %s SECOND, %s)
+                    ON DUPLICATE KEY UPDATE lease_owner = VALUES(lease_owner),
+                        lease_expires_at = VALUES(lease_expires_at),
+                        attempts = VALUES(attempts), claimed_at = CURRENT_TIMESTAMP
+                    """
+                    , leases)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        with self._lock:
+            self.held.update(row['id'] for row in claimed)
+        self.stats['claimed'] += len(claimed)
+        if claimed:
+            logger.info(
+                f'{self.owner} claimed {len(claimed)} {self.name} rows: {[row["id"] for row in claimed]}'
+                )
+        return claimed
+
+    def heartbeat(self, conn):
+        """Extend this worker's live leases; returns how many were lost."""
+        with self._lock:
+            held = list(self.held)
+        if not held:
+            return 0
+        placeholders = ', '.join(['%s'] * len(held))
+        cursor = conn.cursor()
+        cursor.execute(
+            f"""
+            UPDATE `{LEASE_TABLE}`
+            SET lease_expires_at = NOW() + INTERVAL %s SECOND
+            WHERE queue_name = %s AND lease_owner = %s
+                AND lease_expires_at >= NOW() AND row_id IN ({placeholders})
+            """
+            , [self.lease_seconds, self.name, self.owner] + held)
+        extended = cursor.rowcount
+        cursor.close()
+        conn.commit()
+        self.stats['heartbeats'] += 1
+        lost = max(len(held) - extended, 0)
+        if lost:
+            self.stats['lost'] += lost
+            logger.warning(
+                f'{self.owner} lost {lost} {self.name} lease(s); another worker may reclaim them'
+                )
+        return lost
+
+    def release(self, conn, ids):
+        """End this worker's leases on `ids` once their final status is written.
+
+        Rows still in `processing_value` become claimable again straight away
+        (their attempt count is kept).
+        """
+        ids = list(ids)
+        with self._lock:
+            self.held.difference_update(ids)
+        if not ids:
+            return
+        placeholders = ', '.join(['%s'] * len(ids))
+        cursor = conn.cursor()
+        cursor.execute(
+            f"""
+            UPDATE `{LEASE_TABLE}`
+            SET lease_expires_at = NOW() - INTERVAL 1 SECOND
+            WHERE queue_name = %s AND lease_owner = %s AND row_id IN ({placeholders})
+            """
+            , [self.name, self.owner] + ids)
+        cursor.close()
+        conn.commit()
+        self.stats['released'] += len(ids)
+
+    def requeue(self, conn, ids):
+        """Hand back rows this worker claimed but never started on."""
+        ids = list(ids)
+        if not ids:
+            return
+        placeholders = ', '.join(['%s'] * len(ids))
+        cursor = conn.cursor()
+        cursor.execute(
+            f"""
+            UPDATE {self.table} t
+            JOIN `{LEASE_TABLE}` l ON l.queue_name = %s AND l.row_id = t.id
+            SET t.{self.status_column} = %s
+            WHERE l.lease_owner = %s AND t.{self.status_column} = %s
+                AND t.id IN ({placeholders})
+            """
+            , [self.name, self.ready_value, self.owner, self.
+            processing_value] + ids)
+        cursor.close()
+        conn.commit()
+        self.release(conn, ids)
+
+    def start_heartbeat(self, connect):
+        """Renew leases every HEARTBEAT_SECONDS on a connection of its own."""
+        if self._heartbeat_thread is not None:
+            return
+        self._stop.clear()
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop,
+            args=(connect,), name=f'lease-heartbeat-{self.name}', daemon=True)
+        self._heartbeat_thread.start()
+
+    def stop_heartbeat(self):
+        if self._heartbeat_thread is None:
+            return
+        self._stop.set()
+        self._heartbeat_thread.join()
+        self._heartbeat_thread = None
+
+    def _heartbeat_loop(self, connect):
+        conn = None
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            try:
+                if conn is None:
+                    conn = connect()
+                self.heartbeat(conn)
+            except Exception as e:
+                logger.error(
+                    f'Lease heartbeat failed for {self.name}: {str(e)}')
+                try:
+                    if conn is not None:
+                        conn.close()
+                except Exception:
+                    pass
+                conn = None
+        if conn is not None:
+            conn.close()
@@ -277,4 +277,21 @@ CREATE TABLE `baqr_prompt_template_nl_questions` (
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 
 
+-- --------------------------------------------------------
+-- Table structure for table `work_lease`
+-- --------------------------------------------------------
+DROP TABLE IF EXISTS `work_lease`;
+
+CREATE TABLE `work_lease` (
+  `queue_name` varchar(128) NOT NULL,
+  `row_id` int NOT NULL,
+  `lease_owner` varchar(128) NOT NULL,
+  `lease_expires_at` datetime NOT NULL,
+  `attempts` int NOT NULL DEFAULT '1',
+  `claimed_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`queue_name`, `row_id`),
+  KEY `idx_work_lease_expiry` (`queue_name`, `lease_expires_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+
 SET FOREIGN_KEY_CHECKS = 1;
@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 import logging
 import anthropic
@@ -7,6 +8,9 @@ from mysql.connector import Error
 import time
 from datetime import datetime
 import traceback
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..'))
+from common import llm_client
 os.makedirs('logs', exist_ok=True)
 logging.basicConfig(filename='logs/baqr_candidate_prompts.log', level=
     logging.INFO, format=
@@ -124,21 +128,13 @@ def query_claude(prompt):
             'Sending request to Claude API using streaming with extended reasoning'
             )
         logging.info(f'PROMPT (truncated):\n{prompt[:1000]}...')
-        response_text = ''
-        thinking_text = ''
-        with CLAUDE_CLIENT.beta.messages.stream(model=
-            'claude-3-7-sonnet-20250219', max_tokens=128000, thinking={
-            'type': 'enabled', 'budget_tokens': 60000}, messages=[{'role':
-            'user', 'content': prompt}], betas=['output-128k-2025-02-19']
-            ) as stream:
-            for event in stream:
-                if event.type == 'content_block_delta':
-                    if event.delta.type == 'thinking_delta':
-                        thinking_text += event.delta.thinking
-                    elif event.delta.type == 'text_delta':
-                        response_text += event.delta.text
-                elif event.type == 'content_block_stop':
-                    logging.info('Content block complete')
+        claude_model = 'claude-3-7-sonnet-20250219'
+        claude_config = {'max_tokens': 128000, 'thinking': {'type':
+            'enabled', 'budget_tokens': 60000}, 'betas': [
+            'output-128k-2025-02-19']}
+        response_text, thinking_text = llm_client.generate_claude(
+            CLAUDE_CLIENT, claude_model, prompt, claude_config, label=
+            '12_candidates')
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         response_file = f'logs/claude_prompt_response_{timestamp}.txt'
         thinking_file = f'logs/claude_prompt_thinking_{timestamp}.txt'
@@ -148,36 +144,14 @@ def query_claude(prompt):
             f.write(thinking_text)
         logging.info(f'Full response saved to {response_file}')
         logging.info(f'Thinking saved to {thinking_file}')
-        try:
-            json_start = response_text.find('[')
-            if json_start >= 0:
-                json_end = response_text.rfind(']') + 1
-                if json_end > json_start:
-                    json_str = response_text[json_start:json_end]
-                    return json.loads(json_str)
-            json_start = response_text.find('```json')
-            if json_start >= 0:
-                json_start += 7
-                json_end = response_text.find('```', json_start)
-                if json_end > json_start:
-                    json_str = response_text[json_start:json_end].strip()
-                    return json.loads(json_str)
-            json_start = response_text.find('```')
-            if json_start >= 0:
-                json_start += 3
-                json_end = response_text.find('```', json_start)
-                if json_end > json_start:
-                    json_str = response_text[json_start:json_end].strip()
-                    return json.loads(json_str)
+        parsed_response = llm_client.parse_json(response_text)
+        if parsed_response is None:
             logging.error('Could not find JSON data in response')
-            return []
-        except json.JSONDecodeError as e:
-            logging.error(f'Error parsing JSON: {str(e)}')
             with open(f'logs/json_parse_error_{timestamp}.txt', 'w',
                 encoding='utf-8') as f:
-                f.write(json_str if 'json_str' in locals() else
-                    'JSON string not identified')
+                f.write(response_text)
             return []
+        return parsed_response
     except Exception as e:
         logging.error(f'Error calling Claude API: {str(e)}')
         logging.error(traceback.format_exc())
@@ -1,5 +1,6 @@
 import json
 import os
+import sys
 import logging
 import random
 import mysql.connector
@@ -8,7 +9,9 @@ import time
 from datetime import datetime
 import traceback
 from google import genai
-from google.genai import types
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..'))
+from common import llm_client
 os.makedirs('logs', exist_ok=True)
 logging.basicConfig(filename='logs/run_candidate_baqr_prompt.log', level=
     logging.INFO, format=
@@ -103,23 +106,10 @@ def query_flash(content_prompt):
         logging.info('Sending request to Flash (Gemini) API using streaming')
         logging.info(f'CONTENT PROMPT (truncated): {content_prompt[:500]}...')
         response_schema = get_flash_response_schema()
-        generate_content_config = types.GenerateContentConfig(temperature=0,
-            top_p=0.95, max_output_tokens=8192, response_modalities=['TEXT'
-            ], safety_settings=[types.SafetySetting(category=
-            'HARM_CATEGORY_HATE_SPEECH', threshold='OFF'), types.
-            SafetySetting(category='HARM_CATEGORY_DANGEROUS_CONTENT',
-            threshold='OFF'), types.SafetySetting(category=
-            'HARM_CATEGORY_SEXUALLY_EXPLICIT', threshold='OFF'), types.
-            SafetySetting(category='HARM_CATEGORY_HARASSMENT', threshold=
-            'OFF')], response_mime_type='application/json', response_schema
-            =response_schema)
-        contents = [types.Content(role='user', parts=[types.Part.from_text(
-            text=content_prompt)])]
-        response_text = ''
-        for chunk in FLASH_CLIENT.models.generate_content_stream(model=
-            FLASH_MODEL, contents=contents, config=generate_content_config):
-            chunk_text = chunk.text if chunk.text else ''
-            response_text += chunk_text
+        generate_content_config = llm_client.flash_config(response_schema)
+        response_text = llm_client.generate_flash(FLASH_CLIENT,
+            FLASH_MODEL, content_prompt, generate_content_config,
+            label='run_candidate_baqr_prompt')
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         response_file = f'logs/flash_response_{timestamp}.txt'
         with open(response_file, 'w', encoding='utf-8') as f:
@@ -1,5 +1,6 @@
 import json
 import os
+import sys
 import logging
 import random
 import mysql.connector
@@ -8,7 +9,10 @@ import time
 from datetime import datetime
 import traceback
 from google import genai
-from google.genai import types
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..'))
+from common import llm_client
+from common import work_queue
 os.makedirs('logs', exist_ok=True)
 logging.basicConfig(filename='logs/run_critics_on_candidate_data.log',
     level=logging.INFO, format=
@@ -35,6 +39,10 @@ VULNERABILITY_FILE_PATH = os.path.join(PILLAR_DIR,
 COUNTERARGUMENT_FILE_PATH = os.path.join(PILLAR_DIR,
     'preemptive-counterargument_pattern.json')
 BATCH_SIZE = 10
+WORK_QUEUE = work_queue.WorkQueue('baqr_prompt_template_nl_questions',
+    'status', ['id', 'baqr_prompt_template_id',
+    'bird_question_linked_to_cluster_id',
+    'refinement_question_with_explanation_set'], ready_value='pending_critic')
 
 
 def get_db_connection():
@@ -49,37 +57,7 @@ def get_db_connection():
 def get_pending_questions():
     try:
         conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            "SELECT COUNT(*) as count FROM baqr_prompt_template_nl_questions WHERE status='processing'"
-            )
-        result = cursor.fetchone()
-        if result and result['count'] > 0:
-            logging.error(
-                f"Found {result['count']} records in 'processing' state. Aborting."
-                )
-            cursor.close()
-            conn.close()
-            raise Exception(
-                "Found records in 'processing' state. Fix these before running again."
-                )
-        cursor.execute(
-            """
-            SELECT id, baqr_prompt_template_id, bird_question_linked_to_cluster_id, refinement_question_with_explanation_set 
-            FROM baqr_prompt_template_nl_questions 
-            WHERE status='pending_critic'
-            LIMIT %s
-            """
-            , (BATCH_SIZE,))
-        questions = cursor.fetchall()
-        if questions:
-            ids = [q['id'] for q in questions]
-            placeholders = ', '.join(['%s'] * len(ids))
-            cursor.execute(
-                f"UPDATE baqr_prompt_template_nl_questions SET status='processing' WHERE id IN ({placeholders})"
-                , ids)
-            conn.commit()
-        cursor.close()
+        questions = WORK_QUEUE.claim(conn, BATCH_SIZE)
         conn.close()
         logging.info(
             f'Retrieved {len(questions)} questions for critic evaluation')
@@ -89,6 +67,12 @@ def get_pending_questions():
         raise
 
 
+def release_questions(questions):
+    conn = get_db_connection()
+    WORK_QUEUE.release(conn, [q['id'] for q in questions])
+    conn.close()
+
+
 def get_critic_templates():
     try:
         conn = get_db_connection()
@@ -168,23 +152,10 @@ def query_flash(content_prompt):
         logging.info('Sending request to Flash (Gemini) API using streaming')
         logging.info(f'CONTENT PROMPT (truncated): {content_prompt[:500]}...')
         response_schema = get_flash_response_schema()
-        generate_content_config = types.GenerateContentConfig(temperature=0,
-            top_p=0.95, max_output_tokens=8192, response_modalities=['TEXT'
-            ], safety_settings=[types.SafetySetting(category=
-            'HARM_CATEGORY_HATE_SPEECH', threshold='OFF'), types.
-            SafetySetting(category='HARM_CATEGORY_DANGEROUS_CONTENT',
-            threshold='OFF'), types.SafetySetting(category=
-            'HARM_CATEGORY_SEXUALLY_EXPLICIT', threshold='OFF'), types.
-            SafetySetting(category='HARM_CATEGORY_HARASSMENT', threshold=
-            'OFF')], response_mime_type='application/json', response_schema
-            =response_schema)
-        contents = [types.Content(role='user', parts=[types.Part.from_text(
-            text=content_prompt)])]
-        response_text = ''
-        for chunk in FLASH_CLIENT.models.generate_content_stream(model=
-            FLASH_MODEL, contents=contents, config=generate_content_config):
-            chunk_text = chunk.text if chunk.text else ''
-            response_text += chunk_text
+        generate_content_config = llm_client.flash_config(response_schema)
+        response_text = llm_client.generate_flash(FLASH_CLIENT,
+            FLASH_MODEL, content_prompt, generate_content_config,
+            label='run_critics_on_candidate_data')
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         response_file = f'logs/flash_critic_response_{timestamp}.txt'
         with open(response_file, 'w', encoding='utf-8') as f:
@@ -309,6 +280,7 @@ def main():
         logging.info(
             f"Using critic templates: {[c['id'] for c in critic_templates]}")
         total_processed = 0
+        WORK_QUEUE.start_heartbeat(get_db_connection)
         while True:
             questions = get_pending_questions()
             if not questions:
@@ -354,6 +326,7 @@ def main():
                     conn.commit()
                     cursor.close()
                     conn.close()
+            release_questions(questions)
         elapsed_time = time.time() - start_time
         logging.info(
             f'Script completed in {elapsed_time:.2f} seconds. Total processed: {total_processed}'
@@ -361,6 +334,8 @@ def main():
     except Exception as e:
         logging.error(f'Script failed with error: {str(e)}')
         logging.error(traceback.format_exc())
+    finally:
+        WORK_QUEUE.stop_heartbeat()
 
 
 if __name__ == '__main__':
@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 import logging
 import mysql.connector
@@ -7,7 +8,9 @@ import time
 from datetime import datetime
 import traceback
 from google import genai
-from google.genai import types
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..'))
+from common import llm_client
 os.makedirs('logs', exist_ok=True)
 logging.basicConfig(filename='logs/baqr_prompt_self_reflection.log', level=
     logging.INFO, format=
@@ -306,34 +309,18 @@ def query_flash(content_prompt):
         logging.info('Sending request to Flash (Gemini) API using streaming')
         logging.info(f'CONTENT PROMPT (truncated): {content_prompt[:500]}...')
         response_schema = get_flash_response_schema()
-        generate_content_config = types.GenerateContentConfig(temperature=
-            0.2, top_p=0.95, max_output_tokens=8192, response_modalities=[
-            'TEXT'], safety_settings=[types.SafetySetting(category=
-            'HARM_CATEGORY_HATE_SPEECH', threshold='OFF'), types.
-            SafetySetting(category='HARM_CATEGORY_DANGEROUS_CONTENT',
-            threshold='OFF'), types.SafetySetting(category=
-            'HARM_CATEGORY_SEXUALLY_EXPLICIT', threshold='OFF'), types.
-            SafetySetting(category='HARM_CATEGORY_HARASSMENT', threshold=
-            'OFF')], response_mime_type='application/json', response_schema
-            =response_schema)
-        contents = [types.Content(role='user', parts=[types.Part.from_text(
-            text=content_prompt)])]
-        response_text = ''
+        generate_content_config = llm_client.flash_config(
+            response_schema, temperature=0.2)
         try:
-            response_stream = FLASH_CLIENT.models.generate_content_stream(model
-                =FLASH_MODEL, contents=contents, config=generate_content_config
-                )
-            for chunk in response_stream:
-                chunk_text = chunk.text if hasattr(chunk, 'text'
-                    ) and chunk.text else ''
-                response_text += chunk_text
+            response_text = llm_client.generate_flash(FLASH_CLIENT,
+                FLASH_MODEL, content_prompt, generate_content_config,
+                label='self_reflection_per_candidate_per_question_set')
         except Exception as stream_error:
             logging.error(f'Streaming error: {str(stream_error)}')
             try:
-                response = FLASH_CLIENT.models.generate_content(model=
-                    FLASH_MODEL, contents=contents, config=
-                    generate_content_config)
-                response_text = response.text
+                response_text = llm_client.generate_flash(FLASH_CLIENT,
+                    FLASH_MODEL, content_prompt, generate_content_config,
+                    stream=False, label='self_reflection_per_candidate_per_question_set')
                 logging.info('Successfully fell back to non-streaming API')
             except Exception as fallback_error:
                 logging.error(f'Fallback error: {str(fallback_error)}')
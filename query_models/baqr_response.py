@@ -1,5 +1,6 @@
 import json
 import os
+import sys
 import anthropic
 import mysql.connector
 from mysql.connector import Error
@@ -8,7 +9,15 @@ import time
 from datetime import datetime
 import traceback
 from google import genai
-from google.genai import types
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..'))
+from common import batch_planner
+from common import evidence_index
+from common import json_stream
+from common import llm_client
+from common import schema_matcher
+from common import batch_pipeline
+from common import work_queue
 os.makedirs('logs', exist_ok=True)
 logging.basicConfig(filename='logs/baqr_question_generator.log', level=
     logging.INFO, format=
@@ -28,6 +37,9 @@ CLAUDE_API_KEY = (
 CLAUDE_CLIENT = anthropic.Anthropic(api_key=CLAUDE_API_KEY)
 FLASH_CLIENT = genai.Client(project="your-gcp-project-id")
 FLASH_MODEL = 'gemini-2.0-flash-001'
+FLASH_MAX_OUTPUT_TOKENS = 8192
+CLAUDE_MAX_TOKENS = 128000
+CLAUDE_THINKING_BUDGET = 60000
 EVIDENCE_FILE_PATH = '../data/all_evidence.json'
 SCHEMA_FILE_PATH = '../data/BIRD_table_schema_info.json'
 STATS_FILE_PATH = '../data/compact_dataset_stats.json'
@@ -40,13 +52,23 @@ VULNERABILITY_FILE_PATH = os.path.join(PILLAR_DIR,
 COUNTERARGUMENT_FILE_PATH = os.path.join(PILLAR_DIR,
     'preemptive-counterargument_pattern.json')
 TEST_MODE = False
-BATCH_SIZE = 3
+OUTPUT_TOKEN_BUDGET = int(os.environ.get('BAQR_OUTPUT_TOKEN_BUDGET',
+    CLAUDE_MAX_TOKENS - CLAUDE_THINKING_BUDGET if LLM_MODEL == 'CLAUDE' else
+    FLASH_MAX_OUTPUT_TOKENS))
+INPUT_TOKEN_BUDGET = int(os.environ.get('BAQR_INPUT_TOKEN_BUDGET', 200000))
+OUTPUT_TOKENS_PER_RECORD = int(os.environ.get(
+    'BAQR_OUTPUT_TOKENS_PER_RECORD', 2400))
+MAX_BATCH_SIZE = int(os.environ.get('BAQR_MAX_BATCH_SIZE', 10))
+PLANNER = batch_planner.BatchPlanner('baqr_response', OUTPUT_TOKEN_BUDGET,
+    OUTPUT_TOKENS_PER_RECORD, input_budget=INPUT_TOKEN_BUDGET, max_records=
+    MAX_BATCH_SIZE)
+WORK_QUEUE = work_queue.WorkQueue('dataset', 'baqr_status', [
+    'id', 'question_id_from_BIRD', 'question', 'decision'])
 
 
 def load_files():
     try:
-        with open(EVIDENCE_FILE_PATH, 'r') as f:
-            evidence_data = json.load(f)
+        evidence_data = evidence_index.load_index(EVIDENCE_FILE_PATH)
         with open(SCHEMA_FILE_PATH, 'r') as f:
             schema_data = json.load(f)
         with open(STATS_FILE_PATH, 'r') as f:
@@ -78,45 +100,10 @@ def get_db_connection():
         raise
 
 
-def get_dataset_records(conn, limit=10):
-    try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            "SELECT COUNT(*) as count FROM dataset WHERE baqr_status = 'processing'"
-            )
-        result = cursor.fetchone()
-        if result['count'] > 0:
-            logging.error(
-                "Found records with 'processing' status. Please check for failures in previous runs."
-                )
-            raise Exception("Records with 'processing' status found. Exiting.")
-        cursor.execute(
-            "SELECT id, question_id_from_BIRD, question, decision FROM dataset WHERE baqr_status = 'ready' LIMIT %s"
-            , (limit,))
-        records = cursor.fetchall()
-        if records:
-            ids = [record['id'] for record in records]
-            placeholders = ', '.join(['%s'] * len(ids))
-            cursor.execute(
-                f"UPDATE dataset SET baqr_status = 'processing' WHERE id IN ({placeholders})"
-                , ids)
-            conn.commit()
-        cursor.close()
-        return records
-    except Exception as e:
-        logging.error(f'Error getting dataset records: {str(e)}')
-        raise
-
-
 def prepare_prompt(records, evidence_data, schema_data, stats_data, pillar_data
     ):
     bird_ids = [record['question_id_from_BIRD'] for record in records]
-    all_relevant_evidence = []
-    for evidence_obj in evidence_data:
-        for evidence_text, question_ids in evidence_obj.items():
-            if any(str(bird_id) in question_ids for bird_id in bird_ids):
-                if evidence_text not in all_relevant_evidence:
-                    all_relevant_evidence.append(evidence_text)
+    all_relevant_evidence = evidence_data.lookup_many(bird_ids)
     dataset_entries = []
     for record in records:
         question_data = json.loads(record['question'])
@@ -174,27 +161,12 @@ def prepare_prompt(records, evidence_data, schema_data, stats_data, pillar_data
             counterargument_categories.append({'name': category.get(
                 'category_name', ''), 'description': category.get(
                 'category_description', ''), 'items': item_details})
+    matcher = schema_matcher.get_matcher(stats_data)
     relevant_tables = set()
     for entry in dataset_entries:
-        decision_text = entry['decision'].lower()
-        question_text = entry['question'].lower()
-        for table_name in stats_data['tables'].keys():
-            if table_name.lower() in decision_text or table_name.lower(
-                ) in question_text:
-                relevant_tables.add(table_name)
-    relevant_stats = {'tables': {}, 'column_groups': {}}
-    for table_name in relevant_tables:
-        if table_name in stats_data['tables']:
-            relevant_stats['tables'][table_name] = stats_data['tables'][
-                table_name]
-    for group_type, columns in stats_data['column_groups'].items():
-        relevant_columns = []
-        for column in columns:
-            table_name = column.split('.')[0]
-            if table_name in relevant_tables:
-                relevant_columns.append(column)
-        if relevant_columns:
-            relevant_stats['column_groups'][group_type] = relevant_columns
+        matched_tables, _ = matcher.match(entry['decision'], entry['question'])
+        relevant_tables |= matched_tables
+    relevant_stats = matcher.relevant_stats(relevant_tables)
     prompt = f"""You are a data science expert specialized in generating precise, insightful questions that lead to robust data-driven decisions. Your goal is to generate questions that result in "hard-to-vary" explanations - explanations that are tightly constrained by data and resist arbitrary modification. All questions must be directly answerable using SQL queries against the provided database schema.
 
 
@@ -480,85 +452,38 @@ def query_claude(prompt):
     try:
         logging.info('Sending batch request to Claude API using streaming')
         logging.info(f'PROMPT (truncated):\n{prompt[:50000]}...')
-        response_text = ''
-        thinking_text = ''
-        with CLAUDE_CLIENT.beta.messages.stream(model=
-            'claude-3-7-sonnet-20250219', max_tokens=128000, thinking={
-            'type': 'enabled', 'budget_tokens': 60000}, messages=[{'role':
-            'user', 'content': prompt}], betas=['output-128k-2025-02-19']
-            ) as stream:
-            for event in stream:
-                if event.type == 'content_block_delta':
-                    if event.delta.type == 'thinking_delta':
-                        thinking_text += event.delta.thinking
-                    elif event.delta.type == 'text_delta':
-                        response_text += event.delta.text
-                elif event.type == 'content_block_stop':
-                    logging.info('Content block complete')
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        claude_model = 'claude-3-7-sonnet-20250219'
+        claude_config = {'max_tokens': CLAUDE_MAX_TOKENS, 'thinking': {
+            'type': 'enabled', 'budget_tokens': CLAUDE_THINKING_BUDGET},
+            'betas': [
+            'output-128k-2025-02-19']}
+        response_text, thinking_text = llm_client.generate_claude(
+            CLAUDE_CLIENT, claude_model, prompt, claude_config, label=
+            'baqr_response')
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
         response_file = f'logs/claude_response_{timestamp}.txt'
         with open(response_file, 'w', encoding='utf-8') as f:
             f.write(response_text)
         logging.info(f'Full response saved to {response_file}')
         logging.info(f'THINKING (truncated):\n{thinking_text[:1000000]}...')
         logging.info(f'RESPONSE (truncated):\n{response_text[:1000000]}...')
-        try:
-            json_start = response_text.find('```json')
-            if json_start != -1:
-                json_start += 7
-                json_end = response_text.find('```', json_start)
-                if json_end != -1:
-                    json_str = response_text[json_start:json_end].strip()
-                    try:
-                        return json.loads(json_str)
-                    except json.JSONDecodeError as e:
-                        logging.error(
-                            f'Error parsing JSON in code block: {str(e)}')
-            json_start = response_text.find('```')
-            if json_start != -1:
-                json_start += 3
-                json_end = response_text.find('```', json_start)
-                if json_end != -1:
-                    json_str = response_text[json_start:json_end].strip()
-                    try:
-                        return json.loads(json_str)
-                    except json.JSONDecodeError as e:
-                        logging.error(
-                            f'Error parsing JSON in unmarked code block: {str(e)}'
-                            )
-            array_start = response_text.find('[')
-            if array_start != -1:
-                array_end = -1
-                open_brackets = 0
-                for i in range(array_start, len(response_text)):
-                    if response_text[i] == '[':
-                        open_brackets += 1
-                    elif response_text[i] == ']':
-                        open_brackets -= 1
-                        if open_brackets == 0:
-                            array_end = i + 1
-                            break
-                if array_end != -1:
-                    json_str = response_text[array_start:array_end].strip()
-                    try:
-                        return json.loads(json_str)
-                    except json.JSONDecodeError as e:
-                        logging.error(
-                            f'Error parsing direct JSON array: {str(e)}')
-            try:
-                return json.loads(response_text)
-            except json.JSONDecodeError:
-                logging.error('Failed to parse full response as JSON')
-            logging.error('All JSON parsing attempts failed')
-            return []
-        except Exception as e:
-            logging.error(f'Unexpected error during JSON parsing: {str(e)}')
-            logging.error(traceback.format_exc())
-            return []
+        output_tokens = batch_planner.estimate_tokens(response_text)
+        parsed_response = llm_client.parse_json(response_text)
+        if parsed_response is not None:
+            return parsed_response, False, output_tokens
+        parsed_response, closed = batch_planner.salvage_json_array(
+            response_text)
+        if '[' in response_text and not closed:
+            logging.warning(
+                f'Response appears to be truncated - recovered {len(parsed_response)} complete objects'
+                )
+            return parsed_response, True, output_tokens
+        logging.error('All JSON parsing attempts failed')
+        return [], False, output_tokens
     except Exception as e:
         logging.error(f'Error calling Claude API: {str(e)}')
         logging.error(traceback.format_exc())
-        return []
+        return [], False, 0
 
 
 def query_flash(content_prompt):
@@ -568,24 +493,20 @@ def query_flash(content_prompt):
         logging.info(f'CONTENT PROMPT (truncated): {content_prompt[:500]}...')
         response_schema = get_flash_response_schema()
         logging.info(f'Using response schema: {json.dumps(response_schema)}')
-        generate_content_config = types.GenerateContentConfig(temperature=0,
-            top_p=0.95, max_output_tokens=8192, response_modalities=['TEXT'
-            ], safety_settings=[types.SafetySetting(category=
-            'HARM_CATEGORY_HATE_SPEECH', threshold='OFF'), types.
-            SafetySetting(category='HARM_CATEGORY_DANGEROUS_CONTENT',
-            threshold='OFF'), types.SafetySetting(category=
-            'HARM_CATEGORY_SEXUALLY_EXPLICIT', threshold='OFF'), types.
-            SafetySetting(category='HARM_CATEGORY_HARASSMENT', threshold=
-            'OFF')], response_mime_type='application/json', response_schema
-            =response_schema)
-        contents = [types.Content(role='user', parts=[types.Part.from_text(
-            text=content_prompt)])]
-        response_text = ''
-        for chunk in FLASH_CLIENT.models.generate_content_stream(model=
-            FLASH_MODEL, contents=contents, config=generate_content_config):
-            chunk_text = chunk.text if chunk.text else ''
-            response_text += chunk_text
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        generate_content_config = llm_client.flash_config(
+            response_schema, max_output_tokens=FLASH_MAX_OUTPUT_TOKENS)
+        started_at = time.time()
+        parser = json_stream.JsonStreamParser((json_stream.WILDCARD,))
+
+        def on_text(chunk):
+            for path, value in parser.feed(chunk):
+                logging.info(
+                    f"Parsed response {path[0] + 1} (dataset_id {value.get('dataset_id') if isinstance(value, dict) else None}) after {time.time() - started_at:.1f}s"
+                    )
+        response_text = llm_client.generate_flash(FLASH_CLIENT, FLASH_MODEL,
+            content_prompt, generate_content_config, on_text=on_text, label
+            ='baqr_response')
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
         response_file = f'logs/flash_response_{timestamp}.txt'
         with open(response_file, 'w', encoding='utf-8') as f:
             f.write(response_text)
@@ -594,32 +515,50 @@ def query_flash(content_prompt):
         logging.info(
             f'RESPONSE from Flash (first 50000 chars): {response_text[:50000]}...'
             )
+        output_tokens = batch_planner.estimate_tokens(response_text)
         try:
             parsed_response = json.loads(response_text)
             logging.info('Successfully parsed JSON directly')
-            return parsed_response
+            return parsed_response, False, output_tokens
         except json.JSONDecodeError as e:
             logging.warning(f'Direct JSON parsing failed: {str(e)}')
-            if not response_text.strip().endswith(']'):
+            parsed_response, closed = batch_planner.salvage_json_array(
+                response_text)
+            if not closed:
                 logging.warning(
-                    'Response appears to be truncated - attempting recovery')
-                last_object_end = response_text.rfind('},')
-                if last_object_end > 0:
-                    fixed_json = response_text[:last_object_end + 1] + ']'
-                    try:
-                        parsed_response = json.loads(fixed_json)
-                        logging.info(
-                            f'Successfully recovered {len(parsed_response)} complete objects from truncated response'
-                            )
-                        return parsed_response
-                    except json.JSONDecodeError as e2:
-                        logging.error(f'Recovery attempt failed: {str(e2)}')
+                    f'Response appears to be truncated - recovered {len(parsed_response)} complete objects'
+                    )
+                return parsed_response, True, output_tokens
             logging.error('All JSON parsing attempts failed')
-            return []
+            return [], False, output_tokens
     except Exception as e:
         logging.error(f'Error calling Flash API: {str(e)}')
         logging.error(traceback.format_exc())
-        return []
+        return [], False, 0
+
+
+def estimate_record_tokens(record, evidence_data, stats_data):
+    """Prompt tokens one record adds: its texts, evidence and table stats."""
+    question_text = json.loads(record['question']).get('text', '')
+    decision_text = json.loads(record['decision']).get('text', '')
+    matcher = schema_matcher.get_matcher(stats_data)
+    matched_tables, _ = matcher.match(decision_text, question_text)
+    evidence = evidence_data.lookup_many([record['question_id_from_BIRD']])
+    relevant_stats = matcher.relevant_stats(matched_tables)
+    return sum(batch_planner.estimate_tokens(text) for text in (
+        question_text, decision_text, json.dumps(evidence, indent=2), json.
+        dumps(relevant_stats, indent=2)))
+
+
+def generate_questions(records, evidence_data, schema_data, stats_data,
+    pillar_data):
+    query_model = query_claude if LLM_MODEL == 'CLAUDE' else query_flash
+    base_tokens = batch_planner.estimate_tokens(prepare_prompt([],
+        evidence_data, schema_data, stats_data, pillar_data))
+    return PLANNER.run(records, lambda batch: query_model(prepare_prompt(
+        batch, evidence_data, schema_data, stats_data, pillar_data)), lambda
+        record: estimate_record_tokens(record, evidence_data, stats_data),
+        base_tokens)
 
 
 def insert_primary_question(conn, dataset_id, primary_question_data):
@@ -708,11 +647,13 @@ def insert_refinement_questions(conn, dataset_id, refinement_questions):
 
 
 def process_batch_response(conn, records, responses):
+    success_count = 0
+    failure_count = 0
     data_lookup = {record['id']: record for record in records}
     if not responses:
         logging.error('No responses to process')
         handle_failed_batch(conn, records)
-        return
+        return success_count, len(records)
     logging.info(f'Processing {len(responses)} responses')
     response_ids = [response.get('dataset_id') for response in responses if
         isinstance(response, dict) and response.get('dataset_id') is not None]
@@ -729,6 +670,7 @@ def process_batch_response(conn, records, responses):
                 , missing_ids)
             conn.commit()
             cursor.close()
+            failure_count += len(missing_ids)
             logging.info(
                 f'Marked {len(missing_ids)} records as failed due to missing responses'
                 )
@@ -800,6 +742,7 @@ def process_batch_response(conn, records, responses):
                 (dataset_id,))
             conn.commit()
             cursor.close()
+            success_count += 1
             logging.info(f"Updated dataset {dataset_id} status to 'success'")
         except Exception as e:
             logging.error(
@@ -817,6 +760,8 @@ def process_batch_response(conn, records, responses):
                 logging.error(
                     f"Failed to update dataset status to 'failed' for dataset_id {dataset_id}: {str(inner_e)}"
                     )
+            failure_count += 1
+    return success_count, failure_count
 
 
 def handle_failed_batch(conn, records):
@@ -838,58 +783,26 @@ def handle_failed_batch(conn, records):
 
 def main():
     start_time = time.time()
-    total_processed = 0
     logging.info(
         f'Starting baqr_question_generator.py script with {LLM_MODEL} model')
     try:
         evidence_data, schema_data, stats_data, pillar_data = load_files()
         logging.info(
             'Successfully loaded evidence, schema, stats, and pillar files')
-        conn = get_db_connection()
-        logging.info('Successfully connected to the database')
-        batch_count = 0
-        current_batch_size = BATCH_SIZE
-        while True:
-            batch_count += 1
-            batch_start_time = time.time()
-            records = get_dataset_records(conn, current_batch_size)
-            logging.info(
-                f'Batch {batch_count}: Found {len(records)} records to process'
-                )
-            if not records:
-                logging.info('No more records to process. Exiting.')
-                break
-            logging.info(
-                f'Processing batch {batch_count} with {len(records)} records')
-            prompt = prepare_prompt(records, evidence_data, schema_data,
-                stats_data, pillar_data)
-            if LLM_MODEL == 'CLAUDE':
-                responses = query_claude(prompt)
-                logging.info('Used Claude for batch processing')
-            else:
-                responses = query_flash(prompt)
-                logging.info('Used Flash for batch processing')
-            if not responses:
-                logging.error(
-                    f'Batch {batch_count}: No valid responses received from {LLM_MODEL}'
-                    )
-                handle_failed_batch(conn, records)
-            else:
-                process_batch_response(conn, records, responses)
-            total_processed += len(records)
-            batch_elapsed_time = time.time() - batch_start_time
-            logging.info(
-                f'Batch {batch_count} completed in {batch_elapsed_time:.2f} seconds'
-                )
-            if TEST_MODE:
-                logging.info(
-                    'Test mode enabled. Exiting after processing one batch.')
-                break
-        conn.close()
+        pipeline = batch_pipeline.BatchPipeline('baqr_response', WORK_QUEUE,
+            get_db_connection, lambda records: records, lambda records:
+            generate_questions(records, evidence_data, schema_data,
+            stats_data, pillar_data), process_batch_response,
+            handle_failed_batch, PLANNER.batch_size, max_batches=1 if
+            TEST_MODE else None)
+        report = pipeline.run()
         elapsed_time = time.time() - start_time
         logging.info(
             f'Script completed successfully in {elapsed_time:.2f} seconds')
-        logging.info(f'Total records processed: {total_processed}')
+        logging.info(
+            f"Total records processed: {report['records']} in {report['batches']} batches ({report['records_per_second']} records/sec)"
+            )
+        logging.info(f'Batch planner: {PLANNER.get_stats()}')
     except Exception as e:
         logging.error(f'Script failed with error: {str(e)}')
         logging.error(traceback.format_exc())
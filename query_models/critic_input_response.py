@@ -1,5 +1,6 @@
 import json
 import os
+import sys
 import anthropic
 import mysql.connector
 from mysql.connector import Error
@@ -9,7 +10,12 @@ from datetime import datetime
 import traceback
 from logging.handlers import RotatingFileHandler
 from google import genai
-from google.genai import types
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..'))
+from common import evidence_index
+from common import llm_client
+from common import batch_pipeline
+from common import work_queue
 log_dir = 'logs'
 os.makedirs(log_dir, exist_ok=True)
 log_file = os.path.join(log_dir, 'critic_input_response.log')
@@ -36,12 +42,13 @@ EVIDENCE_FILE_PATH = '../data/all_evidence.json'
 SCHEMA_FILE_PATH = '../data/BIRD_table_schema_info.json'
 TEST_MODE = False
 BATCH_SIZE = 3
+WORK_QUEUE = work_queue.WorkQueue('dataset', 'with_critic_agent_input_status', [
+    'id', 'question_id_from_BIRD', 'question', 'decision'])
 
 
 def load_files():
     try:
-        with open(EVIDENCE_FILE_PATH, 'r') as f:
-            evidence_data = json.load(f)
+        evidence_data = evidence_index.load_index(EVIDENCE_FILE_PATH)
         with open(SCHEMA_FILE_PATH, 'r') as f:
             schema_data = json.load(f)
         return evidence_data, schema_data
@@ -59,44 +66,9 @@ def get_db_connection():
         raise
 
 
-def get_dataset_records(conn, limit=10):
-    try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            "SELECT COUNT(*) as count FROM dataset WHERE with_critic_agent_input_status = 'processing'"
-            )
-        result = cursor.fetchone()
-        if result['count'] > 0:
-            logging.error(
-                "Found records with 'processing' status. Please check for failures in previous runs."
-                )
-            raise Exception("Records with 'processing' status found. Exiting.")
-        cursor.execute(
-            "SELECT id, question_id_from_BIRD, question, decision FROM dataset WHERE with_critic_agent_input_status = 'ready' LIMIT %s"
-            , (limit,))
-        records = cursor.fetchall()
-        if records:
-            ids = [record['id'] for record in records]
-            placeholders = ', '.join(['%s'] * len(ids))
-            cursor.execute(
-                f"UPDATE dataset SET with_critic_agent_input_status = 'processing' WHERE id IN ({placeholders})"
-                , ids)
-            conn.commit()
-        cursor.close()
-        return records
-    except Exception as e:
-        logging.error(f'Error getting dataset records: {str(e)}')
-        raise
-
-
 def prepare_batch_prompt(records, evidence_data, schema_data):
     bird_ids = [record['question_id_from_BIRD'] for record in records]
-    all_relevant_evidence = []
-    for evidence_obj in evidence_data:
-        for evidence_text, question_ids in evidence_obj.items():
-            if any(str(bird_id) in question_ids for bird_id in bird_ids):
-                if evidence_text not in all_relevant_evidence:
-                    all_relevant_evidence.append(evidence_text)
+    all_relevant_evidence = evidence_data.lookup_many(bird_ids)
     dataset_entries = []
     for record in records:
         question_data = json.loads(record['question'])
@@ -157,27 +129,19 @@ def get_flash_response_schema():
 def query_claude(prompt):
     try:
         logging.info('Sending batch request to Claude API using streaming')
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
         prompt_file = f'logs/claude_prompt_{timestamp}.txt'
         with open(prompt_file, 'w', encoding='utf-8') as f:
             f.write(prompt)
         logging.info(f'Full prompt saved to {prompt_file}')
         logging.info(f'PROMPT (truncated):\n{prompt[:1000]}...')
-        response_text = ''
-        thinking_text = ''
-        with CLAUDE_CLIENT.beta.messages.stream(model=
-            'claude-3-7-sonnet-20250219', max_tokens=128000, thinking={
-            'type': 'enabled', 'budget_tokens': 2000}, messages=[{'role':
-            'user', 'content': prompt}], betas=['output-128k-2025-02-19']
-            ) as stream:
-            for event in stream:
-                if event.type == 'content_block_delta':
-                    if event.delta.type == 'thinking_delta':
-                        thinking_text += event.delta.thinking
-                    elif event.delta.type == 'text_delta':
-                        response_text += event.delta.text
-                elif event.type == 'content_block_stop':
-                    logging.info('Content block complete')
+        claude_model = 'claude-3-7-sonnet-20250219'
+        claude_config = {'max_tokens': 128000, 'thinking': {'type':
+            'enabled', 'budget_tokens': 2000}, 'betas': [
+            'output-128k-2025-02-19']}
+        response_text, thinking_text = llm_client.generate_claude(
+            CLAUDE_CLIENT, claude_model, prompt, claude_config, label=
+            'critic_input_response')
         response_file = f'logs/claude_response_{timestamp}.txt'
         thinking_file = f'logs/claude_thinking_{timestamp}.txt'
         with open(response_file, 'w', encoding='utf-8') as f:
@@ -186,34 +150,12 @@ def query_claude(prompt):
             f.write(thinking_text)
         logging.info(f'Full response saved to {response_file}')
         logging.info(f'Full thinking saved to {thinking_file}')
-        try:
-            json_start = response_text.find('```json')
-            if json_start >= 0:
-                json_start += 7
-                json_end = response_text.find('```', json_start)
-                if json_end > json_start:
-                    json_str = response_text[json_start:json_end].strip()
-                    return json.loads(json_str)
-            json_start = response_text.find('```')
-            if json_start >= 0:
-                json_start += 3
-                json_end = response_text.find('```', json_start)
-                if json_end > json_start:
-                    json_str = response_text[json_start:json_end].strip()
-                    return json.loads(json_str)
-            array_start = response_text.find('[')
-            if array_start >= 0:
-                array_end = response_text.rfind(']') + 1
-                if array_end > array_start:
-                    json_str = response_text[array_start:array_end]
-                    return json.loads(json_str)
-            return json.loads(response_text)
-        except json.JSONDecodeError as e:
-            logging.error(f'Error parsing JSON: {str(e)}')
-            logging.error(
-                f"Failed JSON string: {json_str if 'json_str' in locals() else 'Not identified'}"
-                )
+        parsed_response = llm_client.parse_json(response_text)
+        if parsed_response is None:
+            logging.error('Error parsing JSON from Claude response')
+            logging.error(f'Failed JSON string: {response_text[:1000]}')
             return []
+        return parsed_response
     except Exception as e:
         logging.error(f'Error calling Claude API: {str(e)}')
         logging.error(traceback.format_exc())
@@ -224,29 +166,16 @@ def query_flash(content_prompt):
     try:
         logging.info(
             'Sending batch request to Flash (Gemini) API using streaming')
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
         prompt_file = f'logs/flash_prompt_{timestamp}.txt'
         with open(prompt_file, 'w', encoding='utf-8') as f:
             f.write(content_prompt)
         logging.info(f'Full prompt saved to {prompt_file}')
         response_schema = get_flash_response_schema()
-        generate_content_config = types.GenerateContentConfig(temperature=0,
-            top_p=0.95, max_output_tokens=8192, response_modalities=['TEXT'
-            ], safety_settings=[types.SafetySetting(category=
-            'HARM_CATEGORY_HATE_SPEECH', threshold='OFF'), types.
-            SafetySetting(category='HARM_CATEGORY_DANGEROUS_CONTENT',
-            threshold='OFF'), types.SafetySetting(category=
-            'HARM_CATEGORY_SEXUALLY_EXPLICIT', threshold='OFF'), types.
-            SafetySetting(category='HARM_CATEGORY_HARASSMENT', threshold=
-            'OFF')], response_mime_type='application/json', response_schema
-            =response_schema)
-        contents = [types.Content(role='user', parts=[types.Part.from_text(
-            text=content_prompt)])]
-        response_text = ''
-        for chunk in FLASH_CLIENT.models.generate_content_stream(model=
-            FLASH_MODEL, contents=contents, config=generate_content_config):
-            chunk_text = chunk.text if chunk.text else ''
-            response_text += chunk_text
+        generate_content_config = llm_client.flash_config(response_schema)
+        response_text = llm_client.generate_flash(FLASH_CLIENT,
+            FLASH_MODEL, content_prompt, generate_content_config,
+            label='critic_input_response')
         response_file = f'logs/flash_response_{timestamp}.txt'
         with open(response_file, 'w', encoding='utf-8') as f:
             f.write(response_text)
@@ -336,6 +265,8 @@ def insert_revised_questions(conn, dataset_id, critic_assessment,
 
 
 def process_batch_response(conn, records, responses):
+    success_count = 0
+    failure_count = 0
     data_lookup = {}
     for record in records:
         question_data = json.loads(record['question'])
@@ -345,7 +276,7 @@ def process_batch_response(conn, records, responses):
             'bird_id': record['question_id_from_BIRD']}
     if not responses:
         logging.error('No responses to process')
-        return
+        return success_count, failure_count
     logging.info(f'Processing {len(responses)} responses')
     for response in responses:
         try:
@@ -361,6 +292,7 @@ def process_batch_response(conn, records, responses):
                 logging.warning(
                     f'No valid original question for dataset_id {dataset_id}')
                 handle_record_failure(conn, dataset_id)
+                failure_count += 1
                 continue
             original_success = insert_original_question(conn, dataset_id,
                 original_question_text)
@@ -373,8 +305,10 @@ def process_batch_response(conn, records, responses):
                     dataset_id, critic_assessment, data_analyst_response)
             if original_success and revised_success_count > 0:
                 update_record_status(conn, dataset_id, 'success')
+                success_count += 1
             else:
                 handle_record_failure(conn, dataset_id)
+                failure_count += 1
         except Exception as e:
             logging.error(f'Error processing response item: {str(e)}')
             logging.error(traceback.format_exc())
@@ -382,8 +316,10 @@ def process_batch_response(conn, records, responses):
                 dataset_id = response.get('dataset_id')
                 if dataset_id and dataset_id in data_lookup:
                     handle_record_failure(conn, dataset_id)
+                    failure_count += 1
             except:
                 pass
+    return success_count, failure_count
 
 
 def update_record_status(conn, dataset_id, status):
@@ -422,54 +358,24 @@ def handle_failed_batch(conn, records):
 
 def main():
     start_time = time.time()
-    total_processed = 0
     logging.info(
         f'Starting critic_input_response.py script with {LLM_MODEL} model')
     try:
         evidence_data, schema_data = load_files()
         logging.info('Successfully loaded evidence and schema files')
-        conn = get_db_connection()
-        logging.info('Successfully connected to the database')
-        batch_count = 0
-        while True:
-            batch_count += 1
-            batch_start_time = time.time()
-            batch_size = 1 if TEST_MODE else BATCH_SIZE
-            records = get_dataset_records(conn, batch_size)
-            logging.info(
-                f'Batch {batch_count}: Found {len(records)} records to process'
-                )
-            if not records:
-                logging.info('No more records to process. Exiting.')
-                break
-            prompt = prepare_batch_prompt(records, evidence_data, schema_data)
-            if LLM_MODEL == 'CLAUDE':
-                responses = query_claude(prompt)
-                logging.info('Used Claude for batch processing')
-            else:
-                responses = query_flash(prompt)
-                logging.info('Used Flash for batch processing')
-            if not responses:
-                logging.error(
-                    f'Batch {batch_count}: No valid responses received from {LLM_MODEL}'
-                    )
-                handle_failed_batch(conn, records)
-            else:
-                process_batch_response(conn, records, responses)
-            total_processed += len(records)
-            batch_elapsed_time = time.time() - batch_start_time
-            logging.info(
-                f'Batch {batch_count} completed in {batch_elapsed_time:.2f} seconds'
-                )
-            if TEST_MODE:
-                logging.info(
-                    'Test mode enabled. Exiting after processing one batch.')
-                break
-        conn.close()
+        query_model = query_claude if LLM_MODEL == 'CLAUDE' else query_flash
+        pipeline = batch_pipeline.BatchPipeline('critic_input_response', WORK_QUEUE,
+            get_db_connection, lambda records: prepare_batch_prompt(records,
+            evidence_data, schema_data),
+            query_model, process_batch_response, handle_failed_batch, 1 if
+            TEST_MODE else BATCH_SIZE, max_batches=1 if TEST_MODE else None)
+        report = pipeline.run()
         elapsed_time = time.time() - start_time
         logging.info(
             f'Script completed successfully in {elapsed_time:.2f} seconds')
-        logging.info(f'Total records processed: {total_processed}')
+        logging.info(
+            f"Total records processed: {report['records']} in {report['batches']} batches ({report['records_per_second']} records/sec)"
+            )
     except Exception as e:
         logging.error(f'Script failed with error: {str(e)}')
         logging.error(traceback.format_exc())
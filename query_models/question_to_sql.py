@@ -2,8 +2,12 @@ import mysql.connector
 import json
 import logging
 import os
+import sys
 import time
 from datetime import datetime
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..'))
+from common import work_queue
 BATCH_SIZE = 10
 TEST_MODE = False
 DB_CONFIG = {
@@ -21,6 +25,8 @@ logging.basicConfig(level=logging.INFO, format=
     f"question_to_sql_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")),
     logging.StreamHandler()])
 logger = logging.getLogger(__name__)
+WORK_QUEUE = work_queue.WorkQueue('dataset', 'question_to_sql_status', [
+    'id', 'question'], where="t.status = 'active'")
 
 
 def connect_to_db():
@@ -33,40 +39,12 @@ def connect_to_db():
         raise
 
 
-def check_for_processing_records(conn):
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute(
-        "SELECT COUNT(*) as count FROM dataset WHERE question_to_sql_status = 'processing'"
-        )
-    result = cursor.fetchone()
-    cursor.close()
-    if result['count'] > 0:
-        logger.error(
-            f"Found {result['count']} records still in 'processing' state. Exiting."
-            )
-        return False
-    return True
-
-
 def get_datasets_for_processing(conn, batch_size):
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute(
-        "SELECT id, question FROM dataset WHERE status = 'active' AND question_to_sql_status = 'ready' LIMIT %s"
-        , (batch_size,))
-    datasets = cursor.fetchall()
+    datasets = WORK_QUEUE.claim(conn, batch_size)
     if datasets:
-        dataset_ids = [d['id'] for d in datasets]
-        placeholders = ', '.join(['%s'] * len(dataset_ids))
-        update_query = f"""
-        UPDATE dataset 
-        SET question_to_sql_status = 'processing'
-        WHERE id IN ({placeholders})
-        """
-        cursor.execute(update_query, dataset_ids)
-        conn.commit()
         logger.info(
-            f'Marked {len(datasets)} datasets for processing: {dataset_ids}')
-    cursor.close()
+            f"Marked {len(datasets)} datasets for processing: {[d['id'] for d in datasets]}"
+            )
     return datasets
 
 
@@ -127,6 +105,7 @@ def process_batch(conn, batch_size):
         logger.info('No datasets found for processing')
         return 0
     success_count, _ = insert_queries(conn, datasets)
+    WORK_QUEUE.release(conn, [d['id'] for d in datasets])
     return len(datasets)
 
 
@@ -136,9 +115,7 @@ def main():
     logger.info('Starting question_to_sql process')
     try:
         conn = connect_to_db()
-        if not check_for_processing_records(conn):
-            conn.close()
-            return
+        WORK_QUEUE.start_heartbeat(connect_to_db)
         batch_count = 0
         while True:
             batch_count += 1
@@ -164,6 +141,8 @@ def main():
         logger.info(f'Total datasets processed: {total_processed}')
     except Exception as e:
         logger.error(f'Error in main process: {str(e)}')
+    finally:
+        WORK_QUEUE.stop_heartbeat()
 
 
 if __name__ == '__main__':
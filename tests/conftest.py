@@ -0,0 +1,6 @@
+import os
+import sys
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+for path in (REPO_ROOT, os.path.join(REPO_ROOT, 'ui')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,77 @@
+from common import batch_planner
+
+
+def test_salvage_complete_array():
+    assert batch_planner.salvage_json_array('Result: [1, {"a": [2]}] done'
+        ) == ([1, {'a': [2]}], True)
+
+
+def test_salvage_truncated_array():
+    assert batch_planner.salvage_json_array('[{"id": 1}, {"id": 2}, {"id"'
+        ) == ([{'id': 1}, {'id': 2}], False)
+    assert batch_planner.salvage_json_array('[{"id": 1},') == ([{'id': 1}],
+        False)
+
+
+def test_salvage_without_array():
+    assert batch_planner.salvage_json_array('') == ([], False)
+    assert batch_planner.salvage_json_array('{"id": 1}') == ([], False)
+
+
+def test_batch_size_follows_output_budget():
+    planner = batch_planner.BatchPlanner('test', 1000, 100, headroom=0.9)
+    assert planner.batch_size() == 9
+    planner = batch_planner.BatchPlanner('test', 1000, 100, headroom=0.9,
+        max_records=4)
+    assert planner.batch_size() == 4
+
+
+def test_pack_respects_input_budget():
+    planner = batch_planner.BatchPlanner('test', 1000, 10, input_budget=100)
+    batches = planner.pack(list(range(5)), record_tokens=lambda record: 40,
+        base_tokens=10)
+    assert batches == [[0, 1], [2, 3], [4]]
+
+
+def records(count):
+    return [{'id': index} for index in range(count)]
+
+
+def test_truncated_batch_is_split_and_resent():
+    calls = []
+
+    def call(batch):
+        calls.append([record['id'] for record in batch])
+        kept = batch[:2]
+        return [{'dataset_id': record['id']} for record in kept], len(batch
+            ) > 2, 10 * len(kept)
+    planner = batch_planner.BatchPlanner('test', 1000, 10)
+    responses = planner.submit(records(6), call)
+    assert sorted(response['dataset_id'] for response in responses) == list(
+        range(6))
+    assert calls[0] == list(range(6))
+    assert calls[1:] == [[2, 3], [4, 5]]
+    assert planner.get_stats()['unrecovered_records'] == 0
+
+
+def test_empty_untruncated_response_is_not_retried():
+    calls = []
+
+    def call(batch):
+        calls.append(batch)
+        return [], False, 0
+    planner = batch_planner.BatchPlanner('test', 1000, 10)
+    assert planner.submit(records(4), call) == []
+    assert len(calls) == 1
+    assert planner.get_stats()['unrecovered_records'] == 4
+
+
+def test_splitting_stops_at_max_depth():
+    calls = []
+
+    def call(batch):
+        calls.append(len(batch))
+        return [], True, 0
+    planner = batch_planner.BatchPlanner('test', 1000, 10, max_splits=1)
+    planner.submit(records(8), call)
+    assert calls == [8, 4, 4]
@@ -0,0 +1,42 @@
+import json
+from common import json_stream
+RESPONSE = json.dumps({'primary_question': {'question': 'a {b} "c" [d]'},
+    'refinement_questions': [{'question': 'q1', 'pillar': 'p\\1'}, {
+    'question': 'q2, [x]', 'pillar': '}'}]})
+PATH = 'refinement_questions', '*'
+
+
+def chunked(text, size):
+    return [text[start:start + size] for start in range(0, len(text), size)]
+
+
+def test_elements_are_emitted_at_any_chunk_size():
+    expected = json.loads(RESPONSE)['refinement_questions']
+    for size in (1, 3, 7, len(RESPONSE)):
+        parser = json_stream.parse_chunks(chunked(RESPONSE, size), PATH)
+        assert parser.values(PATH) == expected
+        assert parser.complete
+        assert parser.finish() == json.loads(RESPONSE)
+
+
+def test_element_is_emitted_by_the_chunk_that_closes_it():
+    parser = json_stream.JsonStreamParser(PATH)
+    closing = RESPONSE.index('}', RESPONSE.index('q1')) + 1
+    assert parser.feed(RESPONSE[:closing - 1]) == []
+    assert parser.feed(RESPONSE[closing - 1:closing]) == [((
+        'refinement_questions', 0), {'question': 'q1', 'pillar': 'p\\1'})]
+
+
+def test_truncated_response_keeps_finished_elements():
+    cut = RESPONSE[:RESPONSE.index('q2')]
+    parser = json_stream.parse_chunks(chunked(cut, 5), PATH)
+    assert [value['question'] for value in parser.values()] == ['q1']
+    assert not parser.complete
+    assert parser.finish() is None
+
+
+def test_wildcard_matches_only_its_depth():
+    seen = []
+    json_stream.parse_chunks(['[[1, 2], {"a"', ': [3]}]'], ('*',),
+        on_element=lambda path, value: seen.append((path, value)))
+    assert seen == [((0,), [1, 2]), ((1,), {'a': [3]})]
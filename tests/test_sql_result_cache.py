@@ -0,0 +1,87 @@
+from services import sql_result_cache
+
+
+def test_canonicalize_ignores_spelling():
+    assert sql_result_cache.canonicalize(
+        'SELECT  name\nFROM [Users] -- all\nWHERE id = 1;;'
+        ) == sql_result_cache.canonicalize(
+        'select name from `Users` where id=1 /* c */')
+
+
+def test_identifiers_keep_their_case():
+    assert sql_result_cache.canonicalize('SELECT Name FROM t WHERE ID = 1'
+        ) == 'select Name from t where ID = 1'
+
+
+def test_result_column_spelling_is_part_of_the_key():
+    key = sql_result_cache.make_key('SELECT Name, COUNT(*) AS Total FROM t',
+        'db')
+    assert key != sql_result_cache.make_key(
+        'select name, count(*) as total from t', 'db')
+    assert sql_result_cache.make_key('SELECT a+b FROM t', 'db'
+        ) != sql_result_cache.make_key('SELECT a + b FROM t', 'db')
+    assert key == sql_result_cache.make_key(
+        'SELECT Name, COUNT(*) AS Total\n  from t;', 'db')
+
+
+def test_result_columns_of_the_leading_select():
+    assert sql_result_cache.result_columns(
+        'WITH x AS (SELECT a FROM t) SELECT a+1, (SELECT 2 FROM u) FROM x'
+        ) == 'a+1, (SELECT 2 FROM u)'
+    assert sql_result_cache.result_columns('SELECT 1 ;') == '1'
+    assert sql_result_cache.result_columns('VALUES (1)') == ''
+
+
+def test_double_quoted_word_differs_from_bare_word():
+    quoted = sql_result_cache.canonicalize(
+        'SELECT * FROM t WHERE status = "active"')
+    bare = sql_result_cache.canonicalize(
+        'SELECT * FROM t WHERE status = active')
+    assert quoted != bare
+    assert quoted == 'select * from t where status = "active"'
+
+
+def test_quoted_names_that_are_not_plain_keep_their_kind():
+    assert sql_result_cache.canonicalize('SELECT [a b] FROM t'
+        ) == 'select `a b` from t'
+    assert sql_result_cache.canonicalize('SELECT "a b" FROM t'
+        ) == 'select "a b" from t'
+
+
+def test_string_literals_keep_case():
+    assert sql_result_cache.canonicalize("SELECT 'Active'"
+        ) != sql_result_cache.canonicalize("SELECT 'active'")
+
+
+def test_nondeterministic_sql_has_no_key():
+    for sql_query in ('SELECT * FROM t ORDER BY RANDOM()',
+        "SELECT date('now')", 'SELECT CURRENT_TIMESTAMP',
+        "SELECT strftime('%Y', 'NOW')", 'SELECT date()', 'SELECT TIME ( )',
+        'SELECT datetime()', "SELECT strftime('%Y')", 'SELECT julianday()'):
+        assert sql_result_cache.make_key(sql_query, 'db') is None
+    for sql_query in ('SELECT random_col FROM t',
+        "SELECT date('2020-01-01')", "SELECT strftime('%Y', opened) FROM t",
+        'SELECT date(opened) FROM t'):
+        assert sql_result_cache.make_key(sql_query, 'db') is not None
+
+
+def test_key_depends_on_database_and_options():
+    key = sql_result_cache.make_key('SELECT 1', ['db', 1], 100)
+    assert key == sql_result_cache.make_key('select 1;', ['db', 1], 100)
+    assert key != sql_result_cache.make_key('SELECT 1', ['db', 2], 100)
+    assert key != sql_result_cache.make_key('SELECT 1', ['db', 1], 10)
+
+
+def test_put_get_and_lru_eviction(monkeypatch):
+    monkeypatch.setattr(sql_result_cache, 'SQL_RESULT_CACHE_ENTRIES', 2)
+    sql_result_cache.clear()
+    try:
+        for key in ('a', 'b'):
+            assert sql_result_cache.put(key, ['x'], [(1,)], {'m': key})
+        assert sql_result_cache.get('a') == (['x'], [(1,)], {'m': 'a'})
+        sql_result_cache.put('c', ['x'], [(3,)], {})
+        assert sql_result_cache.get('b') is None
+        assert sql_result_cache.get('a') is not None
+        assert sql_result_cache.put(None, ['x'], [], {}) is False
+    finally:
+        sql_result_cache.clear()
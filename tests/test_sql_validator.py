@@ -0,0 +1,80 @@
+from common import sql_validator
+SCHEMA = {'frpm':
+    """original_column_name,data_format
+CDSCode,integer
+County Name,text
+Free Meal Count,real
+"""
+    , 'schools': """original_column_name,data_format
+CDSCode,text
+City,text
+"""}
+
+
+def validate(sql_query, schema=SCHEMA):
+    return sql_validator.SqlValidator(schema).validate(sql_query)
+
+
+def test_edit_distance():
+    assert sql_validator.edit_distance('kitten', 'sitting', 5) == 3
+    assert sql_validator.edit_distance('city', 'city', 1) == 0
+    assert sql_validator.edit_distance('abc', 'abcdefgh', 2) == 3
+
+
+def test_misspelled_table_is_repaired():
+    result = validate('SELECT COUNT(*) FROM scools')
+    assert result.sql == 'SELECT COUNT(*) FROM "schools"'
+    assert result.fixes[0]['reason'] == 'edit_distance'
+
+
+def test_misspelled_column_is_repaired():
+    result = validate('SELECT Citty FROM schools')
+    assert result.sql == 'SELECT "City" FROM schools'
+    assert result.issues == []
+
+
+def test_qualified_column_resolves_through_alias():
+    result = validate(
+        'SELECT s.Citty FROM schools AS s JOIN frpm f ON s.CDSCode = f.cdscode'
+        )
+    assert result.sql == (
+        'SELECT s."City" FROM schools AS s JOIN frpm f ON s.CDSCode = f.cdscode'
+        )
+    assert result.fixes[0]['table'] == 'schools'
+
+
+def test_names_that_differ_only_in_case_are_left_alone():
+    result = validate('SELECT cdscode FROM schools')
+    assert result.sql == 'SELECT cdscode FROM schools'
+    assert not result.fixed
+
+
+def test_unquoted_multi_word_column_is_quoted():
+    result = validate('SELECT County Name FROM frpm')
+    assert result.sql == 'SELECT "County Name" FROM frpm'
+    assert result.fixes[0]['reason'] == 'unquoted_spaces'
+
+
+def test_unknown_column_is_reported_not_rewritten():
+    result = validate('SELECT zzz FROM schools')
+    assert result.sql == 'SELECT zzz FROM schools'
+    assert result.issues[0]['kind'] == 'unknown_column'
+
+
+def test_double_quoted_word_is_not_repaired_by_distance():
+    result = validate('SELECT "Citty" FROM schools')
+    assert result.sql == 'SELECT "Citty" FROM schools'
+    assert result.fixes == [] and result.issues == []
+
+
+def test_tie_between_candidates_is_not_guessed():
+    schema = {'t': 'original_column_name\nabc1\nabc2\n'}
+    result = validate('SELECT abc3 FROM t', schema)
+    assert result.sql == 'SELECT abc3 FROM t'
+    assert sorted(result.issues[0]['suggestions']) == ['abc1', 'abc2']
+
+
+def test_cte_columns_are_not_flagged():
+    result = validate(
+        'WITH t AS (SELECT City AS town FROM schools) SELECT town FROM t')
+    assert result.fixes == [] and result.issues == []
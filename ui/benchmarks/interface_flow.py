@@ -0,0 +1,589 @@
+import argparse
+import http.client
+import http.cookiejar
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import statistics
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from benchmarks import mysql_shim
+from services import db_pool
+from common import llm_fake
+SCHEMA_FILE_PATH = '../data/BIRD_table_schema_info.json'
+USER_ID_PATTERN = re.compile('window\\.userId\\s*=\\s*"(\\d+)"')
+ENDPOINTS = ('interface', 'nl_to_sql', 'suggestions', 'process_selected',
+    'analysis')
+SERVER_STATS = ('db-pool', 'llm-client', 'singleflight', 'sql-sandbox',
+    'jobs')
+SSE_CONNECT_TIMEOUT_SECONDS = 5.0
+MAX_ERROR_SAMPLES = 5
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def summarize(seconds):
+    values = [value * 1000 for value in seconds]
+    return {'p50_ms': percentile(values, 50), 'p95_ms': percentile(values,
+        95), 'p99_ms': percentile(values, 99), 'mean_ms': statistics.mean(
+        values) if values else 0.0, 'max_ms': max(values) if values else 0.0}
+
+
+class Recorder:
+    """Thread-safe collection of request, SSE and flow measurements."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {name: [] for name in ENDPOINTS}
+        self.status_codes = {name: {} for name in ENDPOINTS}
+        self.errors = {name: [] for name in ENDPOINTS}
+        self.sse = {'subscriptions': 0, 'connect_errors': 0, 'events': 0,
+            'suggestion_events': 0, 'server_timeouts': 0}
+        self.sse_connect = []
+        self.sse_lag = []
+        self.first_suggestion = []
+        self.flows = {'started': 0, 'completed': 0, 'failed': 0,
+            'dropped_arrivals': 0}
+        self.flow_seconds = []
+        self.flow_errors = []
+        self.peak_active = 0
+
+    def request(self, endpoint, seconds, status, error=None):
+        with self._lock:
+            self.requests[endpoint].append((seconds, error is None))
+            codes = self.status_codes[endpoint]
+            codes[str(status)] = codes.get(str(status), 0) + 1
+            if error is not None and len(self.errors[endpoint]
+                ) < MAX_ERROR_SAMPLES:
+                self.errors[endpoint].append(error)
+
+    def flow_error(self, error):
+        with self._lock:
+            if len(self.flow_errors) < MAX_ERROR_SAMPLES:
+                self.flow_errors.append(error)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            if name in self.flows:
+                self.flows[name] += amount
+            else:
+                self.sse[name] += amount
+
+    def sample(self, series, value):
+        with self._lock:
+            series.append(value)
+
+    def report(self, elapsed):
+        with self._lock:
+            endpoints = {}
+            total_requests = 0
+            for name, samples in self.requests.items():
+                failures = sum(1 for _, ok in samples if not ok)
+                total_requests += len(samples)
+                endpoints[name] = dict(summarize([seconds for seconds, _ in
+                    samples]), requests=len(samples), errors=failures,
+                    error_rate=failures / len(samples) if samples else 0.0,
+                    status_codes=dict(self.status_codes[name]),
+                    error_samples=list(self.errors[name]))
+            sse = dict(self.sse)
+            sse['connect'] = summarize(self.sse_connect)
+            sse['lag'] = summarize(self.sse_lag)
+            sse['first_suggestion_after_request'] = summarize(self.
+                first_suggestion)
+            sse['connect_error_rate'] = sse['connect_errors'] / sse[
+                'subscriptions'] if sse['subscriptions'] else 0.0
+            flows = dict(self.flows)
+            flows.update(summarize(self.flow_seconds))
+            flows['completed_per_second'] = flows['completed'
+                ] / elapsed if elapsed else 0.0
+            flows['error_rate'] = flows['failed'] / flows['started'
+                ] if flows['started'] else 0.0
+            flows['peak_active'] = self.peak_active
+            flows['error_samples'] = list(self.flow_errors)
+        return {'elapsed_seconds': round(elapsed, 3), 'throughput': {
+            'requests': total_requests, 'requests_per_second':
+            total_requests / elapsed if elapsed else 0.0}, 'flows': flows,
+            'endpoints': endpoints, 'sse': sse}
+
+
+class Subscriber:
+    """One EventSource-style SSE connection, measuring delivery lag.
+
+    Lag is the time between the server's update timestamp and the moment
+    the event was read; both clocks are the local machine's, so run the
+    harness on the same host as the app (or against --url on it).
+    """
+
+    def __init__(self, recorder, base_url, operation, stream_id, cookie):
+        self.recorder = recorder
+        self.operation = operation
+        self.events = []
+        self.connected = threading.Event()
+        self.closed = threading.Event()
+        self._conn = None
+        parsed = urllib.parse.urlsplit(base_url)
+        self._host = parsed.hostname
+        self._port = parsed.port or 80
+        self._path = f'/api/stream/{operation}/{stream_id}'
+        self._cookie = cookie
+        self._opened_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name=
+            f'sse-{operation}', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        self.recorder.count('subscriptions')
+        try:
+            self._conn = http.client.HTTPConnection(self._host, self._port,
+                timeout=None)
+            headers = {'Accept': 'text/event-stream'}
+            if self._cookie:
+                headers['Cookie'] = self._cookie
+            self._conn.request('GET', self._path, headers=headers)
+            response = self._conn.getresponse()
+            if response.status != 200:
+                self.recorder.count('connect_errors')
+                return
+            event_name = None
+            while True:
+                line = response.readline()
+                if not line:
+                    break
+                line = line.decode('utf-8').rstrip('\r\n')
+                if line.startswith('event:'):
+                    event_name = line[6:].strip()
+                elif line.startswith('data:'):
+                    self._on_data(event_name, line[5:].strip())
+                elif not line:
+                    event_name = None
+        except (OSError, http.client.HTTPException):
+            if not self.connected.is_set() and not self.closed.is_set():
+                self.recorder.count('connect_errors')
+        finally:
+            self.connected.set()
+            self.closed.set()
+
+    def _on_data(self, event_name, data):
+        received_at = time.time()
+        try:
+            update = json.loads(data)
+        except ValueError:
+            return
+        if event_name == 'connected':
+            self.recorder.sample(self.recorder.sse_connect, time.monotonic(
+                ) - self._opened_at)
+            self.connected.set()
+            return
+        if event_name == 'close':
+            if update.get('status') == 'timeout':
+                self.recorder.count('server_timeouts')
+            return
+        self.events.append((received_at, update))
+        self.recorder.count('events')
+        if update.get('status') == 'suggestion':
+            self.recorder.count('suggestion_events')
+        if 'timestamp' in update:
+            self.recorder.sample(self.recorder.sse_lag, max(received_at -
+                update['timestamp'], 0.0))
+
+    def wait_connected(self, timeout=SSE_CONNECT_TIMEOUT_SECONDS):
+        return self.connected.wait(timeout)
+
+    def close(self, grace=0.0):
+        """Stop reading after `grace` seconds (sooner if the server closed)."""
+        self.closed.wait(grace)
+        conn = self._conn
+        if conn is not None and conn.sock is not None:
+            try:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._thread.join(timeout=5)
+        if conn is not None:
+            conn.close()
+
+
+class Participant:
+    """One simulated study participant with their own session cookie."""
+
+    def __init__(self, index, base_url, recorder, args, scenario, rng):
+        self.index = index
+        self.base_url = base_url.rstrip('/')
+        self.recorder = recorder
+        self.args = args
+        self.scenario = scenario
+        self.rng = rng
+        self.jar = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.
+            HTTPCookieProcessor(self.jar))
+        self.user_id = None
+
+    def cookie_header(self):
+        request = urllib.request.Request(self.base_url + '/')
+        self.jar.add_cookie_header(request)
+        return request.get_header('Cookie')
+
+    def think(self):
+        sampler = llm_fake.parse_latency(self.args.think_time)
+        if sampler is not None:
+            time.sleep(max(sampler(self.rng), 0.0))
+
+    def call(self, endpoint, path, payload=None):
+        """(status, body) of one request, recorded under `endpoint`."""
+        data = None
+        headers = {}
+        if payload is not None:
+            data = json.dumps(payload).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        request = urllib.request.Request(self.base_url + path, data=data,
+            headers=headers)
+        started_at = time.monotonic()
+        status = 0
+        body = b''
+        error = None
+        try:
+            with self.opener.open(request, timeout=self.args.request_timeout
+                ) as response:
+                status = response.status
+                body = response.read()
+        except urllib.error.HTTPError as e:
+            status = e.code
+            body = e.read()
+            error = f'HTTP {e.code}: {body[:200].decode(errors="replace")}'
+        except (OSError, http.client.HTTPException) as e:
+            error = f'{type(e).__name__}: {str(e)}'
+        seconds = time.monotonic() - started_at
+        if error is None and path.startswith('/api/'):
+            try:
+                parsed = json.loads(body)
+            except ValueError:
+                parsed = None
+            if not isinstance(parsed, dict) or parsed.get('success') is False:
+                error = f'Unsuccessful response: {body[:200].decode(errors="replace")}'
+        self.recorder.request(endpoint, seconds, status, error)
+        return status, body, error
+
+    def subscribe(self, operation, stream_id):
+        subscriber = Subscriber(self.recorder, self.base_url, operation,
+            stream_id, self.cookie_header())
+        subscriber.wait_connected()
+        return subscriber
+
+    def close_all(self, subscribers):
+        for subscriber in subscribers:
+            subscriber.close(self.args.sse_grace)
+
+    def run(self):
+        """Run one flow; True when every step succeeded."""
+        _, body, error = self.call('interface', '/interface?auto_user=1')
+        match = USER_ID_PATTERN.search(body.decode('utf-8', errors='replace')
+            ) if error is None else None
+        if not match:
+            return False
+        self.user_id = int(match.group(1))
+        self.think()
+        stream_id = f'{self.user_id}_{int(time.time() * 1000)}'
+        form = {'dataset_id': '', 'user_id': self.user_id, 'question':
+            self.scenario['question'], 'decision': self.scenario['decision'
+            ], 'streaming_id': stream_id}
+        subscribers = [self.subscribe('nl_to_sql', stream_id), self.
+            subscribe('suggestions', stream_id)]
+        results = {}
+        requested_at = time.time()
+
+        def post(endpoint, path):
+            results[endpoint] = self.call(endpoint, path, form)
+        threads = [threading.Thread(target=post, args=(endpoint, path)) for
+            endpoint, path in (('nl_to_sql', '/api/nl-to-sql'), (
+            'suggestions', '/api/suggestions'))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.close_all(subscribers)
+        suggestion_times = [received_at for received_at, update in
+            subscribers[1].events if update.get('status') == 'suggestion']
+        if suggestion_times:
+            self.recorder.sample(self.recorder.first_suggestion, min(
+                suggestion_times) - requested_at)
+        if any(result[2] is not None for result in results.values()):
+            return False
+        dataset_id = json.loads(results['nl_to_sql'][1]).get('dataset_id')
+        suggestions = json.loads(results['suggestions'][1]).get('suggestions'
+            ) or []
+        if not dataset_id or not suggestions:
+            return False
+        self.think()
+        selected = [{key: suggestion.get(key, '') for key in ('question',
+            'pillar', 'component', 'purpose', 'rationale')} for suggestion in
+            suggestions[:self.args.select]]
+        subscriber = self.subscribe('process_selected_suggestions', dataset_id)
+        _, _, error = self.call('process_selected',
+            '/api/suggestions/process-selected', {'dataset_id': dataset_id,
+            'user_id': self.user_id, 'selected_suggestions': selected})
+        self.close_all([subscriber])
+        if error is not None:
+            return False
+        self.think()
+        subscriber = self.subscribe('analysis', dataset_id)
+        _, _, error = self.call('analysis', f'/api/analysis/{dataset_id}')
+        self.close_all([subscriber])
+        return error is None
+
+
+def load_scenarios(path, app_db_path):
+    """Questions from a JSON file, else the app's seeded dataset rows."""
+    if path:
+        with open(path, 'r') as f:
+            return [{'question': item['question'], 'decision': item.get(
+                'decision', '')} for item in json.load(f)]
+    conn = mysql_shim.ShimConnection(app_db_path)
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute('SELECT question, decision FROM dataset ORDER BY id')
+    scenarios = []
+    for row in cursor.fetchall():
+        question = json.loads(row['question'] or '{}').get('text')
+        if question:
+            scenarios.append({'question': question, 'decision': json.loads(
+                row['decision'] or '{}').get('text', '')})
+    conn.close()
+    return scenarios
+
+
+def seed_recordings(schema_data, suggestions, analysis_chars):
+    """Stand-in responses for every interface call, keyed by label.
+
+    Replay runs with LLM_FAKE_ON_MISS=label, so each prompt is answered by
+    the recording for its endpoint. The SQL reads the first table of the
+    fixture BIRD database, so it validates and executes like a real one.
+    """
+    from services import analysis_service
+    from services import nl_to_sql_service
+    table_name = next(iter(schema_data))
+    column_name = mysql_shim._schema_columns(schema_data[table_name])[0][0]
+    sql = {'thought_process': f'Count the rows of {table_name} per value.',
+        'sql_query':
+        f'SELECT "{column_name}", COUNT(*) AS total_count FROM "{table_name}" GROUP BY "{column_name}" ORDER BY total_count DESC LIMIT 10'
+        , 'explanation': f'Groups {table_name} by {column_name}.'}
+    refinements = [{'question':
+        f'How does {column_name} vary across {table_name} (angle {index + 1})?'
+        , 'pillar': 'Dataset Schema-Based Patterns', 'component':
+        'Distribution Check', 'purpose':
+        'Checks whether the answer holds across the data.', 'rationale':
+        'A skewed distribution changes how the main answer should be read.'
+        } for index in range(suggestions)]
+    suggestion_response = {'primary_question': {'question':
+        f'How many rows does {table_name} have per {column_name}?',
+        'explanation': 'Answers the question directly.'},
+        'refinement_questions': refinements}
+    sentence = 'The query results support a cautious reading of the decision. '
+    detail = sentence * max(1, analysis_chars // len(sentence))
+    analysis = {model: {'summary': sentence.strip(), 'detailed_analysis':
+        detail} for model in ('question_to_sql', 'baqr')}
+    for label, model, response in (('nl_to_sql', nl_to_sql_service.
+        FLASH_MODEL, sql), ('suggestion_sql', nl_to_sql_service.FLASH_MODEL,
+        sql), ('suggestions', nl_to_sql_service.FLASH_MODEL,
+        suggestion_response), ('analysis', analysis_service.MODEL, analysis)):
+        llm_fake.record(f'seed-{label}', model, label, None, json.dumps(
+            response))
+
+
+def start_app(args, work_dir):
+    """Run the app in-process against the SQLite shim and replayed LLM."""
+    os.environ.setdefault('GOOGLE_GENAI_USE_VERTEXAI', 'true')
+    os.environ.setdefault('GOOGLE_CLOUD_PROJECT', 'load-test')
+    os.environ.setdefault('GOOGLE_CLOUD_LOCATION', 'us-central1')
+    with open(SCHEMA_FILE_PATH, 'r') as f:
+        schema_data = json.load(f)
+    app_db_path = os.path.join(work_dir, 'app.sqlite')
+    mysql_shim.build_app_database(app_db_path)
+    bird_path = args.bird_db
+    if not bird_path:
+        bird_path = os.path.join(work_dir, 'bird.sqlite')
+        mysql_shim.build_bird_fixture(bird_path, schema_data, args.
+            fixture_rows)
+    llm_fake.MODE = 'replay'
+    llm_fake.STORE_PATH = args.recordings or os.path.join(work_dir,
+        'recordings.sqlite')
+    llm_fake.ON_MISS = args.on_miss
+    llm_fake.LATENCY = args.llm_latency
+    llm_fake.CHUNK_CHARS = args.chunk_chars
+    llm_fake.ERROR_RATE = args.llm_error_rate
+    llm_fake.SEED = str(args.seed)
+    import healthcheck
+    from werkzeug.serving import make_server
+    from services import nl_to_sql_service
+    from services import sql_sandbox
+    from services import suggestions_service
+    if not args.recordings:
+        seed_recordings(schema_data, args.suggestions, args.analysis_chars)
+    db_pool.configure(pool_size=args.db_pool_size, connector=mysql_shim.
+        ShimConnector(app_db_path))
+    nl_to_sql_service.SQLITE_DB_PATH = bird_path
+    suggestions_service.SQLITE_DB_PATH = bird_path
+    sql_sandbox.warm_up(bird_path)
+    server = make_server('127.0.0.1', args.port, healthcheck.app, threaded
+        =True)
+    threading.Thread(target=server.serve_forever, name='load-test-app',
+        daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server, app_db_path
+
+
+def fetch_server_stats(base_url):
+    stats = {}
+    for name in SERVER_STATS:
+        try:
+            with urllib.request.urlopen(f'{base_url}/api/{name}/stats',
+                timeout=10) as response:
+                stats[name] = json.loads(response.read())
+        except (OSError, ValueError) as e:
+            stats[name] = {'error': str(e)}
+    return stats
+
+
+def run_load(base_url, recorder, args, scenarios):
+    """Start participants on the arrival schedule and wait for them."""
+    rng = random.Random(args.seed)
+    active = []
+    active_lock = threading.Lock()
+    started_at = time.monotonic()
+
+    def participant(index):
+        flow_start = time.monotonic()
+        try:
+            ok = Participant(index, base_url, recorder, args, rng.choice(
+                scenarios), random.Random(f'{args.seed}:{index}')).run()
+        except Exception as e:
+            ok = False
+            recorder.flow_error(f'{type(e).__name__}: {str(e)}')
+        if ok:
+            recorder.count('completed')
+            recorder.sample(recorder.flow_seconds, time.monotonic() -
+                flow_start)
+        else:
+            recorder.count('failed')
+    index = 0
+    next_arrival = started_at
+    while index < args.participants and (not args.duration or time.
+        monotonic() - started_at < args.duration):
+        delay = next_arrival - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        with active_lock:
+            active[:] = [thread for thread in active if thread.is_alive()]
+            if len(active) >= args.max_active:
+                recorder.count('dropped_arrivals')
+                thread = None
+            else:
+                thread = threading.Thread(target=participant, args=(index,),
+                    name=f'participant-{index}', daemon=True)
+                active.append(thread)
+                recorder.peak_active = max(recorder.peak_active, len(active))
+        if thread is not None:
+            recorder.count('started')
+            thread.start()
+        index += 1
+        gap = 1.0 / args.arrival_rate
+        next_arrival += rng.expovariate(args.arrival_rate
+            ) if args.arrivals == 'poisson' else gap
+    deadline = time.monotonic() + args.drain_timeout
+    for thread in list(active):
+        thread.join(timeout=max(deadline - time.monotonic(), 0))
+    return time.monotonic() - started_at
+
+
+def main():
+    parser = argparse.ArgumentParser(description=
+        'Drive the participant flow (interface, nl-to-sql, suggestions, process-selected, analysis) with SSE subscribers and report latency'
+        )
+    parser.add_argument('--url', help=
+        'Load-test a running app instead of starting one in-process')
+    parser.add_argument('--participants', type=int, default=20)
+    parser.add_argument('--arrival-rate', type=float, default=1.0, help=
+        'Participants started per second')
+    parser.add_argument('--arrivals', choices=('poisson', 'constant'),
+        default='poisson')
+    parser.add_argument('--duration', type=float, default=0, help=
+        'Stop starting participants after this many seconds (0: no limit)')
+    parser.add_argument('--max-active', type=int, default=200, help=
+        'Arrivals beyond this many running flows are dropped and counted')
+    parser.add_argument('--think-time', default='uniform:0.5,2', help=
+        "Pause between steps, as an LLM_FAKE_LATENCY spec ('none' to skip)")
+    parser.add_argument('--select', type=int, default=3, help=
+        'Suggestions each participant sends to process-selected')
+    parser.add_argument('--sse-grace', type=float, default=1.0, help=
+        'Seconds to keep a stream open after its request returns')
+    parser.add_argument('--request-timeout', type=float, default=300)
+    parser.add_argument('--drain-timeout', type=float, default=600)
+    parser.add_argument('--questions', help=
+        'JSON list of {"question", "decision"} objects (default: dataset rows)'
+        )
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--db-pool-size', type=int, default=10)
+    parser.add_argument('--bird-db', help=
+        'BIRD SQLite file (default: a generated fixture)')
+    parser.add_argument('--fixture-rows', type=int, default=2000)
+    parser.add_argument('--recordings', help=
+        'LLM recordings from LLM_FAKE_MODE=record (default: generated stand-ins)'
+        )
+    parser.add_argument('--on-miss', default='label', choices=('label',
+        'error'))
+    parser.add_argument('--llm-latency', default=llm_fake.LATENCY)
+    parser.add_argument('--chunk-chars', type=int, default=llm_fake.
+        CHUNK_CHARS)
+    parser.add_argument('--llm-error-rate', type=float, default=llm_fake.
+        ERROR_RATE)
+    parser.add_argument('--suggestions', type=int, default=5, help=
+        'Refinement questions in the generated suggestions response')
+    parser.add_argument('--analysis-chars', type=int, default=4000)
+    parser.add_argument('--run-label', default='', help=
+        'Name stored in the report, for comparing runs')
+    parser.add_argument('--output', help='Also write the report to this file'
+        )
+    args = parser.parse_args()
+    work_dir = tempfile.mkdtemp(prefix='interface_flow_')
+    server = None
+    try:
+        if args.url:
+            base_url = args.url.rstrip('/')
+            scenarios = load_scenarios(args.questions, None
+                ) if args.questions else None
+            if not scenarios:
+                parser.error('--questions is required with --url')
+        else:
+            base_url, server, app_db_path = start_app(args, work_dir)
+            scenarios = load_scenarios(args.questions, app_db_path)
+        recorder = Recorder()
+        elapsed = run_load(base_url, recorder, args, scenarios)
+        report = {'run_label': args.run_label, 'base_url': base_url,
+            'in_process': server is not None, 'config': {key: value for
+            key, value in vars(args).items() if key not in ('output',)}}
+        report.update(recorder.report(elapsed))
+        report['server'] = fetch_server_stats(base_url)
+    finally:
+        if server is not None:
+            server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    output = json.dumps(report, indent=2, default=str)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+import csv
+import io
+import os
+import random
+import re
+import sqlite3
+import threading
+SETUP_SQL_PATH = '../data/database_setup.sql'
+PLACEHOLDER_PATTERN = re.compile('%([s%])')
+ENUM_PATTERN = re.compile('\\benum\\([^)]*\\)', re.IGNORECASE)
+COLUMN_TYPES = {'integer': 'INTEGER', 'real': 'REAL', 'date': 'TEXT',
+    'datetime': 'TEXT'}
+
+
+def _translate_create(statement):
+    """SQLite form of one MySQL CREATE TABLE from database_setup.sql."""
+    lines = statement.strip().splitlines()
+    header = lines[0]
+    items = []
+    auto_column = None
+    for line in lines[1:]:
+        item = line.strip().rstrip(',')
+        if not item or item.startswith(')'):
+            continue
+        upper = item.upper()
+        if upper.startswith('PRIMARY KEY'):
+            if auto_column is None:
+                items.append(item)
+        elif upper.startswith('UNIQUE KEY'):
+            items.append('UNIQUE ' + item[item.index('('):])
+        elif upper.startswith(('KEY ', 'CONSTRAINT ', 'INDEX ')):
+            continue
+        elif 'AUTO_INCREMENT' in upper:
+            auto_column = item.split()[0]
+            items.append(f'{auto_column} INTEGER PRIMARY KEY AUTOINCREMENT')
+        else:
+            item = ENUM_PATTERN.sub('TEXT', item)
+            item = re.sub('\\bjson\\b', 'TEXT', item)
+            item = item.replace(' ON UPDATE CURRENT_TIMESTAMP', '')
+            item = re.sub('(?<!NOT) NULL DEFAULT', ' DEFAULT', item)
+            items.append(item)
+    return header + '\n  ' + ',\n  '.join(items) + '\n)'
+
+
+def translate_setup_sql(text):
+    """SQLite statements for a MySQL dump such as data/database_setup.sql."""
+    statements = []
+    buffer = ''
+    for line in text.splitlines():
+        if not buffer and (not line.strip() or line.startswith('--')):
+            continue
+        buffer += line + '\n'
+        if not sqlite3.complete_statement(buffer):
+            continue
+        statement = buffer.strip()
+        buffer = ''
+        if statement.upper().startswith('SET '):
+            continue
+        if statement.upper().startswith('CREATE TABLE'):
+            statement = _translate_create(statement)
+        statements.append(statement)
+    return statements
+
+
+def build_app_database(path, setup_sql_path=SETUP_SQL_PATH):
+    """Create the app's tables (and seed rows) in a SQLite file."""
+    with open(setup_sql_path, 'r', encoding='utf-8') as f:
+        statements = translate_setup_sql(f.read())
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    for statement in statements:
+        conn.execute(statement)
+    conn.commit()
+    conn.close()
+
+
+def _schema_columns(table_csv):
+    columns = []
+    try:
+        for row in csv.DictReader(io.StringIO(table_csv)):
+            name = (row.get('original_column_name') or '').strip()
+            if name and name.lower() not in {column.lower() for column, _ in
+                columns}:
+                data_format = (row.get('data_format') or '').strip().lower()
+                columns.append((name, COLUMN_TYPES.get(data_format, 'TEXT')))
+    except csv.Error:
+        pass
+    return columns
+
+
+def _fixture_value(rng, column_type):
+    if column_type == 'INTEGER':
+        return rng.randrange(1000)
+    if column_type == 'REAL':
+        return round(rng.random() * 1000, 3)
+    return f'v{rng.randrange(25)}'
+
+
+def build_bird_fixture(path, schema_data, rows, seed=7):
+    """Synthetic BIRD database with every table and column of `schema_data`.
+
+    Values are random but typed after the schema's data_format, with few
+    distinct text values so GROUP BY queries return short lists.
+    """
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    for table_name, table_csv in schema_data.items():
+        columns = _schema_columns(table_csv)
+        if not columns:
+            continue
+        column_sql = ', '.join(f'"{name}" {column_type}' for name,
+            column_type in columns)
+        conn.execute(f'CREATE TABLE "{table_name}" ({column_sql})')
+        conn.executemany(
+            f"INSERT INTO \"{table_name}\" VALUES ({', '.join('?' * len(columns))})"
+            , [tuple(_fixture_value(rng, column_type) for _, column_type in
+            columns) for _ in range(rows)])
+    conn.commit()
+    conn.close()
+
+
+class ShimCursor:
+    """mysql.connector cursor interface over a sqlite3 cursor."""
+
+    def __init__(self, cursor, dictionary):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, operation, params=None):
+        operation = PLACEHOLDER_PATTERN.sub(lambda match: '?' if match.
+            group(1) == 's' else '%', operation)
+        operation = re.sub('\\s+FOR\\s+UPDATE\\b', '', operation, flags=re
+            .IGNORECASE)
+        self._cursor.execute(operation, tuple(params or ()))
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return {column[0]: value for column, value in zip(self._cursor.
+            description, row)}
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+
+class ShimConnection:
+    """The slice of a mysql.connector connection the web services use.
+
+    Writes take the database lock up front (BEGIN IMMEDIATE) so concurrent
+    requests queue on the busy timeout instead of failing on lock upgrade.
+    """
+
+    def __init__(self, path, timeout=30.0):
+        self._conn = sqlite3.connect(path, timeout=timeout,
+            isolation_level='IMMEDIATE', check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._open = True
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    def cursor(self, dictionary=False, buffered=None):
+        return ShimCursor(self._conn.cursor(), dictionary)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def is_connected(self):
+        return self._open
+
+    def close(self):
+        self._open = False
+        self._conn.close()
+
+
+class ShimConnector:
+    """Drop-in for mysql.connector.connect that opens ShimConnections."""
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.opened = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, **db_config):
+        with self._lock:
+            self.opened += 1
+        return ShimConnection(self.path)
@@ -0,0 +1,141 @@
+import argparse
+import json
+import os
+import statistics
+import time
+from services import prompt_assembly
+from services import resource_registry
+SCHEMA_FILE_PATH = '../data/BIRD_table_schema_info.json'
+COMPACT_STATS_FILE_PATH = '../data/compact_dataset_stats.json'
+CLEAN_SCHEMA_FILE_PATH = '../data/clean_and_must_follow_schema_details.json'
+PROMPT_DIR = '../resources/prompts/'
+PILLAR_DIR = '../resources/question_guide_pillars/'
+PILLAR_FILES = {'toulmin': 'toulmin_argument_structure.json',
+    'dataset_schema': 'dataset_schema_based_patterns.json', 'vulnerability':
+    'vulnerability_semantic_frames.json', 'counterargument':
+    'preemptive-counterargument_pattern.json'}
+QUESTION = 'Which schools in Alameda County have the highest average SAT math score?'
+DECISION = 'Decide which schools should receive additional STEM funding next year.'
+ERROR_INFO = {'previous_sql':
+    'SELECT "School Name", AvgScrMath FROM satscores LIMIT 10', 'error':
+    'no such column: School Name', 'traceback': 'sqlite3.OperationalError'}
+
+
+def legacy_sql_prompt(question, schema_data, clean_schema_data,
+    compact_stats_data, prompts, is_retry=False, error_info=None, indent=2):
+    """The per-request string building used before prompt_assembly."""
+    prompt_data = prompts.get('sql_retry' if is_retry else 'sql_generation',
+        {})
+    separators = prompt_assembly.COMPACT_SEPARATORS if indent is None else None
+    prompt = f"""
+{prompt_data.get('system_message', 'You are a database expert who knows every intricacy of SQL query generation for SQLite databases.')}
+
+{prompt_data.get('task_description', 'Generate a SQL query to answer the following question:')}
+"{question}"
+
+{json.dumps(schema_data, indent=indent, separators=separators)}
+
+{json.dumps(clean_schema_data, indent=indent, separators=separators)}
+
+{json.dumps(compact_stats_data, indent=indent, separators=separators)}
+
+"""
+    for guideline in prompt_data.get('sqlite_guidelines', prompt_assembly.
+        DEFAULT_SQL_GUIDELINES):
+        prompt += f'- {guideline}\n'
+    prompt += '\n# CRITICAL: Column Name Rules\n'
+    for rule in prompt_data.get('column_name_rules', prompt_assembly.
+        DEFAULT_COLUMN_NAME_RULES):
+        prompt += f'- {rule}\n'
+    if is_retry and error_info:
+        prompt += f"""
+```sql
+{error_info.get('previous_sql', '')}
+```
+
+{error_info.get('error', '')}
+
+{error_info.get('traceback', '')}
+
+"""
+        for error in prompt_data.get('common_errors_to_fix', prompt_assembly
+            .DEFAULT_COMMON_ERRORS):
+            prompt += f'- {error}\n'
+        prompt += '\n# Analysis Instructions\n'
+        for instruction in prompt_data.get('analysis_instructions',
+            prompt_assembly.DEFAULT_ANALYSIS_INSTRUCTIONS):
+            prompt += f'- {instruction}\n'
+    return prompt
+
+
+def load_inputs():
+    schema_data = resource_registry.get_json(SCHEMA_FILE_PATH)
+    clean_schema_data = resource_registry.get_json(CLEAN_SCHEMA_FILE_PATH, {})
+    compact_stats_data = resource_registry.get_json(COMPACT_STATS_FILE_PATH, {}
+        )
+    prompts = {key: resource_registry.get_json(os.path.join(PROMPT_DIR,
+        f'{key}_prompt.json'), {}) for key in ('suggestions',
+        'sql_generation', 'sql_retry')}
+    pillar_data = {}
+    for key, file_name in PILLAR_FILES.items():
+        data = resource_registry.get_json(os.path.join(PILLAR_DIR, file_name
+            ), None)
+        if data is not None:
+            pillar_data[key] = data
+    return schema_data, clean_schema_data, compact_stats_data, pillar_data, prompts
+
+
+def time_builds(build, iterations):
+    timings = []
+    prompt = ''
+    for _ in range(iterations):
+        start_time = time.perf_counter()
+        prompt = build()
+        timings.append((time.perf_counter() - start_time) * 1000)
+    return {'mean_ms': statistics.mean(timings), 'p50_ms': statistics.
+        median(timings), 'max_ms': max(timings), 'bytes': len(prompt.encode
+        ('utf-8'))}
+
+
+def compare(name, legacy_build, compact_legacy_build, build, iterations):
+    legacy = time_builds(legacy_build, iterations)
+    start_time = time.perf_counter()
+    first_prompt = build()
+    compile_ms = (time.perf_counter() - start_time) * 1000
+    assembled = time_builds(build, iterations)
+    assembled['first_build_ms'] = compile_ms
+    return {'case': name, 'legacy': legacy, 'assembled': assembled,
+        'speedup': legacy['mean_ms'] / assembled['mean_ms'] if assembled[
+        'mean_ms'] else None, 'bytes_saved': legacy['bytes'] - assembled[
+        'bytes'], 'byte_reduction_pct': 100 * (1 - assembled['bytes'] /
+        legacy['bytes']), 'matches_legacy_layout': first_prompt ==
+        compact_legacy_build()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=
+        'Compare per-request prompt building against precompiled prompt templates'
+        )
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+    (schema_data, clean_schema_data, compact_stats_data, pillar_data, prompts
+        ) = load_inputs()
+    sql_args = QUESTION, schema_data, clean_schema_data, compact_stats_data
+    report = [compare('sql_generation', lambda : legacy_sql_prompt(*
+        sql_args, prompts), lambda : legacy_sql_prompt(*sql_args, prompts,
+        indent=None), lambda : prompt_assembly.build_sql_prompt(*sql_args,
+        prompts), args.iterations), compare('sql_retry', lambda :
+        legacy_sql_prompt(*sql_args, prompts, True, ERROR_INFO), lambda :
+        legacy_sql_prompt(*sql_args, prompts, True, ERROR_INFO, indent=None
+        ), lambda : prompt_assembly.build_sql_prompt(*sql_args, prompts,
+        True, ERROR_INFO), args.iterations)]
+    suggestions = time_builds(lambda : prompt_assembly.
+        build_suggestions_prompt(QUESTION, DECISION, schema_data,
+        clean_schema_data, compact_stats_data, pillar_data, prompts), args.
+        iterations)
+    print(json.dumps({'comparisons': report, 'suggestions': suggestions,
+        'templates': prompt_assembly.get_stats()}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+from collections import defaultdict
+from benchmarks.sqlite_pool import build_fixture, default_queries, load_queries
+from services import result_format
+from services import sql_sandbox
+COMPACT_STATS_FILE_PATH = '../data/compact_dataset_stats.json'
+
+
+def _typed(value):
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except (TypeError, ValueError):
+            pass
+    return value
+
+
+def build_bird_fixture(path, stats_path, rows):
+    """BIRD-shaped database: real table and column names, sampled values."""
+    with open(stats_path, 'r') as f:
+        samples = json.load(f).get('column_samples', {})
+    columns = defaultdict(dict)
+    for qualified, values in samples.items():
+        table_name, _, column_name = qualified.partition('.')
+        if column_name and values:
+            columns[table_name][column_name] = [_typed(value) for value in
+                values]
+    conn = sqlite3.connect(path)
+    rng = random.Random(7)
+    for table_name, table_columns in columns.items():
+        names = list(table_columns)
+        quoted = ', '.join('"' + name.replace('"', '""') + '"' for name in
+            names)
+        conn.execute(f'CREATE TABLE "{table_name}" ({quoted})')
+        conn.executemany(
+            f"INSERT INTO \"{table_name}\" VALUES ({', '.join('?' * len(names))})"
+            , [tuple(rng.choice(table_columns[name]) for name in names) for
+            _ in range(rows)])
+    conn.commit()
+    conn.close()
+
+
+def legacy_rows(result):
+    return [dict(zip(result['columns'], row)) for row in zip(*result[
+        'values'])]
+
+
+def measure(results):
+    """Byte counts for the row-dict and columnar layouts of the same results."""
+    sizes = {'storage_rows': 0, 'storage_columnar': 0, 'api_rows': 0,
+        'api_columnar': 0, 'prompt_rows': 0, 'prompt_columnar': 0}
+    for result in results:
+        rows = legacy_rows(result)
+        sizes['storage_rows'] += len(json.dumps({'result_rows': rows,
+            'column_names': result['columns']}))
+        sizes['storage_columnar'] += len(json.dumps({'result': result}))
+        sizes['api_rows'] += len(json.dumps(rows, separators=(',', ':')))
+        sizes['api_columnar'] += len(json.dumps(result, separators=(',',
+            ':')))
+        sizes['prompt_rows'] += len(json.dumps(rows, indent=2))
+        sizes['prompt_columnar'] += len(result_format.render_for_prompt(
+            result))
+    for surface in ('storage', 'api', 'prompt'):
+        before = sizes[f'{surface}_rows']
+        after = sizes[f'{surface}_columnar']
+        sizes[f'{surface}_reduction'] = 1 - after / before if before else 0.0
+    sizes['prompt_tokens_rows_estimate'] = sizes['prompt_rows'] // 4
+    sizes['prompt_tokens_columnar_estimate'] = sizes['prompt_columnar'] // 4
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=
+        'Compare row-dict and columnar result payload sizes')
+    parser.add_argument('--db', default=sql_sandbox.SQLITE_DB_PATH)
+    parser.add_argument('--queries', help=
+        'JSON list of SQL strings or of objects with sql_query/SQL fields')
+    parser.add_argument('--fixture', action='store_true', help=
+        'Measure a generated database instead of --db')
+    parser.add_argument('--fixture-tables', type=int, default=8)
+    parser.add_argument('--fixture-rows', type=int, default=2000)
+    parser.add_argument('--bird-fixture', action='store_true', help=
+        'Measure a database built from the BIRD column samples in --stats')
+    parser.add_argument('--stats', default=COMPACT_STATS_FILE_PATH)
+    args = parser.parse_args()
+    temp_dir = None
+    db_path = args.db
+    if args.fixture or args.bird_fixture:
+        temp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(temp_dir.name, 'fixture.sqlite')
+        if args.bird_fixture:
+            build_bird_fixture(db_path, args.stats, args.fixture_rows)
+        else:
+            build_fixture(db_path, args.fixture_tables, args.fixture_rows)
+    queries = load_queries(args.queries) if args.queries else default_queries(
+        db_path)
+    results = []
+    errors = 0
+    for sql in queries:
+        execution_result = sql_sandbox.execute(sql, db_path)
+        if execution_result['success']:
+            results.append(execution_result['result'])
+        else:
+            errors += 1
+    report = {'db': db_path, 'queries': len(queries), 'errors': errors,
+        'rows': sum(result['row_count'] for result in results)}
+    report.update(measure(results))
+    print(json.dumps(report, indent=2))
+    if temp_dir is not None:
+        temp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
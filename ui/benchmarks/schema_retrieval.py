@@ -0,0 +1,108 @@
+import argparse
+import json
+import re
+import statistics
+import time
+from services import prompt_assembly
+from services import resource_registry
+from services.schema_retrieval import SchemaIndex
+SCHEMA_FILE_PATH = '../data/BIRD_table_schema_info.json'
+COMPACT_STATS_FILE_PATH = '../data/compact_dataset_stats.json'
+EVIDENCE_FILE_PATH = '../data/all_evidence.json'
+TABLE_REFERENCE_PATTERN = re.compile(
+    '\\b(?:FROM|JOIN)\\s+(?:`([^`]+)`|"([^"]+)"|\\[([^\\]]+)\\]|(\\w+))',
+    re.IGNORECASE)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def gold_tables(item, table_lookup):
+    """Prefixed table names referenced by a BIRD item's gold SQL."""
+    tables = set()
+    for groups in TABLE_REFERENCE_PATTERN.findall(item.get('SQL', '')):
+        name = next(group for group in groups if group)
+        prefixed = f"{item.get('db_id', '')}_{name.strip()}".lower()
+        if prefixed in table_lookup:
+            tables.add(table_lookup[prefixed])
+    return tables
+
+
+def evaluate(index, items, top_k, max_tables, use_evidence, schema_data,
+    compact_stats_data):
+    table_lookup = {name.lower(): name for name in index.table_names}
+    latencies = []
+    recalls = []
+    complete = 0
+    selected_counts = []
+    prompt_bytes = []
+    skipped = 0
+    full_prompt = prompt_assembly.build_sql_prompt('', schema_data, {},
+        compact_stats_data, {})
+    for item in items:
+        expected = gold_tables(item, table_lookup)
+        if not expected:
+            skipped += 1
+            continue
+        text = item.get('question', '')
+        if use_evidence and item.get('evidence'):
+            text = f"{text} {item['evidence']}"
+        start_time = time.perf_counter()
+        selected = index.select_tables(text, top_k, max_tables) or list(index
+            .table_names)
+        latencies.append((time.perf_counter() - start_time) * 1000)
+        found = expected & set(selected)
+        recalls.append(len(found) / len(expected))
+        complete += found == expected
+        selected_counts.append(len(selected))
+        prompt_bytes.append(len(prompt_assembly.build_sql_prompt(item.get(
+            'question', ''), schema_data, {}, compact_stats_data, {},
+            tables=selected).encode('utf-8')))
+    evaluated = len(recalls)
+    return {'top_k': top_k, 'max_tables': max_tables, 'use_evidence':
+        use_evidence, 'questions': evaluated, 'skipped_without_gold_tables':
+        skipped, 'table_recall': statistics.mean(recalls) if recalls else
+        0.0, 'all_tables_recalled': complete / evaluated if evaluated else
+        0.0, 'mean_tables_selected': statistics.mean(selected_counts) if
+        selected_counts else 0.0, 'latency_p50_ms': percentile(latencies,
+        50), 'latency_p95_ms': percentile(latencies, 95), 'latency_p99_ms':
+        percentile(latencies, 99), 'mean_prompt_bytes': statistics.mean(
+        prompt_bytes) if prompt_bytes else 0.0, 'full_prompt_bytes': len(
+        full_prompt.encode('utf-8'))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=
+        'Evaluate schema retrieval recall and latency against BIRD questions')
+    parser.add_argument('--questions', required=True, help=
+        'BIRD dev/train JSON (list of items with question, db_id, SQL, evidence)'
+        )
+    parser.add_argument('--top-k', type=int, nargs='+', default=[2, 4, 6])
+    parser.add_argument('--max-tables', type=int, default=10)
+    parser.add_argument('--limit', type=int, default=None)
+    parser.add_argument('--with-evidence', action='store_true', help=
+        "Append each item's evidence to the retrieval query")
+    args = parser.parse_args()
+    with open(args.questions, 'r') as f:
+        items = json.load(f)
+    if args.limit:
+        items = items[:args.limit]
+    schema_data = resource_registry.get_json(SCHEMA_FILE_PATH)
+    compact_stats_data = resource_registry.get_json(COMPACT_STATS_FILE_PATH, {}
+        )
+    index = SchemaIndex(schema_data, compact_stats_data, resource_registry.
+        get_json(EVIDENCE_FILE_PATH, []))
+    report = {'index_build_ms': index.build_ms, 'tables': len(index.
+        table_names), 'terms': len(index.postings), 'runs': [evaluate(index,
+        items, top_k, args.max_tables, args.with_evidence, schema_data,
+        compact_stats_data) for top_k in args.top_k]}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from services import sql_sandbox
+MAX_DEFAULT_TABLES = 20
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def build_fixture(path, tables, rows):
+    """Synthetic stand-in for the BIRD database, for machines without it."""
+    conn = sqlite3.connect(path)
+    rng = random.Random(7)
+    for table_index in range(tables):
+        conn.execute(
+            f'CREATE TABLE t{table_index} (id INTEGER PRIMARY KEY, category TEXT, amount REAL, note TEXT)'
+            )
+        conn.executemany(f'INSERT INTO t{table_index} VALUES (?, ?, ?, ?)',
+            [(row, f'c{rng.randrange(50)}', rng.random() * 1000, 'x' * rng
+            .randrange(20, 200)) for row in range(rows)])
+    conn.commit()
+    conn.close()
+
+
+def default_queries(db_path):
+    """Query shapes the SQL prompts ask for, over the database's own tables."""
+    conn = sqlite3.connect(db_path)
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name")][
+        :MAX_DEFAULT_TABLES]
+    queries = []
+    for table_name in tables:
+        columns = [row[1] for row in conn.execute(
+            f'PRAGMA table_info("{table_name}")')]
+        queries.append(f'SELECT * FROM "{table_name}" LIMIT 10')
+        queries.append(f'SELECT COUNT(*) AS total_count FROM "{table_name}"')
+        if columns:
+            queries.append(
+                f'SELECT "{columns[-1]}", COUNT(*) AS total_count FROM "{table_name}" GROUP BY "{columns[-1]}" ORDER BY total_count DESC LIMIT 10'
+                )
+    conn.close()
+    return queries
+
+
+def load_queries(path):
+    with open(path, 'r') as f:
+        items = json.load(f)
+    queries = []
+    for item in items:
+        if isinstance(item, str):
+            queries.append(item)
+        elif isinstance(item, dict):
+            sql = item.get('sql_query') or item.get('SQL') or item.get('sql')
+            if sql:
+                queries.append(sql)
+    return queries
+
+
+def run_cold(db_path, sql):
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(sql)
+    cursor.fetchall()
+    cursor.close()
+    conn.close()
+
+
+def run_cold_sandbox(db_path, sql):
+    conn = sql_sandbox.connect(db_path)
+    conn.execute(sql).fetchall()
+    conn.close()
+
+
+def run_pooled(db_path, sql):
+    result = sql_sandbox.execute(sql, db_path)
+    if not result['success']:
+        raise sqlite3.Error(result['error'])
+
+
+def measure(runner, db_path, queries, repeat):
+    latencies = []
+    errors = 0
+    for _ in range(repeat):
+        for sql in queries:
+            start_time = time.perf_counter()
+            try:
+                runner(db_path, sql)
+            except sqlite3.Error:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - start_time) * 1000)
+    return {'executions': len(latencies), 'errors': errors, 'p50_ms':
+        percentile(latencies, 50), 'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99), 'mean_ms': statistics.mean(
+        latencies) if latencies else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=
+        'Compare cold-connect and pooled SQLite query latency')
+    parser.add_argument('--db', default=sql_sandbox.SQLITE_DB_PATH)
+    parser.add_argument('--queries', help=
+        'JSON list of SQL strings or of objects with sql_query/SQL fields')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--fixture', action='store_true', help=
+        'Benchmark a generated database instead of --db')
+    parser.add_argument('--fixture-tables', type=int, default=8)
+    parser.add_argument('--fixture-rows', type=int, default=20000)
+    args = parser.parse_args()
+    temp_dir = None
+    db_path = args.db
+    if args.fixture:
+        temp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(temp_dir.name, 'fixture.sqlite')
+        build_fixture(db_path, args.fixture_tables, args.fixture_rows)
+    queries = load_queries(args.queries) if args.queries else default_queries(
+        db_path)
+    warm_start = time.perf_counter()
+    sql_sandbox.warm_up(db_path)
+    warm_ms = (time.perf_counter() - warm_start) * 1000
+    report = {'db': db_path, 'queries': len(queries), 'repeat': args.
+        repeat, 'warm_up_ms': warm_ms, 'settings': {'cache_kib':
+        sql_sandbox.SQL_CACHE_KIB, 'mmap_bytes': sql_sandbox.SQL_MMAP_BYTES,
+        'temp_store': sql_sandbox.SQL_TEMP_STORE, 'immutable': sql_sandbox.
+        SQL_IMMUTABLE}, 'cold_connect': measure(run_cold, db_path, queries,
+        args.repeat), 'cold_sandbox_connect': measure(run_cold_sandbox,
+        db_path, queries, args.repeat), 'pooled': measure(run_pooled,
+        db_path, queries, args.repeat)}
+    if report['pooled']['mean_ms']:
+        report['mean_speedup'] = report['cold_connect']['mean_ms'] / report[
+            'pooled']['mean_ms']
+    report['pool'] = sql_sandbox.get_stats()
+    print(json.dumps(report, indent=2))
+    if temp_dir is not None:
+        temp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import tempfile
+import threading
+import time
+from services.stream_backends import InMemoryStreamBackend, SQLiteStreamBackend
+STREAM_KEY = 'bench_user', 'fanout'
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def summarize(latencies, subscribers, events):
+    latencies_ms = [latency * 1000 for latency in latencies]
+    return {'subscribers': subscribers, 'events': events, 'deliveries':
+        len(latencies_ms), 'p50_ms': percentile(latencies_ms, 50), 'p95_ms':
+        percentile(latencies_ms, 95), 'p99_ms': percentile(latencies_ms, 99
+        ), 'max_ms': max(latencies_ms) if latencies_ms else 0.0, 'mean_ms':
+        statistics.mean(latencies_ms) if latencies_ms else 0.0}
+
+
+def subscribe(backend, events, timeout):
+    latencies = []
+    last_index = 0
+    deadline = time.monotonic() + timeout
+    while len(latencies) < events and time.monotonic() < deadline:
+        new_updates, last_index = backend.wait(STREAM_KEY, last_index,
+            timeout=deadline - time.monotonic())
+        received_at = time.time()
+        for update in new_updates:
+            latencies.append(received_at - update['timestamp'])
+    return latencies
+
+
+def publish(backend, events, interval):
+    for i in range(events):
+        backend.append(STREAM_KEY, {'status': 'progress', 'message':
+            f'event {i}', 'progress': i, 'timestamp': time.time()})
+        time.sleep(interval)
+
+
+def run_memory(subscribers, events, interval, timeout):
+    backend = InMemoryStreamBackend()
+    results = []
+    results_lock = threading.Lock()
+
+    def worker():
+        latencies = subscribe(backend, events, timeout)
+        with results_lock:
+            results.extend(latencies)
+    threads = [threading.Thread(target=worker) for _ in range(subscribers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    publish(backend, events, interval)
+    for thread in threads:
+        thread.join()
+    return summarize(results, subscribers, events)
+
+
+def sqlite_subscriber(db_path, events, timeout, result_queue):
+    backend = SQLiteStreamBackend(db_path)
+    result_queue.put(subscribe(backend, events, timeout))
+
+
+def run_sqlite(subscribers, events, interval, timeout):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'stream_updates.db')
+        backend = SQLiteStreamBackend(db_path)
+        result_queue = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=sqlite_subscriber,
+            args=(db_path, events, timeout, result_queue)) for _ in range(
+            subscribers)]
+        for process in processes:
+            process.start()
+        time.sleep(1.0)
+        publish(backend, events, interval)
+        results = []
+        for _ in processes:
+            results.extend(result_queue.get(timeout=timeout + 5))
+        for process in processes:
+            process.join()
+    return summarize(results, subscribers, events)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=
+        'Measure publish-to-delivery latency of stream_manager backends')
+    parser.add_argument('--backend', choices=['memory', 'sqlite', 'all'],
+        default='all')
+    parser.add_argument('--subscribers', type=int, default=8)
+    parser.add_argument('--events', type=int, default=50)
+    parser.add_argument('--interval', type=float, default=0.02)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    args = parser.parse_args()
+    report = {}
+    if args.backend in ('memory', 'all'):
+        report['memory'] = run_memory(args.subscribers, args.events, args.
+            interval, args.timeout)
+    if args.backend in ('sqlite', 'all'):
+        report['sqlite'] = run_sqlite(args.subscribers, args.events, args.
+            interval, args.timeout)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
-from flask import Flask, request
+from flask import Flask, request, jsonify
 import hello
 import user_testing
 import interface
@@ -12,6 +12,16 @@ from services.analysis_service import bp as analysis_bp
 from services.user_feedback_service import bp as user_feedback_bp
 from services.analyst_feedback_service import bp as analyst_feedback_bp
 from services.streaming_service import bp as streaming_bp
+from services.jobs import bp as jobs_bp
+from services import db_pool
+from services import resource_registry
+from services import singleflight
+from services import jobs
+from services import speculation
+from services import sql_sandbox
+from common import llm_cache
+from common import llm_client
+from common import sql_validator
 
 
 def create_app():
@@ -30,6 +40,8 @@ def create_app():
     app.register_blueprint(user_feedback_bp)
     app.register_blueprint(analyst_feedback_bp)
     app.register_blueprint(streaming_bp)
+    app.register_blueprint(jobs_bp)
+    db_pool.init_app(app)
     log_dir = 'logs'
     if not os.path.exists(log_dir):
         os.makedirs(log_dir)
@@ -72,8 +84,45 @@ def create_app():
             response.headers['Pragma'] = 'no-cache'
             response.headers['Expires'] = '-1'
         return response
+
+    @app.route('/api/db-pool/stats', methods=['GET'])
+    def db_pool_stats():
+        return jsonify(db_pool.get_stats())
+
+    @app.route('/api/resources/stats', methods=['GET'])
+    def resource_stats():
+        return jsonify(resource_registry.get_stats())
+
+    @app.route('/api/llm-cache/stats', methods=['GET'])
+    def llm_cache_stats():
+        return jsonify(llm_cache.get_stats())
+
+    @app.route('/api/llm-client/stats', methods=['GET'])
+    def llm_client_stats():
+        return jsonify(llm_client.get_stats())
+
+    @app.route('/api/singleflight/stats', methods=['GET'])
+    def singleflight_stats():
+        return jsonify(singleflight.get_stats())
+
+    @app.route('/api/jobs/stats', methods=['GET'])
+    def job_stats():
+        return jsonify(jobs.get_stats())
+
+    @app.route('/api/speculation/stats', methods=['GET'])
+    def speculation_stats():
+        return jsonify(speculation.get_stats())
+
+    @app.route('/api/sql-sandbox/stats', methods=['GET'])
+    def sql_sandbox_stats():
+        return jsonify(sql_sandbox.get_stats())
+
+    @app.route('/api/sql-validator/stats', methods=['GET'])
+    def sql_validator_stats():
+        return jsonify(sql_validator.get_stats())
     from services import stream_manager
     stream_manager.start_cleanup_scheduler()
+    sql_sandbox.warm_up_async()
     return app
 
 
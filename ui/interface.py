@@ -5,15 +5,8 @@ import logging
 import os
 import random
 import string
+from services import db_pool
 bp = Blueprint('interface', __name__)
-DB_CONFIG = {
-    'host': 'YOUR_DATABASE_HOST',
-    'port': 'YOUR_DATABASE_POST',
-    'user': 'YOUR_DATABASE_USER',
-    'password': 'YOUR_DATABASE_PASSWORD',
-    'database': 'YOUR_DATABASE_NAME'
-}
-
 os.makedirs('logs', exist_ok=True)
 logging.basicConfig(filename='logs/interface.log', level=logging.INFO,
     format=
@@ -23,8 +16,7 @@ logger = logging.getLogger(__name__)
 
 def get_db_connection():
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        return conn
+        return db_pool.get_request_connection()
     except mysql.connector.Error as e:
         logger.error(f'Database connection error: {str(e)}')
         raise
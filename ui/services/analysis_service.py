@@ -5,104 +5,93 @@ import mysql.connector
 import os
 import traceback
 from google import genai
-from google.genai import types
 from datetime import datetime
 from . import stream_manager
+from . import db_pool
+from . import resource_registry
+from . import singleflight
+from . import result_format
+from common import evidence_index
+from common import llm_client
 os.makedirs('logs', exist_ok=True)
 logging.basicConfig(filename='logs/analysis_service.log', level=logging.
     INFO, format=
     '%(asctime)s - %(levelname)s - %(pathname)s:%(lineno)d - %(message)s')
 logger = logging.getLogger(__name__)
 bp = Blueprint('analysis', __name__, url_prefix='/api/analysis')
-DB_CONFIG = {
-    'host': 'YOUR_DATABASE_HOST',
-    'port': 'YOUR_DATABASE_POST',
-    'user': 'YOUR_DATABASE_USER',
-    'password': 'YOUR_DATABASE_PASSWORD',
-    'database': 'YOUR_DATABASE_NAME'
-}
-
 MODEL = 'gemini-2.0-flash-001'
 SCHEMA_FILE_PATH = '../../data/BIRD_table_schema_info.json'
-EVIDENCE_FILE_PATH = '../../data/all_evidence.json'
+EVIDENCE_FILE_PATH = evidence_index.EVIDENCE_FILE_PATH
 genai_client = genai.Client(project="your-gcp-project-id")
 
 
 def get_db_connection():
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        return conn
+        return db_pool.get_request_connection()
     except mysql.connector.Error as e:
         logger.error(f'Database connection error: {str(e)}')
         raise
 
 
-def load_schema_data():
+def _load_resource(path, label, serialized=False):
     try:
-        if os.path.exists(SCHEMA_FILE_PATH):
-            with open(SCHEMA_FILE_PATH, 'r') as f:
-                return json.load(f)
-        else:
-            logger.warning(f'Schema file not found: {SCHEMA_FILE_PATH}')
-            return None
+        if serialized:
+            return resource_registry.get_serialized(path, indent=2)
+        return resource_registry.get_json(path)
+    except FileNotFoundError:
+        logger.warning(f'{label} file not found: {path}')
+        return None
     except Exception as e:
-        logger.error(f'Error loading schema data: {str(e)}')
+        logger.error(f'Error loading {label.lower()} data: {str(e)}')
         return None
 
 
-def load_evidence_data():
+def load_schema_data():
+    return _load_resource(SCHEMA_FILE_PATH, 'Schema')
+
+
+def load_schema_text():
+    return _load_resource(SCHEMA_FILE_PATH, 'Schema', serialized=True)
+
+
+def load_evidence_text():
+    return _load_resource(EVIDENCE_FILE_PATH, 'Evidence', serialized=True)
+
+
+def load_evidence_for_question(bird_id):
     try:
-        if os.path.exists(EVIDENCE_FILE_PATH):
-            with open(EVIDENCE_FILE_PATH, 'r') as f:
-                return json.load(f)
-        else:
-            logger.warning(f'Evidence file not found: {EVIDENCE_FILE_PATH}')
-            return None
+        return evidence_index.load_index(EVIDENCE_FILE_PATH).lookup(bird_id)
     except Exception as e:
         logger.error(f'Error loading evidence data: {str(e)}')
-        return None
+        return []
+
+
+def get_analysis_response_schema():
+    return {'type': 'OBJECT', 'properties': {'question_to_sql': {'type':
+        'OBJECT', 'properties': {'summary': {'type': 'STRING'},
+        'detailed_analysis': {'type': 'STRING'}}, 'required': ['summary',
+        'detailed_analysis']}, 'baqr': {'type': 'OBJECT', 'properties': {
+        'summary': {'type': 'STRING'}, 'detailed_analysis': {'type':
+        'STRING'}}, 'required': ['summary', 'detailed_analysis']}},
+        'required': ['question_to_sql', 'baqr']}
 
 
 def call_gemini_api(prompt):
     try:
         logger.info('Calling Gemini Flash API')
         start_time = datetime.now()
-        contents = [types.Content(role='user', parts=[types.Part.from_text(
-            text=prompt)])]
-        generate_content_config = types.GenerateContentConfig(temperature=0,
-            top_p=0.95, max_output_tokens=8192, response_modalities=['TEXT'
-            ], safety_settings=[types.SafetySetting(category=
-            'HARM_CATEGORY_HATE_SPEECH', threshold='OFF'), types.
-            SafetySetting(category='HARM_CATEGORY_DANGEROUS_CONTENT',
-            threshold='OFF'), types.SafetySetting(category=
-            'HARM_CATEGORY_SEXUALLY_EXPLICIT', threshold='OFF'), types.
-            SafetySetting(category='HARM_CATEGORY_HARASSMENT', threshold=
-            'OFF')], response_mime_type='application/json', response_schema
-            ={'type': 'OBJECT', 'properties': {'question_to_sql': {'type':
-            'OBJECT', 'properties': {'summary': {'type': 'STRING'},
-            'detailed_analysis': {'type': 'STRING'}}, 'required': [
-            'summary', 'detailed_analysis']}, 'baqr': {'type': 'OBJECT',
-            'properties': {'summary': {'type': 'STRING'},
-            'detailed_analysis': {'type': 'STRING'}}, 'required': [
-            'summary', 'detailed_analysis']}}, 'required': [
-            'question_to_sql', 'baqr']})
-        response = genai_client.models.generate_content(model=MODEL,
-            contents=contents, config=generate_content_config)
-        end_time = datetime.now()
-        execution_time = (end_time - start_time).total_seconds()
+        response_text = llm_client.generate_flash(genai_client, MODEL,
+            prompt, llm_client.flash_config(get_analysis_response_schema()),
+            deadline=llm_client.INTERACTIVE_DEADLINE_SECONDS, stream=False,
+            label='analysis')
+        execution_time = (datetime.now() - start_time).total_seconds()
         logger.info(
             f'Gemini API response received in {execution_time:.2f} seconds')
-        if hasattr(response, 'candidates') and response.candidates:
-            candidate = response.candidates[0]
-            if hasattr(candidate, 'content') and candidate.content:
-                parts = candidate.content.parts
-                if parts:
-                    response_text = parts[0].text
-                    logger.info(
-                        f'Response length: {len(response_text)} characters')
-                    return response_text
-        logger.error('No valid response received from Gemini API')
-        return None
+        if not response_text:
+            logger.error('No valid response received from Gemini API')
+            return None
+        logger.info(f'Response length: {len(response_text)} characters')
+        return response_text
     except Exception as e:
         logger.error(f'Error calling Gemini API: {str(e)}')
         logger.error(traceback.format_exc())
@@ -165,8 +154,8 @@ def get_successful_queries_by_model(conn, dataset_id, query_models):
                 execution_details = json.loads(query['execution_details']
                     ) if query['execution_details'] else {}
                 query_data = {'id': query['id'], 'NL_question': query[
-                    'NL_question'], 'result_rows': execution_details.get(
-                    'result_rows', [])}
+                    'NL_question'], 'result': result_format.columnar_of(
+                    execution_details)}
                 current_model_queries.append(query_data)
             logger.info(
                 f'Found {len(model_queries)} successful queries for dataset_id {dataset_id}, model {query_model}'
@@ -196,9 +185,22 @@ def get_decision_text(conn, dataset_id):
     return ''
 
 
-def build_gemini_prompt(decision_text, queries_by_model):
-    schema_data = load_schema_data()
-    evidence_data = load_evidence_data()
+def get_bird_question_id(conn, dataset_id):
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute('SELECT question_id_from_BIRD FROM dataset WHERE id = %s',
+        (dataset_id,))
+    result = cursor.fetchone()
+    cursor.close()
+    return result.get('question_id_from_BIRD') if result else None
+
+
+def build_gemini_prompt(decision_text, queries_by_model, bird_id=None):
+    schema_text = load_schema_text()
+    if bird_id is None:
+        evidence_text = load_evidence_text()
+    else:
+        evidence = load_evidence_for_question(bird_id)
+        evidence_text = json.dumps(evidence, indent=2) if evidence else None
     prompt = f"""
 You are tasked with analyzing the results of database queries in relation to a decision-making scenario. 
 
@@ -209,19 +211,19 @@ I will provide you with executed queries and their results, organized by query m
 
 NOTE: For queries that return lists, only up to 10 rows are fetched. Keep this in mind when summarizing and analyzing the data.
 """
-    if schema_data:
+    if schema_text:
         prompt += """
 === DATABASE SCHEMA INFORMATION ===
 The following information describes the database structure that was available to the models:
 """
-        prompt += json.dumps(schema_data, indent=2)
+        prompt += schema_text
         prompt += '\n\n'
-    if evidence_data:
+    if evidence_text:
         prompt += """
 === RELEVANT EVIDENCE AND CONTEXT ===
 The following evidence provides additional context for analyzing the queries:
 """
-        prompt += json.dumps(evidence_data, indent=2)
+        prompt += evidence_text
         prompt += '\n\n'
     for model, queries in queries_by_model.items():
         prompt += f"""
@@ -231,11 +233,12 @@ The following {len(queries)} queries were executed:
 """
         for i, query in enumerate(queries, 1):
             nl_question = query.get('NL_question', '')
-            result_data = json.dumps(query.get('result_rows', []), indent=2)
+            result_data = result_format.render_for_prompt(query.get('result'))
             prompt += f"""
 Query
 Natural Language Question: {nl_question}
-Results: {result_data}
+Results:
+{result_data}
 
 """
     prompt += """
@@ -251,7 +254,14 @@ Results: {result_data}
     return prompt
 
 
-def generate_analysis(conn, dataset_id, user_id):
+def generate_analysis(conn, dataset_id, user_id, progress=None):
+
+    def report(status, message, pct):
+        if progress is not None:
+            progress(status, message, pct)
+        elif user_id and dataset_id:
+            stream_manager.update_stream(user_id, dataset_id, 'analysis',
+                status, message, pct)
     try:
         decision_text = get_decision_text(conn, dataset_id)
         if not decision_text:
@@ -263,15 +273,13 @@ def generate_analysis(conn, dataset_id, user_id):
             logger.error(
                 f'No successful queries found for dataset_id {dataset_id}')
             return None
-        prompt = build_gemini_prompt(decision_text, queries_by_model)
-        if user_id and dataset_id:
-            stream_manager.update_stream(user_id, dataset_id, 'analysis',
-                'model_api_call', 'Asking AI to analyze your data', 40)
+        bird_id = get_bird_question_id(conn, dataset_id)
+        prompt = build_gemini_prompt(decision_text, queries_by_model, bird_id)
+        report('model_api_call', 'Asking AI to analyze your data', 40)
+        conn.close()
         response_text = call_gemini_api(prompt)
-        if user_id and dataset_id:
-            stream_manager.update_stream(user_id, dataset_id, 'analysis',
-                'generating_analysis',
-                'Generating detailed analysis of your data', 60)
+        report('generating_analysis',
+            'Generating detailed analysis of your data', 60)
         if not response_text:
             logger.error(
                 f'Failed to get response from Gemini API for dataset_id {dataset_id}'
@@ -291,14 +299,10 @@ def generate_analysis(conn, dataset_id, user_id):
                             text = text.replace('question_to_sql model',
                                 'model')
                             analysis_data[model_name][field] = text
-            if user_id and dataset_id:
-                stream_manager.update_stream(user_id, dataset_id,
-                    'analysis', 'comparative_analysis',
-                    'Creating comparative analysis of all queries', 80)
-            if user_id and dataset_id:
-                stream_manager.update_stream(user_id, dataset_id,
-                    'analysis', 'storing_results',
-                    'Storing analysis results', 90)
+            report('comparative_analysis',
+                'Creating comparative analysis of all queries', 80)
+            report('storing_results', 'Storing analysis results', 90)
+            conn.reopen()
             for model, queries in queries_by_model.items():
                 if model in analysis_data:
                     store_analysis(conn, dataset_id, model, decision_text,
@@ -322,8 +326,8 @@ def store_analysis(conn, dataset_id, model, decision_text, queries,
         query_id_details = {'query_ids': [q.get('id') for q in queries],
             'total_queries': len(queries)}
         query_execution_details = {'queries': [{'id': q.get('id'),
-            'NL_question': q.get('NL_question'), 'result_rows': q.get(
-            'result_rows', [])} for q in queries]}
+            'NL_question': q.get('NL_question'), 'result': q.get('result')} for
+            q in queries]}
         prompt_details = {'decision_text': decision_text, 'query_count':
             len(queries), 'raw_response': raw_response[:1000] if
             raw_response else ''}
@@ -373,6 +377,35 @@ def store_analysis(conn, dataset_id, model, decision_text, queries,
         return False
 
 
+def generate_missing_analysis(conn, dataset_id, user_id, flight):
+    """Generate and store the analysis unless it was stored meanwhile.
+
+    Runs as the single in-flight call for the dataset, on the request's
+    connection, which the caller closed before waiting. The rows are
+    checked again first: a request that found them missing may only get
+    here after another request's generation already finished and stored
+    them. The commit ends any read snapshot left on the reopened connection
+    so those rows are visible.
+    """
+    conn.reopen()
+    conn.commit()
+    cursor = conn.cursor(dictionary=True)
+    initial_analysis = fetch_analysis(cursor, dataset_id, 'question_to_sql')
+    comprehensive_analysis = fetch_analysis(cursor, dataset_id, 'baqr')
+    cursor.close()
+    if initial_analysis and comprehensive_analysis:
+        return initial_analysis, comprehensive_analysis
+    flight.progress('fetching_data', 'Fetching query results for analysis', 20
+        )
+    analysis_data = generate_analysis(conn, dataset_id, user_id, flight.
+        progress)
+    if not analysis_data:
+        logger.error(f'Failed to generate analysis for dataset_id {dataset_id}'
+            )
+        return initial_analysis, comprehensive_analysis
+    return analysis_data.get('question_to_sql'), analysis_data.get('baqr')
+
+
 @bp.route('/<dataset_id>', methods=['GET'])
 def get_analysis(dataset_id):
     try:
@@ -388,20 +421,17 @@ def get_analysis(dataset_id):
         comprehensive_analysis = fetch_analysis(cursor, dataset_id, 'baqr')
         cursor.close()
         if not initial_analysis or not comprehensive_analysis:
+            conn.close()
             logger.info(
                 f'Analysis missing for dataset_id {dataset_id}. Generating new analysis.'
                 )
-            if user_id and dataset_id:
-                stream_manager.update_stream(user_id, dataset_id,
-                    'analysis', 'fetching_data',
-                    'Fetching query results for analysis', 20)
-            analysis_data = generate_analysis(conn, dataset_id, user_id)
-            if analysis_data:
-                initial_analysis = analysis_data.get('question_to_sql')
-                comprehensive_analysis = analysis_data.get('baqr')
-            else:
-                logger.error(
-                    f'Failed to generate analysis for dataset_id {dataset_id}')
+            (initial_analysis, comprehensive_analysis), shared = (singleflight
+                .do(('analysis', str(dataset_id)), lambda flight:
+                generate_missing_analysis(conn, dataset_id, user_id, flight),
+                (user_id, dataset_id, 'analysis')))
+            if shared:
+                logger.info(
+                    f'Reused in-flight analysis for dataset_id {dataset_id}')
         conn.close()
         if user_id and dataset_id:
             stream_manager.update_stream(user_id, dataset_id, 'analysis',
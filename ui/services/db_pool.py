@@ -0,0 +1,255 @@
+import logging
+import os
+import threading
+import time
+import mysql.connector
+from mysql.connector import errors
+from flask import g, has_app_context
+os.makedirs('logs', exist_ok=True)
+logging.basicConfig(filename='logs/db_pool.log', level=logging.INFO, format=
+    '%(asctime)s - %(levelname)s - %(pathname)s:%(lineno)d - %(message)s')
+logger = logging.getLogger(__name__)
+DB_CONFIG = {
+    'host': 'YOUR_DATABASE_HOST',
+    'port': 'YOUR_DATABASE_POST',
+    'user': 'YOUR_DATABASE_USER',
+    'password': 'YOUR_DATABASE_PASSWORD',
+    'database': 'YOUR_DATABASE_NAME'
+}
+
+REQUEST_CONNECTIONS = int(os.environ.get('DB_POOL_REQUEST_CONNECTIONS', 8))
+WORKER_CONNECTIONS = int(os.environ.get('JOB_WORKERS', 8)) + int(os.environ.
+    get('SUGGESTION_WORKERS', 4)) + int(os.environ.get(
+    'SPECULATIVE_SQL_WORKERS', 2))
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', REQUEST_CONNECTIONS +
+    WORKER_CONNECTIONS))
+CHECKOUT_TIMEOUT_SECONDS = float(os.environ.get('DB_POOL_CHECKOUT_TIMEOUT', 10)
+    )
+HEALTH_CHECK_ON_BORROW = os.environ.get('DB_POOL_HEALTH_CHECK', '1') != '0'
+MAX_IDLE_SECONDS = float(os.environ.get('DB_POOL_MAX_IDLE_SECONDS', 1800))
+REQUEST_CONNECTION_KEY = '_db_pool_connection'
+_connector = mysql.connector.connect
+_condition = threading.Condition()
+_idle_connections = []
+_in_use = 0
+_stats = {'checkouts': 0, 'timeouts': 0, 'created': 0, 'discarded': 0,
+    'health_check_failures': 0, 'total_wait_seconds': 0.0,
+    'max_wait_seconds': 0.0, 'peak_in_use': 0}
+
+
+class PooledConnection:
+    """A checked-out connection that goes back to the pool on close().
+
+    Closing (or release()) returns the connection straight away, so callers
+    should close before waiting on a model call and call reopen() to check
+    a connection out again afterwards. Cursors opened through the wrapper
+    are closed with it, and any other use after close() raises
+    InterfaceError (in_transaction just reads False, for error handlers).
+    """
+
+    def __init__(self, raw_connection):
+        self._raw_connection = raw_connection
+        self._cursors = []
+        self._released = False
+
+    def _raw(self):
+        if self._released:
+            raise errors.InterfaceError(
+                'Pooled connection used after close(); call reopen() first')
+        return self._raw_connection
+
+    def __getattr__(self, name):
+        return getattr(self._raw(), name)
+
+    @property
+    def in_transaction(self):
+        return not self._released and self._raw_connection.in_transaction
+
+    def cursor(self, *args, **kwargs):
+        cursor = self._raw().cursor(*args, **kwargs)
+        self._cursors.append(cursor)
+        return cursor
+
+    def reopen(self, timeout=None):
+        """Check a connection out again after close(); returns self."""
+        if self._released:
+            self._raw_connection = _checkout_raw(timeout)
+            self._released = False
+        return self
+
+    def close(self):
+        self.release()
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        cursors, self._cursors = self._cursors, []
+        for cursor in cursors:
+            try:
+                cursor.close()
+            except Exception as e:
+                logger.warning(f'Error closing cursor on release: {str(e)}')
+        raw_connection, self._raw_connection = self._raw_connection, None
+        _return_connection(raw_connection)
+
+
+def configure(pool_size=None, checkout_timeout=None, health_check=None,
+    db_config=None, connector=None):
+    """Adjust pool settings; `connector(**DB_CONFIG)` opens new connections.
+
+    The connector defaults to mysql.connector.connect; the load-test harness
+    swaps in a SQLite stand-in with the same connection interface.
+    """
+    global POOL_SIZE, CHECKOUT_TIMEOUT_SECONDS, HEALTH_CHECK_ON_BORROW
+    global _connector
+    with _condition:
+        if pool_size is not None:
+            POOL_SIZE = max(int(pool_size), 1)
+        if checkout_timeout is not None:
+            CHECKOUT_TIMEOUT_SECONDS = float(checkout_timeout)
+        if health_check is not None:
+            HEALTH_CHECK_ON_BORROW = bool(health_check)
+        if db_config:
+            DB_CONFIG.update(db_config)
+        if connector is not None:
+            _connector = connector
+        _condition.notify_all()
+    logger.info(
+        f'Configured DB pool: size={POOL_SIZE}, checkout_timeout={CHECKOUT_TIMEOUT_SECONDS}s, health_check={HEALTH_CHECK_ON_BORROW}'
+        )
+
+
+def _open_connection():
+    conn = _connector(**DB_CONFIG)
+    with _condition:
+        _stats['created'] += 1
+    return conn
+
+
+def _discard_connection(conn):
+    try:
+        conn.close()
+    except Exception as e:
+        logger.warning(f'Error closing discarded connection: {str(e)}')
+    with _condition:
+        _stats['discarded'] += 1
+
+
+def _is_healthy(conn, last_used):
+    if time.time() - last_used > MAX_IDLE_SECONDS:
+        return False
+    if not HEALTH_CHECK_ON_BORROW:
+        return True
+    try:
+        return conn.is_connected()
+    except Exception:
+        return False
+
+
+def _checkout(timeout=None):
+    return PooledConnection(_checkout_raw(timeout))
+
+
+def _checkout_raw(timeout=None):
+    global _in_use
+    timeout = CHECKOUT_TIMEOUT_SECONDS if timeout is None else timeout
+    wait_start = time.monotonic()
+    deadline = wait_start + timeout
+    with _condition:
+        while _in_use >= POOL_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                _stats['timeouts'] += 1
+                logger.error(
+                    f'Timed out after {timeout}s waiting for a DB connection (in_use={_in_use}, size={POOL_SIZE})'
+                    )
+                raise errors.PoolError(
+                    f'Timed out waiting for a database connection after {timeout}s'
+                    )
+            _condition.wait(remaining)
+        _in_use += 1
+        waited = time.monotonic() - wait_start
+        _stats['checkouts'] += 1
+        _stats['total_wait_seconds'] += waited
+        _stats['max_wait_seconds'] = max(_stats['max_wait_seconds'], waited)
+        _stats['peak_in_use'] = max(_stats['peak_in_use'], _in_use)
+        idle_entry = _idle_connections.pop() if _idle_connections else None
+    try:
+        conn = None
+        if idle_entry:
+            idle_conn, last_used = idle_entry
+            if _is_healthy(idle_conn, last_used):
+                conn = idle_conn
+            else:
+                with _condition:
+                    _stats['health_check_failures'] += 1
+                _discard_connection(idle_conn)
+        if conn is None:
+            conn = _open_connection()
+        return conn
+    except Exception:
+        with _condition:
+            _in_use -= 1
+            _condition.notify()
+        raise
+
+
+def _return_connection(conn):
+    global _in_use
+    reusable = True
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+    except Exception as e:
+        logger.warning(f'Discarding connection that failed to reset: {str(e)}'
+            )
+        reusable = False
+    if not reusable:
+        _discard_connection(conn)
+    with _condition:
+        if reusable:
+            _idle_connections.append((conn, time.time()))
+        _in_use -= 1
+        _condition.notify()
+
+
+def get_connection(timeout=None):
+    return _checkout(timeout=timeout)
+
+
+def get_request_connection():
+    if not has_app_context():
+        return get_connection()
+    conn = g.get(REQUEST_CONNECTION_KEY)
+    if conn is None:
+        conn = _checkout()
+        setattr(g, REQUEST_CONNECTION_KEY, conn)
+    return conn.reopen()
+
+
+def release_request_connection(exception=None):
+    conn = g.pop(REQUEST_CONNECTION_KEY, None)
+    if conn is not None:
+        conn.release()
+
+
+def get_stats():
+    with _condition:
+        checkouts = _stats['checkouts']
+        return {'pool_size': POOL_SIZE, 'in_use': _in_use, 'idle': len(
+            _idle_connections), 'utilisation': _in_use / POOL_SIZE,
+            'peak_utilisation': _stats['peak_in_use'] / POOL_SIZE,
+            'checkouts': checkouts, 'timeouts': _stats['timeouts'],
+            'created': _stats['created'], 'discarded': _stats['discarded'],
+            'health_check_failures': _stats['health_check_failures'],
+            'avg_wait_ms': _stats['total_wait_seconds'] * 1000 / checkouts if
+            checkouts else 0.0, 'max_wait_ms': _stats['max_wait_seconds'] *
+            1000, 'total_wait_ms': _stats['total_wait_seconds'] * 1000}
+
+
+def init_app(app):
+    configure(pool_size=app.config.get('DB_POOL_SIZE'), checkout_timeout=
+        app.config.get('DB_POOL_CHECKOUT_TIMEOUT'), health_check=app.config
+        .get('DB_POOL_HEALTH_CHECK'), db_config=app.config.get('DB_CONFIG'))
+    app.teardown_appcontext(release_request_connection)
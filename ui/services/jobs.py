@@ -0,0 +1,172 @@
+from flask import Blueprint, jsonify, current_app, request
+import logging
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from . import stream_manager
+os.makedirs('logs', exist_ok=True)
+logging.basicConfig(filename='logs/jobs.log', level=logging.INFO, format=
+    '%(asctime)s - %(levelname)s - %(pathname)s:%(lineno)d - %(message)s')
+logger = logging.getLogger(__name__)
+bp = Blueprint('jobs', __name__, url_prefix='/api/jobs')
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 8))
+JOB_QUEUE_LIMIT = int(os.environ.get('JOB_QUEUE_LIMIT', 64))
+JOB_RESULT_TTL_SECONDS = float(os.environ.get('JOB_RESULT_TTL_SECONDS', 600))
+TERMINAL_STATUSES = 'complete', 'error'
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix=
+    'job')
+_jobs = {}
+_lock = threading.Lock()
+_stats = {'submitted': 0, 'rejected': 0, 'succeeded': 0, 'failed': 0}
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def wants_async(data):
+    """True when the caller asked for job mode (`?async=1` or `"async": true`)."""
+    value = request.args.get('async', (data or {}).get('async', ''))
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+def _prune(now):
+    expired = [job_id for job_id, job in _jobs.items() if job['finished_at'
+        ] and now - job['finished_at'] > JOB_RESULT_TTL_SECONDS]
+    for job_id in expired:
+        del _jobs[job_id]
+
+
+def _publish(job, status, message, progress):
+    user_id, stream_id, operation = job['stream']
+    if user_id and stream_id:
+        stream_manager.update_stream(user_id, stream_id, operation, status,
+            message, progress)
+
+
+def _stream_position(job):
+    user_id, stream_id, operation = job['stream']
+    if not (user_id and stream_id):
+        return 0
+    return stream_manager.get_stream_updates(user_id, stream_id, operation)[1]
+
+
+def _stream_ended(job, position):
+    """True when the view itself published 'complete' or 'error'."""
+    user_id, stream_id, operation = job['stream']
+    if not (user_id and stream_id):
+        return True
+    updates, _ = stream_manager.get_stream_updates(user_id, stream_id,
+        operation, position)
+    return any(update.get('status') in TERMINAL_STATUSES for update in
+        updates)
+
+
+def _run(app, job, fn, args):
+    job['status'] = 'running'
+    job['started_at'] = time.time()
+    position = _stream_position(job)
+    try:
+        with app.app_context():
+            response = current_app.make_response(fn(*args))
+            job['result'] = response.get_json(silent=True)
+            job['http_status'] = response.status_code
+        job['status'] = 'done'
+        failed = job['http_status'] >= 400
+        with _lock:
+            _stats['failed' if failed else 'succeeded'] += 1
+        if _stream_ended(job, position):
+            pass
+        elif failed:
+            result = job['result'] or {}
+            error = result.get('error') or result.get('message'
+                ) or f"HTTP {job['http_status']}"
+            _publish(job, 'error', f'Error: {error}', 100)
+        else:
+            _publish(job, 'complete', 'Request complete', 100)
+    except Exception as e:
+        logger.error(f"Job {job['id']} ({job['kind']}) failed: {str(e)}")
+        logger.error(traceback.format_exc())
+        job['status'] = 'failed'
+        job['result'] = {'error': str(e)}
+        job['http_status'] = 500
+        with _lock:
+            _stats['failed'] += 1
+        _publish(job, 'error', f'Error: {str(e)}', 100)
+    finally:
+        job['finished_at'] = time.time()
+        logger.info(
+            f"Job {job['id']} ({job['kind']}) {job['status']} in {job['finished_at'] - job['started_at']:.2f}s"
+            )
+
+
+def submit(kind, fn, args, stream=(None, None, None)):
+    """Queue `fn(*args)` on the bounded job executor.
+
+    `fn` is a view body returning a Flask response; it runs inside an app
+    context so pooled DB connections are released when it finishes. `stream`
+    is the (user_id, stream_id, operation) the work reports progress to; it
+    gets a final 'complete', or 'error' for a failure or an error response,
+    unless `fn` already published one. Error responses count as failed.
+    `fn` has no request context, so anything read from the request must be
+    resolved into `args` first.
+    """
+    now = time.time()
+    with _lock:
+        _prune(now)
+        pending = sum(1 for job in _jobs.values() if job['status'] in (
+            'queued', 'running'))
+        if pending >= JOB_WORKERS + JOB_QUEUE_LIMIT:
+            _stats['rejected'] += 1
+            raise JobQueueFull(f'{pending} jobs already pending')
+        job = {'id': uuid.uuid4().hex, 'kind': kind, 'status': 'queued',
+            'stream': stream, 'submitted_at': now, 'started_at': None,
+            'finished_at': None, 'result': None, 'http_status': None}
+        _jobs[job['id']] = job
+        _stats['submitted'] += 1
+    _publish(job, 'queued', 'Waiting for a free worker', 0)
+    _executor.submit(_run, current_app._get_current_object(), job, fn, args)
+    logger.info(f"Queued job {job['id']} ({kind}), {pending + 1} pending")
+    return job
+
+
+def submit_response(kind, fn, args, stream=(None, None, None)):
+    """202 response for a newly queued job, or 503 when the queue is full."""
+    try:
+        job = submit(kind, fn, args, stream)
+    except JobQueueFull as e:
+        logger.warning(f'Rejected {kind} job: {str(e)}')
+        return jsonify({'success': False, 'error':
+            'Server is busy, please retry shortly'}), 503
+    return jsonify({'success': True, 'job_id': job['id'], 'status': job[
+        'status'], 'streaming_id': stream[1], 'result_url':
+        f"/api/jobs/{job['id']}"}), 202
+
+
+def get_stats():
+    with _lock:
+        stats = dict(_stats)
+        statuses = [job['status'] for job in _jobs.values()]
+    stats.update({'workers': JOB_WORKERS, 'queue_limit': JOB_QUEUE_LIMIT,
+        'queued': statuses.count('queued'), 'running': statuses.count(
+        'running'), 'retained': len(statuses)})
+    return stats
+
+
+@bp.route('/<job_id>', methods=['GET'])
+def get_job(job_id):
+    with _lock:
+        job = _jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown or expired job'}
+            ), 404
+    body = {'job_id': job['id'], 'kind': job['kind'], 'status': job[
+        'status'], 'submitted_at': job['submitted_at'], 'started_at': job[
+        'started_at'], 'finished_at': job['finished_at']}
+    if job['status'] in ('queued', 'running'):
+        return jsonify(body), 202
+    body.update({'http_status': job['http_status'], 'result': job['result']})
+    return jsonify(body), 200
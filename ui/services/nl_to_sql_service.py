@@ -3,36 +3,35 @@ from flask import Blueprint, request, jsonify
 import json
 import logging
 import mysql.connector
-import sqlite3
 import os
 import traceback
 from datetime import datetime
 from google import genai
-from google.genai import types
 import re
 from . import stream_manager
+from . import db_pool
+from . import resource_registry
+from . import prompt_assembly
+from . import jobs
+from . import result_format
+from . import sql_sandbox
+from . import schema_retrieval
+from common import llm_client
+from common import sql_validator
 os.makedirs('logs', exist_ok=True)
 logging.basicConfig(filename='logs/nl_to_sql_service.log', level=logging.
     INFO, format=
     '%(asctime)s - %(levelname)s - %(pathname)s:%(lineno)d - %(message)s')
 logger = logging.getLogger(__name__)
 bp = Blueprint('nl_to_sql', __name__, url_prefix='/api/nl-to-sql')
-DB_CONFIG = {
-    'host': 'YOUR_DATABASE_HOST',
-    'port': 'YOUR_DATABASE_POST',
-    'user': 'YOUR_DATABASE_USER',
-    'password': 'YOUR_DATABASE_PASSWORD',
-    'database': 'YOUR_DATABASE_NAME'
-}
-
 SQLITE_DB_PATH = '../.venv/BIRD'
 FLASH_CLIENT = genai.Client(project="your-gcp-project-id")
 FLASH_MODEL = 'gemini-2.0-flash-001'
-streaming_id = None
 PROMPT_DIR = '../resources/prompts/'
 SCHEMA_FILE_PATH = '../data/BIRD_table_schema_info.json'
 COMPACT_STATS_FILE_PATH = '../data/compact_dataset_stats.json'
 CLEAN_SCHEMA_FILE_PATH = '../data/clean_and_must_follow_schema_details.json'
+EVIDENCE_FILE_PATH = '../data/all_evidence.json'
 SQL_GENERATION_PROMPT_PATH = os.path.join(PROMPT_DIR,
     'sql_generation_prompt.json')
 SQL_RETRY_PROMPT_PATH = os.path.join(PROMPT_DIR, 'sql_retry_prompt.json')
@@ -41,111 +40,96 @@ os.makedirs(PROMPT_DIR, exist_ok=True)
 
 def get_db_connection():
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        return conn
+        return db_pool.get_request_connection()
     except mysql.connector.Error as e:
         logger.error(f'Database connection error: {str(e)}')
         raise
 
 
-def get_sqlite_connection():
+def ensure_prompt_files():
     try:
-        conn = sqlite3.connect(SQLITE_DB_PATH)
-        conn.row_factory = sqlite3.Row
-        return conn
-    except sqlite3.Error as e:
-        logger.error(f'SQLite connection error: {str(e)}')
-        raise
+        if not os.path.exists(SQL_GENERATION_PROMPT_PATH):
+            default_sql_prompt = {'system_message':
+                'You are a database expert who knows every intricacy of SQL query generation.'
+                , 'task_description':
+                'Generate a SQL query to answer the following question.',
+                'sqlite_guidelines': [
+                'SQLite does not support RIGHT JOIN or FULL OUTER JOIN - use LEFT JOIN instead'
+                ,
+                'Use double quotes for identifiers (table and column names) and single quotes for string literals'
+                ,
+                'For date operations, use SQLite date functions like strftime()'
+                , 'SQLite supports LIMIT and OFFSET for pagination',
+                'SQLite does not support advanced window functions - keep aggregations simple'
+                ,
+                'IMPORTANT: Always include LIMIT 10 when retrieving lists of data'
+                ,
+                'Use clear column aliases for readability (e.g., COUNT(*) AS total_count)'
+                ], 'column_name_rules': [
+                'Use EXACTLY the column names as they appear in the schema - check each column name carefully'
+                , 'Do NOT use spaces in column names',
+                'Always double-check aliases when using table.column notation'
+                ,
+                'Verify all column names against the schema before finalizing any query'
+                ]}
+            with open(SQL_GENERATION_PROMPT_PATH, 'w') as f:
+                json.dump(default_sql_prompt, f, indent=2)
+        if not os.path.exists(SQL_RETRY_PROMPT_PATH):
+            default_retry_prompt = {'system_message':
+                'You are a database expert who needs to fix a SQL query that failed.'
+                , 'task_description':
+                'Analyze the error message provided and fix the SQL query that failed.'
+                , 'sqlite_guidelines': [
+                'SQLite does not support RIGHT JOIN or FULL OUTER JOIN - use LEFT JOIN instead'
+                ,
+                'Use double quotes for identifiers (table and column names) and single quotes for string literals'
+                ,
+                'For date operations, use SQLite date functions like strftime()'
+                , 'SQLite supports LIMIT and OFFSET for pagination',
+                'SQLite does not support advanced window functions - keep aggregations simple'
+                ,
+                'IMPORTANT: Always include LIMIT 10 when retrieving lists of data'
+                ,
+                'Use clear column aliases for readability (e.g., COUNT(*) AS total_count)'
+                ], 'column_name_rules': [
+                'Use EXACTLY the column names as they appear in the schema - check each column name carefully'
+                , 'Do NOT use spaces in column names',
+                'Always double-check aliases when using table.column notation'
+                ,
+                'Verify all column names against the schema before finalizing any query'
+                ], 'common_errors_to_fix': [
+                'Incorrect column or table names',
+                'Missing quotes around identifiers with spaces',
+                'Invalid SQL syntax', 'Type mismatches in comparisons',
+                'Missing or incorrect join conditions'],
+                'analysis_instructions': [
+                'Carefully examine the error message to identify the exact issue'
+                , 'Check if column or table names are incorrect',
+                'Verify that all syntax is valid for SQLite',
+                'Ensure all column references are properly quoted if they contain spaces'
+                ,
+                'Check for type mismatches in comparisons or calculations']
+                }
+            with open(SQL_RETRY_PROMPT_PATH, 'w') as f:
+                json.dump(default_retry_prompt, f, indent=2)
+    except Exception as e:
+        logger.error(f'Error writing default prompt files: {str(e)}')
+
+
+ensure_prompt_files()
 
 
 def load_files():
     try:
-        with open(SCHEMA_FILE_PATH, 'r') as f:
-            schema_data = json.load(f)
-        try:
-            with open(CLEAN_SCHEMA_FILE_PATH, 'r') as f:
-                clean_schema_data = json.load(f)
-                logger.info('Successfully loaded clean schema details')
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            logger.warning(f'Failed to load clean schema details: {str(e)}')
-            clean_schema_data = {}
-        try:
-            with open(COMPACT_STATS_FILE_PATH, 'r') as f:
-                compact_stats_data = json.load(f)
-                logger.info('Successfully loaded compact dataset statistics')
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            logger.warning(
-                f'Failed to load compact dataset statistics: {str(e)}')
-            compact_stats_data = {}
+        schema_data = resource_registry.get_json(SCHEMA_FILE_PATH)
+        clean_schema_data = resource_registry.get_json(CLEAN_SCHEMA_FILE_PATH,
+            {})
+        compact_stats_data = resource_registry.get_json(
+            COMPACT_STATS_FILE_PATH, {})
         try:
-            if not os.path.exists(SQL_GENERATION_PROMPT_PATH):
-                default_sql_prompt = {'system_message':
-                    'You are a database expert who knows every intricacy of SQL query generation.'
-                    , 'task_description':
-                    'Generate a SQL query to answer the following question.',
-                    'sqlite_guidelines': [
-                    'SQLite does not support RIGHT JOIN or FULL OUTER JOIN - use LEFT JOIN instead'
-                    ,
-                    'Use double quotes for identifiers (table and column names) and single quotes for string literals'
-                    ,
-                    'For date operations, use SQLite date functions like strftime()'
-                    , 'SQLite supports LIMIT and OFFSET for pagination',
-                    'SQLite does not support advanced window functions - keep aggregations simple'
-                    ,
-                    'IMPORTANT: Always include LIMIT 10 when retrieving lists of data'
-                    ,
-                    'Use clear column aliases for readability (e.g., COUNT(*) AS total_count)'
-                    ], 'column_name_rules': [
-                    'Use EXACTLY the column names as they appear in the schema - check each column name carefully'
-                    , 'Do NOT use spaces in column names',
-                    'Always double-check aliases when using table.column notation'
-                    ,
-                    'Verify all column names against the schema before finalizing any query'
-                    ]}
-                with open(SQL_GENERATION_PROMPT_PATH, 'w') as f:
-                    json.dump(default_sql_prompt, f, indent=2)
-            if not os.path.exists(SQL_RETRY_PROMPT_PATH):
-                default_retry_prompt = {'system_message':
-                    'You are a database expert who needs to fix a SQL query that failed.'
-                    , 'task_description':
-                    'Analyze the error message provided and fix the SQL query that failed.'
-                    , 'sqlite_guidelines': [
-                    'SQLite does not support RIGHT JOIN or FULL OUTER JOIN - use LEFT JOIN instead'
-                    ,
-                    'Use double quotes for identifiers (table and column names) and single quotes for string literals'
-                    ,
-                    'For date operations, use SQLite date functions like strftime()'
-                    , 'SQLite supports LIMIT and OFFSET for pagination',
-                    'SQLite does not support advanced window functions - keep aggregations simple'
-                    ,
-                    'IMPORTANT: Always include LIMIT 10 when retrieving lists of data'
-                    ,
-                    'Use clear column aliases for readability (e.g., COUNT(*) AS total_count)'
-                    ], 'column_name_rules': [
-                    'Use EXACTLY the column names as they appear in the schema - check each column name carefully'
-                    , 'Do NOT use spaces in column names',
-                    'Always double-check aliases when using table.column notation'
-                    ,
-                    'Verify all column names against the schema before finalizing any query'
-                    ], 'common_errors_to_fix': [
-                    'Incorrect column or table names',
-                    'Missing quotes around identifiers with spaces',
-                    'Invalid SQL syntax', 'Type mismatches in comparisons',
-                    'Missing or incorrect join conditions'],
-                    'analysis_instructions': [
-                    'Carefully examine the error message to identify the exact issue'
-                    , 'Check if column or table names are incorrect',
-                    'Verify that all syntax is valid for SQLite',
-                    'Ensure all column references are properly quoted if they contain spaces'
-                    ,
-                    'Check for type mismatches in comparisons or calculations']
-                    }
-                with open(SQL_RETRY_PROMPT_PATH, 'w') as f:
-                    json.dump(default_retry_prompt, f, indent=2)
-            with open(SQL_GENERATION_PROMPT_PATH, 'r') as f:
-                sql_generation_prompt = json.load(f)
-            with open(SQL_RETRY_PROMPT_PATH, 'r') as f:
-                sql_retry_prompt = json.load(f)
+            sql_generation_prompt = resource_registry.get_json(
+                SQL_GENERATION_PROMPT_PATH)
+            sql_retry_prompt = resource_registry.get_json(SQL_RETRY_PROMPT_PATH)
             prompts = {'sql_generation': sql_generation_prompt, 'sql_retry':
                 sql_retry_prompt}
         except Exception as e:
@@ -169,152 +153,54 @@ def call_flash_api(prompt, response_schema, max_tokens=8192):
     try:
         logger.info('Calling Flash (Gemini) API')
         logger.info(f'Prompt (abbreviated): {prompt[:200]}...')
-        generate_content_config = types.GenerateContentConfig(temperature=0,
-            top_p=0.95, max_output_tokens=max_tokens, response_modalities=[
-            'TEXT'], safety_settings=[types.SafetySetting(category=
-            'HARM_CATEGORY_HATE_SPEECH', threshold='OFF'), types.
-            SafetySetting(category='HARM_CATEGORY_DANGEROUS_CONTENT',
-            threshold='OFF'), types.SafetySetting(category=
-            'HARM_CATEGORY_SEXUALLY_EXPLICIT', threshold='OFF'), types.
-            SafetySetting(category='HARM_CATEGORY_HARASSMENT', threshold=
-            'OFF')], response_mime_type='application/json', response_schema
-            =response_schema)
-        contents = [types.Content(role='user', parts=[types.Part.from_text(
-            text=prompt)])]
-        response_text = ''
-        for chunk in FLASH_CLIENT.models.generate_content_stream(model=
-            FLASH_MODEL, contents=contents, config=generate_content_config):
-            chunk_text = chunk.text if chunk.text else ''
-            response_text += chunk_text
+        response_text = llm_client.generate_flash(FLASH_CLIENT, FLASH_MODEL,
+            prompt, llm_client.flash_config(response_schema, max_tokens),
+            deadline=llm_client.INTERACTIVE_DEADLINE_SECONDS, label='nl_to_sql'
+            )
         logger.info(
             f'Flash API response received: {len(response_text)} characters')
         logger.info(f'Response (abbreviated): {response_text[:200]}...')
-        try:
-            parsed_response = json.loads(response_text)
-            return parsed_response
-        except json.JSONDecodeError as e:
-            logger.error(f'Failed to parse JSON from Flash response: {str(e)}')
-            json_start = response_text.find('```json')
-            if json_start != -1:
-                json_start += 7
-                json_end = response_text.find('```', json_start)
-                if json_end != -1:
-                    json_str = response_text[json_start:json_end].strip()
-                    try:
-                        return json.loads(json_str)
-                    except json.JSONDecodeError:
-                        pass
-            json_start = response_text.find('```')
-            if json_start != -1:
-                json_start += 3
-                json_end = response_text.find('```', json_start)
-                if json_end != -1:
-                    json_str = response_text[json_start:json_end].strip()
-                    try:
-                        return json.loads(json_str)
-                    except json.JSONDecodeError:
-                        pass
+        parsed_response = llm_client.parse_json(response_text)
+        if parsed_response is None:
+            logger.error('Failed to parse JSON from Flash response')
             logger.error(f'Raw response: {response_text[:1000]}...')
-            return None
+        return parsed_response
     except Exception as e:
         logger.error(f'Error calling Flash API: {str(e)}')
         logger.error(traceback.format_exc())
         return None
 
 
-def execute_sql_query(sql_query):
-    try:
-        sqlite_conn = get_sqlite_connection()
-        cursor = sqlite_conn.cursor()
-        start_time = time.time()
-        cursor.execute(sql_query)
-        rows = cursor.fetchall()
-        elapsed_time = time.time() - start_time
-        column_names = [description[0] for description in cursor.description
-            ] if cursor.description else []
-        formatted_results = []
-        for row in rows:
-            row_dict = {}
-            for i, column_name in enumerate(column_names):
-                value = row[i]
-                row_dict[column_name] = value
-            formatted_results.append(row_dict)
-        cursor.close()
-        sqlite_conn.close()
-        return {'success': True, 'result_rows': formatted_results,
-            'column_names': column_names, 'row_count': len(rows),
-            'elapsed_time': elapsed_time}
-    except sqlite3.Error as e:
-        logger.error(f'SQLite error executing query: {str(e)}')
-        return {'success': False, 'error': str(e), 'traceback': traceback.
-            format_exc()}
+def validate_sql(sql_query):
+    validator = sql_validator.get_validator(resource_registry.get_json(
+        SCHEMA_FILE_PATH), resource_registry.get_json(
+        COMPACT_STATS_FILE_PATH, None))
+    validation = validator.validate(sql_query)
+    for fix in validation.fixes:
+        logger.info(
+            f"Validator fixed {fix['kind']} {fix['from']!r} -> {fix['to']!r} ({fix['reason']})"
+            )
+    return validation.sql, validation
+
+
+def execute_sql_query(sql_query, cancel_key=None, validation=None):
+    execution_result = sql_sandbox.execute(sql_query, SQLITE_DB_PATH,
+        cancel_key)
+    if validation is not None:
+        sql_validator.record_outcome(validation, execution_result.get(
+            'success'))
+        if validation.fixes or validation.issues:
+            execution_result['validation'] = validation.to_dict()
+    return execution_result
 
 
 def generate_sql_with_flash(question, schema_data, clean_schema_data,
     compact_stats_data, prompts, user_id=None, dataset_id=None, is_retry=
-    False, error_info=None):
+    False, error_info=None, tables=None, streaming_id=None):
     try:
-        prompt_data = prompts.get('sql_retry' if is_retry else
-            'sql_generation', {})
-        prompt = f"""
-{prompt_data.get('system_message', 'You are a database expert who knows every intricacy of SQL query generation for SQLite databases.')}
-
-{prompt_data.get('task_description', 'Generate a SQL query to answer the following question:')}
-"{question}"
-
-{json.dumps(schema_data, indent=2)}
-
-{json.dumps(clean_schema_data, indent=2)}
-
-{json.dumps(compact_stats_data, indent=2)}
-
-"""
-        for guideline in prompt_data.get('sqlite_guidelines', [
-            'SQLite does not support RIGHT JOIN or FULL OUTER JOIN - use LEFT JOIN instead'
-            ,
-            'Use double quotes for identifiers (table and column names) and single quotes for string literals'
-            ,
-            'For date operations, use SQLite date functions like strftime()',
-            'SQLite supports LIMIT and OFFSET for pagination',
-            'SQLite does not support advanced window functions - keep aggregations simple'
-            ,
-            'IMPORTANT: Always include LIMIT 10 when retrieving lists of data',
-            'Use clear column aliases for readability (e.g., COUNT(*) AS total_count)'
-            ]):
-            prompt += f'- {guideline}\n'
-        prompt += '\n# CRITICAL: Column Name Rules\n'
-        for rule in prompt_data.get('column_name_rules', [
-            'Use EXACTLY the column names as they appear in the schema - check each column name carefully'
-            , 'Do NOT use spaces in column names',
-            'Always double-check aliases when using table.column notation',
-            'Verify all column names against the schema before finalizing any query'
-            ]):
-            prompt += f'- {rule}\n'
-        if is_retry and error_info:
-            prompt += f"""
-```sql
-{error_info.get('previous_sql', '')}
-```
-
-{error_info.get('error', '')}
-
-{error_info.get('traceback', '')}
-
-"""
-            for error in prompt_data.get('common_errors_to_fix', [
-                'Incorrect column or table names',
-                'Missing quotes around identifiers with spaces',
-                'Invalid SQL syntax', 'Type mismatches in comparisons',
-                'Missing or incorrect join conditions']):
-                prompt += f'- {error}\n'
-            prompt += '\n# Analysis Instructions\n'
-            for instruction in prompt_data.get('analysis_instructions', [
-                'Carefully examine the error message to identify the exact issue'
-                , 'Check if column or table names are incorrect',
-                'Verify that all syntax is valid for SQLite',
-                'Ensure all column references are properly quoted if they contain spaces'
-                , 'Check for type mismatches in comparisons or calculations']):
-                prompt += f'- {instruction}\n'
+        prompt = prompt_assembly.build_sql_prompt(question, schema_data,
+            clean_schema_data, compact_stats_data, prompts, is_retry,
+            error_info, tables)
         response_schema = get_flash_sql_response_schema()
         if user_id and streaming_id:
             stream_manager.update_stream(user_id, streaming_id, 'nl_to_sql',
@@ -438,19 +324,30 @@ def create_query_record(conn, dataset_id, question, query_model,
 
 @bp.route('', methods=['POST'])
 def generate_sql():
+    data = request.json
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+    if jobs.wants_async(data):
+        data = dict(data, results_format='columnar' if result_format.
+            wants_columnar(data) else 'rows')
+        return jobs.submit_response('nl_to_sql', run_generate_sql, (data,),
+            (data.get('user_id'), data.get('streaming_id') or data.get(
+            'dataset_id'), 'nl_to_sql'))
+    return run_generate_sql(data)
+
+
+def run_generate_sql(data):
+    user_id = streaming_id = None
     try:
-        data = request.json
-        if not data:
-            return jsonify({'error': 'No data provided'}), 400
         dataset_id = data.get('dataset_id')
         user_id = data.get('user_id')
-        global streaming_id
         streaming_id = data.get('streaming_id') or data.get('dataset_id')
         if streaming_id and user_id:
             stream_manager.update_stream(user_id, streaming_id, 'nl_to_sql',
                 'starting', 'Starting SQL generation for your question', 0)
         question = data.get('question')
         decision = data.get('decision', '')
+        columnar = result_format.wants_columnar(data)
         if not question:
             return jsonify({'error': 'Question is required'}), 400
         if not user_id:
@@ -498,9 +395,10 @@ def generate_sql():
             COT_details = json.loads(query_record['COT_details']
                 ) if query_record['COT_details'] else {}
             sql = current_sql_options.get('sql_query', '')
-            results = execution_details.get('result_rows', [])
             reasoning = COT_details.get('explanation', '')
-            answer = format_answer_from_results(results)
+            answer = format_answer_from_results(result_format.rows_of(
+                execution_details))
+            results = result_format.api_results(execution_details, columnar)
             conn.close()
             return jsonify({'success': True, 'dataset_id': dataset_id,
                 'sql': sql, 'reasoning': reasoning, 'answer': answer,
@@ -508,27 +406,35 @@ def generate_sql():
         logger.info(
             f'No existing query found. Generating new SQL for dataset_id={dataset_id}, question={question}'
             )
+        conn.close()
         schema_data, clean_schema_data, compact_stats_data, prompts = (
             load_files())
         if streaming_id and user_id:
             stream_manager.update_stream(user_id, streaming_id, 'nl_to_sql',
                 'query_generation', 'Getting SQL from NL2SQL', 30)
+        tables = schema_retrieval.select_tables(question, SCHEMA_FILE_PATH,
+            COMPACT_STATS_FILE_PATH, EVIDENCE_FILE_PATH)
         sql, thought_process, explanation = generate_sql_with_flash(question,
             schema_data, clean_schema_data, compact_stats_data, prompts,
-            user_id, dataset_id)
+            user_id, dataset_id, tables=tables, streaming_id=streaming_id)
         if not sql:
             conn.close()
             return jsonify({'success': False, 'error':
                 'Failed to generate SQL query', 'message': explanation or
                 'Unknown error occurred'}), 500
         logger.info(f'Generated SQL: {sql}')
+        sql, validation = validate_sql(sql)
         if user_id and streaming_id:
             stream_manager.update_stream(user_id, streaming_id, 'nl_to_sql',
                 'executing_sql', 'Executing SQL query against database', 60)
+        conn.reopen()
         query_id = create_query_record(conn, dataset_id, question,
             'question_to_sql', 1, sql, thought_process, explanation, None,
             sql_gen_status='pending')
-        execution_result = execute_sql_query(sql)
+        conn.close()
+        cancel_key = sql_sandbox.make_cancel_key(user_id, 'nl_to_sql')
+        execution_result = execute_sql_query(sql, cancel_key, validation)
+        conn.reopen()
         cursor = conn.cursor()
         update_query = """
         UPDATE query
@@ -542,6 +448,11 @@ def generate_sql():
             'failed', query_id))
         conn.commit()
         cursor.close()
+        if execution_result.get('cancelled'):
+            conn.close()
+            return jsonify({'success': False, 'cancelled': True,
+                'dataset_id': dataset_id, 'error': execution_result.get(
+                'error'), 'query_id': query_id}), 409
         if user_id and streaming_id:
             stream_manager.update_stream(user_id, streaming_id, 'nl_to_sql',
                 'sql_executed', 'SQL executed, processing results', 70)
@@ -555,17 +466,20 @@ def generate_sql():
                 stream_manager.update_stream(user_id, streaming_id,
                     'nl_to_sql', 'retry_sql',
                     'Refining SQL query for correct results', 90)
+            conn.close()
             sql, thought_process, explanation = generate_sql_with_flash(
                 question, schema_data, clean_schema_data,
                 compact_stats_data, prompts, user_id, dataset_id, is_retry=
-                True, error_info=error_info)
+                True, error_info=error_info, streaming_id=streaming_id)
             if not sql:
                 conn.close()
                 return jsonify({'success': False, 'error':
                     'Failed to generate valid SQL query after retry',
                     'message': explanation or 'Unknown error occurred'}), 500
             logger.info(f'Retry SQL: {sql}')
-            execution_result = execute_sql_query(sql)
+            sql, validation = validate_sql(sql)
+            execution_result = execute_sql_query(sql, cancel_key, validation)
+            conn.reopen()
         if not execution_result.get('success'):
             cursor = conn.cursor()
             update_query = """
@@ -610,8 +524,9 @@ def generate_sql():
             'success', query_id))
         conn.commit()
         cursor.close()
-        results = execution_result.get('result_rows', [])
-        answer = format_answer_from_results(results)
+        answer = format_answer_from_results(result_format.rows_of(
+            execution_result))
+        results = result_format.api_results(execution_result, columnar)
         conn.close()
         return jsonify({'success': True, 'dataset_id': dataset_id, 'sql':
             sql, 'reasoning': explanation, 'answer': answer, 'results':
@@ -0,0 +1,335 @@
+import json
+import logging
+import threading
+from . import resource_registry
+logger = logging.getLogger(__name__)
+COMPACT_SEPARATORS = ',', ':'
+DEFAULT_SQL_GUIDELINES = [
+    'SQLite does not support RIGHT JOIN or FULL OUTER JOIN - use LEFT JOIN instead'
+    ,
+    'Use double quotes for identifiers (table and column names) and single quotes for string literals'
+    , 'For date operations, use SQLite date functions like strftime()',
+    'SQLite supports LIMIT and OFFSET for pagination',
+    'SQLite does not support advanced window functions - keep aggregations simple'
+    , 'IMPORTANT: Always include LIMIT 10 when retrieving lists of data',
+    'Use clear column aliases for readability (e.g., COUNT(*) AS total_count)']
+DEFAULT_COLUMN_NAME_RULES = [
+    'Use EXACTLY the column names as they appear in the schema - check each column name carefully'
+    , 'Do NOT use spaces in column names',
+    'Always double-check aliases when using table.column notation',
+    'Verify all column names against the schema before finalizing any query']
+DEFAULT_COMMON_ERRORS = ['Incorrect column or table names',
+    'Missing quotes around identifiers with spaces', 'Invalid SQL syntax',
+    'Type mismatches in comparisons', 'Missing or incorrect join conditions']
+DEFAULT_ANALYSIS_INSTRUCTIONS = [
+    'Carefully examine the error message to identify the exact issue',
+    'Check if column or table names are incorrect',
+    'Verify that all syntax is valid for SQLite',
+    'Ensure all column references are properly quoted if they contain spaces',
+    'Check for type mismatches in comparisons or calculations']
+DEFAULT_SUGGESTION_GUIDELINES = [
+    'Generate 3-5 refinement questions that will help improve the decision-making process'
+    ,
+    'Each question must be clear, specific, and answerable using SQL queries against the database'
+    ,
+    'The questions should address different types of potential biases or limitations'
+    , 'Ensure your response follows the required format exactly']
+_templates = {}
+_lock = threading.Lock()
+
+
+class Slot:
+
+    def __init__(self, name):
+        self.name = name
+
+
+class PromptTemplate:
+    """Static prompt text with named slots for the per-request values."""
+
+    def __init__(self, parts):
+        self.literals = ['']
+        self.slots = []
+        for part in parts:
+            if isinstance(part, Slot):
+                self.slots.append(part.name)
+                self.literals.append('')
+            else:
+                self.literals[-1] += part
+        self.static_bytes = sum(len(literal.encode('utf-8')) for literal in
+            self.literals)
+
+    def render(self, **values):
+        pieces = [self.literals[0]]
+        for name, literal in zip(self.slots, self.literals[1:]):
+            pieces.append(str(values.get(name, '')))
+            pieces.append(literal)
+        return ''.join(pieces)
+
+
+def compact_json(data):
+    return json.dumps(data, separators=COMPACT_SEPARATORS)
+
+
+class TableFragments:
+    """Compact JSON pieces of the schema and stats, tagged by table.
+
+    Rendering a subset joins the pieces of the selected tables, which gives
+    the same text as dumping the pruned dicts without re-serialising them.
+    """
+
+    def __init__(self, schema_data, compact_stats_data):
+        schema_data = schema_data or {}
+        self.table_names = set(schema_data) | set((compact_stats_data or {}
+            ).get('tables', {}))
+        self.schema = self._pieces(schema_data)
+        self.stats = []
+        for key, value in (compact_stats_data or {}).items():
+            if key == 'column_groups' and isinstance(value, dict):
+                groups = [(group, [(self._table_of(item), json.dumps(item)) for
+                    item in items]) for group, items in value.items()]
+                self.stats.append((key, 'groups', groups))
+            elif isinstance(value, dict):
+                self.stats.append((key, 'dict', self._pieces(value)))
+            else:
+                self.stats.append((key, 'raw', compact_json(value)))
+
+    def _table_of(self, key):
+        if key in self.table_names:
+            return key
+        return key.split('.', 1)[0]
+
+    def _pieces(self, data):
+        return [(self._table_of(key), f'{json.dumps(key)}:{compact_json(value)}'
+            ) for key, value in data.items()]
+
+    @staticmethod
+    def _join(pieces, tables):
+        return '{' + ','.join(piece for table, piece in pieces if table in
+            tables) + '}'
+
+    def render_schema(self, tables):
+        return self._join(self.schema, set(tables))
+
+    def render_stats(self, tables):
+        tables = set(tables)
+        sections = []
+        for key, kind, value in self.stats:
+            if kind == 'groups':
+                groups = []
+                for group, items in value:
+                    selected = [item for table, item in items if table in
+                        tables]
+                    if selected:
+                        groups.append(f'{json.dumps(group)}:[{",".join(selected)}]'
+                            )
+                rendered = '{' + ','.join(groups) + '}'
+            elif kind == 'dict':
+                rendered = self._join(value, tables)
+            else:
+                rendered = value
+            sections.append(f'{json.dumps(key)}:{rendered}')
+        return '{' + ','.join(sections) + '}'
+
+
+def _bullets(items):
+    return ''.join(f'- {item}\n' for item in items)
+
+
+def _cached_template(kind, sources, compile_template):
+    with _lock:
+        entry = _templates.get(kind)
+        if entry and len(entry[0]) == len(sources) and all(old is new or
+            old == new for old, new in zip(entry[0], sources)):
+            return entry[1]
+        template = compile_template()
+        _templates[kind] = sources, template
+        if isinstance(template, PromptTemplate):
+            logger.info(
+                f'Compiled {kind} prompt template ({template.static_bytes} static bytes)'
+                )
+        return template
+
+
+def invalidate(path=None):
+    with _lock:
+        if _templates:
+            logger.info(f'Dropping compiled prompt templates after reload of {path}'
+                )
+        _templates.clear()
+
+
+resource_registry.add_reload_listener(invalidate)
+
+
+def _compile_sql_template(schema_data, clean_schema_data,
+    compact_stats_data, prompt_data, is_retry, pruned=False):
+    schema_part = Slot('schema') if pruned else compact_json(schema_data)
+    stats_part = Slot('stats') if pruned else compact_json(compact_stats_data)
+    parts = [
+        f"""
+{prompt_data.get('system_message', 'You are a database expert who knows every intricacy of SQL query generation for SQLite databases.')}
+
+{prompt_data.get('task_description', 'Generate a SQL query to answer the following question:')}
+\""""
+        , Slot('question'), '"\n\n', schema_part,
+        f"""
+
+{compact_json(clean_schema_data)}
+
+"""
+        , stats_part, '\n\n', _bullets(prompt_data.get('sqlite_guidelines',
+        DEFAULT_SQL_GUIDELINES)), '\n# CRITICAL: Column Name Rules\n',
+        _bullets(prompt_data.get('column_name_rules',
+        DEFAULT_COLUMN_NAME_RULES))]
+    if is_retry:
+        parts += ['\n```sql\n', Slot('previous_sql'), '\n```\n\n', Slot(
+            'error'), '\n\n', Slot('traceback'), '\n\n', _bullets(
+            prompt_data.get('common_errors_to_fix', DEFAULT_COMMON_ERRORS)),
+            '\n# Analysis Instructions\n', _bullets(prompt_data.get(
+            'analysis_instructions', DEFAULT_ANALYSIS_INSTRUCTIONS))]
+    return PromptTemplate(parts)
+
+
+def build_sql_prompt(question, schema_data, clean_schema_data,
+    compact_stats_data, prompts, is_retry=False, error_info=None, tables=None
+    ):
+    """Render the SQL prompt, limited to `tables` when a subset is given."""
+    prompt_data = prompts.get('sql_retry' if is_retry else
+        'sql_generation', {})
+    with_error = bool(is_retry and error_info)
+    pruned = tables is not None
+    kind = ('sql_retry' if with_error else 'sql_generation') + ('_pruned' if
+        pruned else '')
+    template = _cached_template(kind, (schema_data, clean_schema_data,
+        compact_stats_data, prompt_data), lambda : _compile_sql_template(
+        schema_data, clean_schema_data, compact_stats_data, prompt_data,
+        with_error, pruned))
+    values = {'question': question}
+    if with_error:
+        values.update(previous_sql=error_info.get('previous_sql', ''),
+            error=error_info.get('error', ''), traceback=error_info.get(
+            'traceback', ''))
+    if pruned:
+        fragments = _cached_template('table_fragments', (schema_data,
+            compact_stats_data), lambda : TableFragments(schema_data,
+            compact_stats_data))
+        values.update(schema=fragments.render_schema(tables), stats=
+            fragments.render_stats(tables))
+    return template.render(**values)
+
+
+def _pillar_categories(pillar_data):
+    vulnerability_categories = []
+    for category in pillar_data.get('vulnerability', {}).get('categories', []
+        ):
+        items = []
+        for item in category.get('items', []):
+            items.append({'name': item.get('item_name', ''), 'id': item.get
+                ('vulnerability_id', 0), 'description': item.get(
+                'item_description', '')})
+        vulnerability_categories.append({'name': category.get(
+            'category_name', ''), 'description': category.get(
+            'category_description', ''), 'items': items})
+    toulmin_components = []
+    for category in pillar_data.get('toulmin', {}).get('categories', []):
+        if category.get('category_name') == 'Argument Components':
+            for item in category.get('items', []):
+                sub_items = []
+                for sub_item in item.get('sub_items', []):
+                    sub_items.append({'name': sub_item.get('aspect_name',
+                        ''), 'description': sub_item.get('description', '')})
+                toulmin_components.append({'name': item.get('item_name',
+                    ''), 'description': item.get('item_description', ''),
+                    'aspects': sub_items})
+
+    def named_categories(data):
+        categories = []
+        for category in data.get('categories', []):
+            item_details = []
+            for item in category.get('items', []):
+                item_details.append({'name': item.get('item_name', ''),
+                    'description': item.get('item_description', '')})
+            categories.append({'name': category.get('category_name', ''),
+                'description': category.get('category_description', ''),
+                'items': item_details})
+        return categories
+    return vulnerability_categories, toulmin_components, named_categories(
+        pillar_data.get('dataset_schema', {})), named_categories(pillar_data
+        .get('counterargument', {}))
+
+
+def _compile_suggestions_template(schema_data, clean_schema_data,
+    compact_stats_data, pillar_data, suggestions_prompt):
+    parts = [
+        f"""
+{suggestions_prompt.get('system_message', 'You are a data science expert specialized in generating precise, insightful questions.')}
+
+{suggestions_prompt.get('task_description', 'For the given decision scenario, generate questions that help make better decisions.')}
+
+Original Question: \""""
+        , Slot('question'), '"\nDecision Context: "', Slot('decision'),
+        f""""
+
+{compact_json(schema_data)}
+
+{compact_json(clean_schema_data)}
+
+{compact_json(compact_stats_data)}
+
+{suggestions_prompt.get('hard_to_vary_definition', 'A hard-to-vary explanation has specific, data-constrained, non-arbitrary components.')}
+
+"""
+        ]
+    if 'computational_algorithm' in suggestions_prompt:
+        for step in suggestions_prompt.get('computational_algorithm', []):
+            parts.append(
+                f"\n## {step.get('stage', '')}\n{step.get('description', '')}\n"
+                )
+    else:
+        (vulnerability_categories, toulmin_components, schema_categories,
+            counterargument_categories) = _pillar_categories(pillar_data)
+        parts += ["""
+Systematically analyze the decision scenario for potential cognitive biases using this reference:
+"""
+            , compact_json(vulnerability_categories),
+            '\nFor each bias pattern identified, map to the database schema:\n'
+            , compact_json(schema_categories),
+            """
+Classify each potential question according to these argument components:
+"""
+            , compact_json(toulmin_components),
+            """
+Evaluate each potential question against these counter-argument frameworks:
+"""
+            , compact_json(counterargument_categories),
+            """
+Produce a final set of questions by:
+- Removing redundancies while preserving distinctness
+- Ensuring comprehensive coverage across bias types and argument components
+- Formulating questions in clear, precise natural language
+- Ensuring each question contributes to a hard-to-vary explanation
+"""
+            ]
+    parts += ['\n# Important Guidelines\n', _bullets(suggestions_prompt.
+        get('important_guidelines', DEFAULT_SUGGESTION_GUIDELINES))]
+    return PromptTemplate(parts)
+
+
+def build_suggestions_prompt(question, decision, schema_data,
+    clean_schema_data, compact_stats_data, pillar_data, prompts):
+    suggestions_prompt = prompts.get('suggestions', {})
+    sources = schema_data, clean_schema_data, compact_stats_data, *(
+        pillar_data.get(key) for key in ('vulnerability', 'toulmin',
+        'dataset_schema', 'counterargument')), suggestions_prompt
+    template = _cached_template('suggestions', sources, lambda :
+        _compile_suggestions_template(schema_data, clean_schema_data,
+        compact_stats_data, pillar_data, suggestions_prompt))
+    return template.render(question=question, decision=decision)
+
+
+def get_stats():
+    with _lock:
+        return {kind: {'static_bytes': entry[1].static_bytes, 'slots':
+            entry[1].slots} for kind, entry in _templates.items() if
+            isinstance(entry[1], PromptTemplate)}
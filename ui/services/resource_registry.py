@@ -0,0 +1,159 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+os.makedirs('logs', exist_ok=True)
+logging.basicConfig(filename='logs/resource_registry.log', level=logging.
+    INFO, format=
+    '%(asctime)s - %(levelname)s - %(pathname)s:%(lineno)d - %(message)s')
+logger = logging.getLogger(__name__)
+MTIME_CHECK_INTERVAL_SECONDS = float(os.environ.get(
+    'RESOURCE_MTIME_CHECK_INTERVAL', 1.0))
+_MISSING = object()
+_resources = {}
+_reload_listeners = []
+_lock = threading.RLock()
+
+
+def _deep_sizeof(obj, seen=None):
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(k, seen) + _deep_sizeof(v, seen) for k, v in
+            obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(_deep_sizeof(item, seen) for item in obj)
+    return size
+
+
+def _load(path, mtime):
+    start_time = time.perf_counter()
+    with open(path, 'r') as f:
+        raw_text = f.read()
+    data = json.loads(raw_text)
+    load_seconds = time.perf_counter() - start_time
+    entry = {'path': path, 'mtime': mtime, 'data': data, 'serialized': {},
+        'checked_at': time.monotonic(), 'load_ms': load_seconds * 1000,
+        'bytes_on_disk': len(raw_text.encode('utf-8')), 'parsed_bytes':
+        _deep_sizeof(data), 'loads': 1}
+    logger.info(
+        f"Loaded resource {path} in {entry['load_ms']:.1f} ms ({entry['bytes_on_disk']} bytes on disk, ~{entry['parsed_bytes']} bytes parsed)"
+        )
+    return entry
+
+
+def _notify_reload(path):
+    for listener in list(_reload_listeners):
+        try:
+            listener(path)
+        except Exception as e:
+            logger.error(f'Resource reload listener failed for {path}: {str(e)}'
+                )
+
+
+def _get_entry(path):
+    key = os.path.abspath(path)
+    with _lock:
+        entry = _resources.get(key)
+        now = time.monotonic()
+        if entry and now - entry['checked_at'] < MTIME_CHECK_INTERVAL_SECONDS:
+            return entry
+        try:
+            mtime = os.stat(key).st_mtime_ns
+        except FileNotFoundError:
+            if entry:
+                logger.warning(f'Resource {path} disappeared; dropping cache')
+                del _resources[key]
+                _notify_reload(key)
+            raise
+        if entry and entry['mtime'] == mtime:
+            entry['checked_at'] = now
+            return entry
+        try:
+            new_entry = _load(key, mtime)
+        except json.JSONDecodeError as e:
+            if entry:
+                logger.error(
+                    f'Failed to reload {path}, keeping previous version: {str(e)}'
+                    )
+                entry['checked_at'] = now
+                return entry
+            raise
+        if entry:
+            new_entry['loads'] = entry['loads'] + 1
+        _resources[key] = new_entry
+        if entry:
+            _notify_reload(key)
+        return new_entry
+
+
+def get_json(path, default=_MISSING):
+    try:
+        return _get_entry(path)['data']
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        if default is _MISSING:
+            raise
+        logger.warning(f'Using default for resource {path}: {str(e)}')
+        return default
+
+
+def get_serialized(path, indent=None, default=_MISSING):
+    try:
+        entry = _get_entry(path)
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        if default is _MISSING:
+            raise
+        logger.warning(f'Using default for resource {path}: {str(e)}')
+        return default
+    with _lock:
+        serialized = entry['serialized'].get(indent)
+        if serialized is None:
+            serialized = json.dumps(entry['data'], indent=indent)
+            entry['serialized'][indent] = serialized
+        return serialized
+
+
+def get_mtime(path):
+    try:
+        return _get_entry(path)['mtime']
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def add_reload_listener(listener):
+    with _lock:
+        if listener not in _reload_listeners:
+            _reload_listeners.append(listener)
+
+
+def invalidate(path=None):
+    with _lock:
+        if path is None:
+            keys = list(_resources.keys())
+            _resources.clear()
+        else:
+            keys = [os.path.abspath(path)]
+            _resources.pop(keys[0], None)
+    for key in keys:
+        _notify_reload(key)
+
+
+def get_stats():
+    with _lock:
+        resources = {}
+        for key, entry in _resources.items():
+            resources[key] = {'load_ms': entry['load_ms'], 'loads': entry[
+                'loads'], 'bytes_on_disk': entry['bytes_on_disk'],
+                'parsed_bytes': entry['parsed_bytes'], 'serialized_bytes':
+                {str(indent): len(text) for indent, text in entry[
+                'serialized'].items()}}
+        return {'resources': resources, 'total_parsed_bytes': sum(r[
+            'parsed_bytes'] for r in resources.values()),
+            'total_serialized_bytes': sum(sum(r['serialized_bytes'].values(
+            )) for r in resources.values()), 'total_load_ms': sum(r[
+            'load_ms'] for r in resources.values())}
@@ -0,0 +1,103 @@
+import json
+import os
+from flask import has_request_context, request
+RESULTS_FORMAT = os.environ.get('RESULTS_FORMAT', 'rows')
+TYPE_TAGS = {int: 'integer', float: 'real', str: 'text', bytes: 'blob',
+    bool: 'integer'}
+
+
+def _column_type(values):
+    tags = {TYPE_TAGS.get(type(value), 'text') for value in values if value
+         is not None}
+    if not tags:
+        return 'null'
+    if tags == {'integer', 'real'}:
+        return 'real'
+    return tags.pop() if len(tags) == 1 else 'mixed'
+
+
+def to_columnar(column_names, rows):
+    """Columnar result: names and type tags once, then one value list per column.
+
+    Blobs are stored as hex strings, tagged 'blob'. Unlike row dicts this
+    keeps every column when a query returns two with the same name.
+    """
+    values = [list(column) for column in zip(*rows)] if rows else [[] for
+        _ in column_names]
+    types = [_column_type(column) for column in values]
+    values = [[(value.hex() if isinstance(value, bytes) else value) for
+        value in column] if any(isinstance(value, bytes) for value in
+        column) else column for column in values]
+    return {'columns': list(column_names), 'types': types, 'values':
+        values, 'row_count': len(rows)}
+
+
+def to_rows(result):
+    """Row dicts ({column: value}) for a columnar result."""
+    if not result:
+        return []
+    return [dict(zip(result['columns'], row)) for row in zip(*result[
+        'values'])]
+
+
+def columnar_of(execution_details):
+    """Columnar result of stored execution_details, in either stored layout.
+
+    Queries executed before the columnar layout carry `result_rows`, a list
+    of row dicts; those are converted on read.
+    """
+    if not execution_details:
+        return to_columnar([], [])
+    if execution_details.get('result') is not None:
+        return execution_details['result']
+    rows = execution_details.get('result_rows') or []
+    column_names = execution_details.get('column_names') or (list(rows[0]) if
+        rows else [])
+    return to_columnar(column_names, [tuple(row.get(name) for name in
+        column_names) for row in rows])
+
+
+def rows_of(execution_details):
+    if not execution_details:
+        return []
+    if execution_details.get('result') is not None:
+        return to_rows(execution_details['result'])
+    return execution_details.get('result_rows', [])
+
+
+def wants_columnar(data):
+    """True when the caller asked for `results_format=columnar` (body or query).
+
+    Row dicts stay the default response layout (RESULTS_FORMAT) so
+    existing clients keep working. Read it in the request thread: job and
+    worker threads have the body but no request.
+    """
+    value = (data or {}).get('results_format')
+    if value is None and has_request_context():
+        value = request.args.get('results_format')
+    return str(value or RESULTS_FORMAT).lower() == 'columnar'
+
+
+def api_results(execution_details, columnar):
+    """`results` for an API response: columnar if requested, else row dicts."""
+    if columnar:
+        return columnar_of(execution_details)
+    return rows_of(execution_details)
+
+
+def present(result, columnar):
+    return result if columnar else to_rows(result)
+
+
+def render_for_prompt(result):
+    """Compact prompt text: a `name (type)` header line, then one JSON array per row."""
+    if not result or not result['columns']:
+        return '(no columns)'
+    lines = ['columns: ' + ', '.join(f'{name} ({type_tag})' for name,
+        type_tag in zip(result['columns'], result['types']))]
+    rows = list(zip(*result['values']))
+    if not rows:
+        lines.append('(no rows)')
+    for row in rows:
+        lines.append(json.dumps(list(row), separators=(',', ':'), default=str))
+    return '\n'.join(lines)
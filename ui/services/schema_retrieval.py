@@ -0,0 +1,241 @@
+import csv
+import io
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from . import resource_registry
+logger = logging.getLogger(__name__)
+RETRIEVAL_ENABLED = os.environ.get('SCHEMA_RETRIEVAL_ENABLED', '1') != '0'
+DEFAULT_TOP_K = int(os.environ.get('SCHEMA_RETRIEVAL_TOP_K', 4))
+DEFAULT_MAX_TABLES = int(os.environ.get('SCHEMA_RETRIEVAL_MAX_TABLES', 10))
+BM25_K1 = 1.2
+BM25_B = 0.75
+TABLE_NAME_WEIGHT = 3
+COLUMN_NAME_WEIGHT = 2
+MIN_EVIDENCE_COLUMN_LENGTH = 4
+MAX_EVIDENCE_COLUMN_TABLES = 2
+MAX_EVIDENCE_TOKEN_SHARE = 0.02
+STOPWORDS = {'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'did', 'do',
+    'does', 'for', 'from', 'has', 'have', 'how', 'in', 'is', 'it', 'list',
+    'many', 'much', 'of', 'on', 'or', 'please', 'refers', 'show', 'that',
+    'the', 'their', 'there', 'these', 'this', 'to', 'was', 'were', 'what',
+    'when', 'where', 'which', 'who', 'whose', 'with'}
+_TOKEN_PATTERN = re.compile('[A-Za-z]+|\\d+')
+_CAMEL_PATTERN = re.compile('([a-z])([A-Z])')
+_indexes = {}
+_lock = threading.Lock()
+
+
+def tokenize(text):
+    text = _CAMEL_PATTERN.sub('\\1 \\2', str(text))
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(text):
+        token = token.lower()
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'
+            ):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def parse_schema_columns(schema_text):
+    """Rows of a BIRD_table_schema_info.json table entry as dicts."""
+    try:
+        return list(csv.DictReader(io.StringIO(schema_text)))
+    except csv.Error as e:
+        logger.warning(f'Could not parse schema columns: {str(e)}')
+        return []
+
+
+def resolve_table_name(table_name, referenced_table, table_names):
+    """Map a short `referenced_table` to the prefixed name of its database."""
+    if referenced_table in table_names:
+        return referenced_table
+    suffix = f'_{referenced_table}'
+    candidates = [name for name in table_names if name.endswith(suffix) and
+        table_name.startswith(name[:-len(suffix)] + '_')]
+    if not candidates:
+        return None
+    return max(candidates, key=len)
+
+
+class SchemaIndex:
+    """BM25 index with one document per table.
+
+    A table document is made of its name and column names (weighted up),
+    column descriptions, `column_samples` values and the evidence snippets
+    that mention one of its columns by name.
+    """
+
+    def __init__(self, schema_data, compact_stats_data, evidence_data=None):
+        start_time = time.perf_counter()
+        stats_tables = (compact_stats_data or {}).get('tables', {})
+        self.table_names = sorted(set(schema_data or {}) | set(stats_tables))
+        documents = {name: Counter() for name in self.table_names}
+        column_names = defaultdict(set)
+        for name in self.table_names:
+            documents[name].update(tokenize(name) * TABLE_NAME_WEIGHT)
+            for row in parse_schema_columns((schema_data or {}).get(name, '')):
+                for field in ('original_column_name', 'column_name'):
+                    value = (row.get(field) or '').strip()
+                    if value:
+                        column_names[name].add(value)
+                        documents[name].update(tokenize(value) *
+                            COLUMN_NAME_WEIGHT)
+                for field in ('column_description', 'value_description'):
+                    documents[name].update(tokenize(row.get(field) or ''))
+        for key, samples in (compact_stats_data or {}).get('column_samples', {}
+            ).items():
+            table_name, _, column_name = key.partition('.')
+            if table_name not in documents:
+                continue
+            column_names[table_name].add(column_name)
+            documents[table_name].update(tokenize(column_name) *
+                COLUMN_NAME_WEIGHT)
+            for sample in samples or []:
+                documents[table_name].update(tokenize(sample))
+        self.evidence_links = self._link_evidence(evidence_data or [],
+            column_names, documents)
+        self.neighbours = defaultdict(set)
+        for name, info in stats_tables.items():
+            for relationship in info.get('relationships', []):
+                referenced = resolve_table_name(name, relationship.get(
+                    'referenced_table', ''), self.table_names)
+                if referenced and referenced != name:
+                    self.neighbours[name].add(referenced)
+                    self.neighbours[referenced].add(name)
+        self.postings = defaultdict(list)
+        self.doc_lengths = {}
+        for name, counts in documents.items():
+            self.doc_lengths[name] = sum(counts.values())
+            for token, frequency in counts.items():
+                self.postings[token].append((name, frequency))
+        self.avg_doc_length = sum(self.doc_lengths.values()) / max(len(self
+            .doc_lengths), 1)
+        self.idf = {token: math.log(1 + (len(documents) - len(postings) +
+            0.5) / (len(postings) + 0.5)) for token, postings in self.
+            postings.items()}
+        self.build_ms = (time.perf_counter() - start_time) * 1000
+        logger.info(
+            f'Built schema index over {len(self.table_names)} tables and {len(self.postings)} terms in {self.build_ms:.1f} ms ({self.evidence_links} evidence links)'
+            )
+
+    @staticmethod
+    def _link_evidence(evidence_data, column_names, documents):
+        column_tables = defaultdict(set)
+        for table_name, names in column_names.items():
+            for column in names:
+                if len(column) >= MIN_EVIDENCE_COLUMN_LENGTH:
+                    column_tables[tuple(sorted(set(tokenize(column))))].add(
+                        table_name)
+        evidence_tokens = [(tokenize(evidence_text), set(tokenize(
+            evidence_text))) for entry in evidence_data for evidence_text in
+            entry]
+        evidence_frequency = Counter(token for _, token_set in
+            evidence_tokens for token in token_set)
+        max_frequency = max(1, len(evidence_tokens) *
+            MAX_EVIDENCE_TOKEN_SHARE)
+        columns_by_token = defaultdict(list)
+        for tokens, table_names in column_tables.items():
+            if not tokens or len(table_names) > MAX_EVIDENCE_COLUMN_TABLES:
+                continue
+            rarest = min(tokens, key=lambda token: (evidence_frequency[
+                token], token))
+            if evidence_frequency[rarest] <= max_frequency:
+                columns_by_token[rarest].append((set(tokens), table_names))
+        links = 0
+        for tokens, token_set in evidence_tokens:
+            linked_tables = set()
+            for token in token_set:
+                for column_tokens, table_names in columns_by_token.get(token,
+                    []):
+                    if column_tokens <= token_set:
+                        linked_tables |= table_names
+            for table_name in linked_tables:
+                documents[table_name].update(tokens)
+            links += len(linked_tables)
+        return links
+
+    def score(self, text):
+        scores = defaultdict(float)
+        for token in set(tokenize(text)):
+            idf = self.idf.get(token)
+            if idf is None:
+                continue
+            for table_name, frequency in self.postings[token]:
+                length_norm = 1 - BM25_B + BM25_B * self.doc_lengths[table_name
+                    ] / self.avg_doc_length
+                scores[table_name] += idf * frequency * (BM25_K1 + 1) / (
+                    frequency + BM25_K1 * length_norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+    def select_tables(self, text, top_k=DEFAULT_TOP_K, max_tables=
+        DEFAULT_MAX_TABLES):
+        """Top-k tables for `text` plus their foreign-key neighbours.
+
+        Returns None when nothing in the text matches the index, so callers
+        can fall back to the full schema.
+        """
+        ranked = self.score(text)
+        if not ranked:
+            return None
+        selected = [table_name for table_name, _ in ranked[:top_k]]
+        rank = {table_name: position for position, (table_name, _) in
+            enumerate(ranked)}
+        neighbours = set()
+        for table_name in selected:
+            neighbours |= self.neighbours.get(table_name, set())
+        neighbours -= set(selected)
+        for table_name in sorted(neighbours, key=lambda name: (rank.get(
+            name, len(rank)), name)):
+            if len(selected) >= max(max_tables, top_k):
+                break
+            selected.append(table_name)
+        return selected
+
+
+def _on_reload(path):
+    with _lock:
+        stale = [key for key in _indexes if path in key]
+        for key in stale:
+            del _indexes[key]
+
+
+resource_registry.add_reload_listener(_on_reload)
+
+
+def get_index(schema_path, stats_path, evidence_path=None):
+    key = tuple(os.path.abspath(path) for path in (schema_path, stats_path,
+        evidence_path) if path)
+    with _lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = SchemaIndex(resource_registry.get_json(schema_path),
+                resource_registry.get_json(stats_path, {}),
+                resource_registry.get_json(evidence_path, []) if
+                evidence_path else [])
+            _indexes[key] = index
+        return index
+
+
+def select_tables(question, schema_path, stats_path, evidence_path=None,
+    top_k=DEFAULT_TOP_K, max_tables=DEFAULT_MAX_TABLES):
+    if not RETRIEVAL_ENABLED:
+        return None
+    try:
+        start_time = time.perf_counter()
+        tables = get_index(schema_path, stats_path, evidence_path
+            ).select_tables(question, top_k, max_tables)
+        logger.info(
+            f'Selected tables {tables} in {(time.perf_counter() - start_time) * 1000:.2f} ms'
+            )
+        return tables
+    except Exception as e:
+        logger.error(f'Schema retrieval failed, using full schema: {str(e)}')
+        return None
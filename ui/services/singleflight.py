@@ -0,0 +1,121 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from . import stream_manager
+os.makedirs('logs', exist_ok=True)
+logging.basicConfig(filename='logs/singleflight.log', level=logging.INFO,
+    format=
+    '%(asctime)s - %(levelname)s - %(pathname)s:%(lineno)d - %(message)s')
+logger = logging.getLogger(__name__)
+_flights = {}
+_lock = threading.Lock()
+_stats = {'leaders': 0, 'coalesced': 0, 'failures': 0}
+
+
+class Flight:
+    """One in-flight call shared by every request with the same key.
+
+    Each caller registers the SSE stream it is watching as a subscriber.
+    Progress reported by the leader is written to all subscribers, and a
+    caller that joins late is first sent the updates that carried a
+    payload (such as suggestions already parsed) and then the most recent
+    progress update, so its stream does not sit at 0% until the next step.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.subscribers = []
+        self.last_update = None
+        self.payload_updates = []
+        self.started_at = time.time()
+        self.lock = threading.Lock()
+
+    def subscribe(self, subscriber):
+        if not subscriber or not subscriber[0] or not subscriber[1]:
+            return
+        with self.lock:
+            if subscriber in self.subscribers:
+                return
+            self.subscribers.append(subscriber)
+            replay = list(self.payload_updates)
+            last_update = self.last_update
+        user_id, stream_id, operation = subscriber
+        for update in replay:
+            stream_manager.update_stream(user_id, stream_id, operation, *
+                update)
+        if last_update:
+            stream_manager.update_stream(user_id, stream_id, operation, *
+                last_update)
+
+    def progress(self, status, message, progress=0, payload=None):
+        with self.lock:
+            if payload is None:
+                self.last_update = status, message, progress
+            else:
+                self.payload_updates.append((status, message, progress,
+                    payload))
+            subscribers = list(self.subscribers)
+        for user_id, stream_id, operation in subscribers:
+            stream_manager.update_stream(user_id, stream_id, operation,
+                status, message, progress, payload)
+
+
+def fingerprint(*parts):
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def do(key, fn, subscriber=None):
+    """Run `fn(flight)` once for all concurrent callers with the same key.
+
+    `subscriber` is the caller's (user_id, stream_id, operation) stream. The
+    first caller becomes the leader and runs `fn`; callers arriving while it
+    runs wait for its result (or its exception) instead of starting their
+    own upstream call. Coalescing is per process. Returns (result, shared),
+    where shared is True for callers that reused the leader's result.
+    """
+    with _lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = Flight(key)
+            _stats['leaders'] += 1
+        else:
+            _stats['coalesced'] += 1
+    flight.subscribe(subscriber)
+    if not leader:
+        logger.info(f'Joining in-flight call {key} started by another request')
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result, True
+    try:
+        flight.result = fn(flight)
+        return flight.result, False
+    except Exception as e:
+        flight.error = e
+        with _lock:
+            _stats['failures'] += 1
+        raise
+    finally:
+        with _lock:
+            _flights.pop(key, None)
+        flight.done.set()
+        logger.info(
+            f'Finished call {key} in {time.time() - flight.started_at:.2f}s for {len(flight.subscribers)} subscriber(s)'
+            )
+
+
+def get_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats['in_flight'] = [{'key': str(flight.key), 'subscribers': len(
+            flight.subscribers), 'age_seconds': round(time.time() - flight.
+            started_at, 2)} for flight in _flights.values()]
+    return stats
@@ -0,0 +1,221 @@
+import itertools
+import logging
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from . import sql_sandbox
+os.makedirs('logs', exist_ok=True)
+logging.basicConfig(filename='logs/speculation.log', level=logging.INFO,
+    format=
+    '%(asctime)s - %(levelname)s - %(pathname)s:%(lineno)d - %(message)s')
+logger = logging.getLogger(__name__)
+SPECULATIVE_SQL_ENABLED = os.environ.get('SPECULATIVE_SQL_ENABLED', '0'
+    ) == '1'
+SPECULATIVE_SQL_MAX = int(os.environ.get('SPECULATIVE_SQL_MAX', 6))
+SPECULATIVE_SQL_WORKERS = int(os.environ.get('SPECULATIVE_SQL_WORKERS', 2))
+SPECULATIVE_SQL_TTL_SECONDS = float(os.environ.get(
+    'SPECULATIVE_SQL_TTL_SECONDS', 1800))
+SPECULATIVE_SQL_CLAIM_TIMEOUT_SECONDS = float(os.environ.get(
+    'SPECULATIVE_SQL_CLAIM_TIMEOUT_SECONDS', 20))
+_executor = ThreadPoolExecutor(max_workers=SPECULATIVE_SQL_WORKERS,
+    thread_name_prefix='speculative-sql')
+_entries = {}
+_ids = itertools.count(1)
+_lock = threading.Lock()
+_stats = {'scheduled': 0, 'skipped_over_cap': 0, 'started': 0,
+    'completed': 0, 'failed': 0, 'cancelled': 0, 'interrupted': 0,
+    'claimed': 0, 'claim_timeouts': 0, 'cleaned_up': 0, 'hits': 0,
+    'misses': 0, 'wasted': 0, 'work_seconds': 0.0, 'wasted_seconds': 0.0}
+
+
+def _clean_up(entry):
+    """Run the entry's on_discard hook, e.g. to delete its stored row."""
+    if entry['on_discard'] is None:
+        return
+    try:
+        entry['on_discard'](entry)
+        with _lock:
+            _stats['cleaned_up'] += 1
+    except Exception as e:
+        logger.error(
+            f"Cleaning up speculative SQL for dataset {entry['dataset_id']} failed: {str(e)}"
+            )
+
+
+def _abandon(entry):
+    """Stop an entry nobody will use; caller holds _lock.
+
+    A queued run is cancelled. A running one has its SQL interrupted
+    through the entry's sandbox cancel key and cleans up when it returns.
+    A finished one is cleaned up on a worker thread.
+    """
+    entry['discarded'] = True
+    if entry['future'].cancel():
+        entry['state'] = 'cancelled'
+        _stats['cancelled'] += 1
+    elif entry['state'] in ('done', 'failed'):
+        _executor.submit(_clean_up, entry)
+    elif sql_sandbox.cancel(*entry['cancel_key']):
+        _stats['interrupted'] += 1
+
+
+def _discard(key, entry):
+    """Drop an unclaimed entry; caller holds _lock."""
+    _entries.pop(key, None)
+    if entry['state'] in ('done', 'failed'):
+        _stats['wasted'] += 1
+        _stats['wasted_seconds'] += entry['seconds']
+    _abandon(entry)
+
+
+def _prune(now):
+    for key, entry in list(_entries.items()):
+        if now - entry['scheduled_at'] > SPECULATIVE_SQL_TTL_SECONDS:
+            _discard(key, entry)
+
+
+def _run(entry, fn, payload):
+    with _lock:
+        if entry['discarded']:
+            return None
+        entry['state'] = 'running'
+        _stats['started'] += 1
+    start_time = time.time()
+    try:
+        entry['result'] = fn(payload, entry)
+        state = 'done'
+    except Exception as e:
+        logger.error(
+            f"Speculative SQL failed for dataset {entry['dataset_id']}: {str(e)}"
+            )
+        logger.error(traceback.format_exc())
+        state = 'failed'
+    with _lock:
+        entry['state'] = state
+        entry['seconds'] = time.time() - start_time
+        _stats['completed' if state == 'done' else 'failed'] += 1
+        _stats['work_seconds'] += entry['seconds']
+        if entry['discarded'] and not entry['claimed']:
+            _stats['wasted'] += 1
+            _stats['wasted_seconds'] += entry['seconds']
+        discarded = entry['discarded']
+    if discarded:
+        _clean_up(entry)
+    return entry.get('result')
+
+
+def is_cancelled(entry):
+    return entry['discarded']
+
+
+def schedule(dataset_id, items, fn, on_discard=None):
+    """Start `fn(payload, entry)` in the background for each (question, payload).
+
+    At most SPECULATIVE_SQL_MAX items are started per call. Entries for
+    the dataset whose question is not in `items` are superseded: queued
+    ones are cancelled, running ones interrupted and finished ones counted
+    as wasted. A question that is already scheduled is left running.
+    `fn` should pass entry['cancel_key'] to sql_sandbox.execute.
+    `on_discard(entry)` runs once a discarded entry has stopped, to remove
+    whatever the run stored.
+    """
+    if not SPECULATIVE_SQL_ENABLED or not dataset_id:
+        return 0
+    dataset_id = str(dataset_id)
+    questions = {question for question, _ in items}
+    scheduled = 0
+    with _lock:
+        now = time.time()
+        _prune(now)
+        for key, entry in list(_entries.items()):
+            if key[0] == dataset_id and key[1] not in questions:
+                _discard(key, entry)
+        for position, (question, payload) in enumerate(items):
+            key = dataset_id, question
+            if key in _entries:
+                continue
+            if position >= SPECULATIVE_SQL_MAX:
+                _stats['skipped_over_cap'] += 1
+                continue
+            entry_id = next(_ids)
+            entry = {'id': entry_id, 'dataset_id': dataset_id, 'question':
+                question, 'state': 'queued', 'scheduled_at': now, 'seconds':
+                0.0, 'discarded': False, 'claimed': False, 'cancel_key':
+                sql_sandbox.make_cancel_key('speculation', entry_id),
+                'on_discard': on_discard}
+            entry['future'] = _executor.submit(_run, entry, fn, payload)
+            _entries[key] = entry
+            _stats['scheduled'] += 1
+            scheduled += 1
+    logger.info(
+        f'Scheduled speculative SQL for {scheduled} suggestions of dataset {dataset_id}'
+        )
+    return scheduled
+
+
+def claim(dataset_id, question, timeout=
+    SPECULATIVE_SQL_CLAIM_TIMEOUT_SECONDS):
+    """Take the speculative run for a selected question, waiting if it is running.
+
+    Returns True when a run finished for the question, so its stored query
+    row can be picked up, and None when no run was scheduled here. A run
+    that has not started yet is cancelled, and one that failed or is still
+    going after `timeout` seconds is abandoned (and its row removed); both
+    return False, as the caller will do the work itself.
+    """
+    with _lock:
+        entry = _entries.pop((str(dataset_id), question), None)
+        if entry is None:
+            return None
+        entry['claimed'] = True
+        _stats['claimed'] += 1
+        if entry['future'].cancel():
+            entry['state'] = 'cancelled'
+            _stats['cancelled'] += 1
+            return False
+    try:
+        entry['future'].result(timeout=timeout)
+    except FutureTimeoutError:
+        logger.warning(
+            f'Speculative SQL still running after {timeout}s; abandoning it')
+        with _lock:
+            _stats['claim_timeouts'] += 1
+    except Exception as e:
+        logger.warning(f'Speculative SQL was not usable: {str(e)}')
+    with _lock:
+        if entry['state'] == 'done':
+            return True
+        _abandon(entry)
+    return False
+
+
+def record_selection(hit):
+    with _lock:
+        _stats['hits' if hit else 'misses'] += 1
+
+
+def discard_dataset(dataset_id):
+    """Give up on every unclaimed speculative run of a dataset."""
+    with _lock:
+        for key, entry in list(_entries.items()):
+            if key[0] == str(dataset_id):
+                _discard(key, entry)
+
+
+def get_stats():
+    with _lock:
+        stats = dict(_stats)
+        states = [entry['state'] for entry in _entries.values()]
+    selections = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / selections if selections else 0.0
+    finished = stats['completed'] + stats['failed']
+    stats['waste_rate'] = stats['wasted'] / finished if finished else 0.0
+    stats.update({'enabled': SPECULATIVE_SQL_ENABLED, 'max_per_request':
+        SPECULATIVE_SQL_MAX, 'workers': SPECULATIVE_SQL_WORKERS, 'queued':
+        states.count('queued'), 'running': states.count('running'),
+        'unclaimed_done': states.count('done'), 'claim_timeout_seconds':
+        SPECULATIVE_SQL_CLAIM_TIMEOUT_SECONDS})
+    return stats
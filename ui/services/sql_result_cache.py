@@ -0,0 +1,185 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from common.sql_validator import KEYWORDS
+logger = logging.getLogger(__name__)
+SQL_RESULT_CACHE_ENABLED = os.environ.get('SQL_RESULT_CACHE_ENABLED', '1'
+    ) == '1'
+SQL_RESULT_CACHE_ENTRIES = int(os.environ.get('SQL_RESULT_CACHE_ENTRIES', 2048)
+    )
+SQL_RESULT_CACHE_BYTES = int(os.environ.get('SQL_RESULT_CACHE_BYTES', 32 *
+    1024 * 1024))
+TOKEN_PATTERN = re.compile(
+    """
+    (?P<comment>--[^\\n]*|/\\*.*?(?:\\*/|$))
+    |(?P<string>'(?:[^']|'')*')
+    |(?P<quoted>"(?:[^"]|"")*"|`(?:[^`]|``)*`|\\[[^\\]]*\\])
+    |(?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+    |(?P<space>\\s+)
+    |(?P<other>.)
+    """
+    , re.VERBOSE | re.DOTALL)
+SIMPLE_IDENTIFIER = re.compile('[A-Za-z_][A-Za-z0-9_]*')
+NONDETERMINISTIC_PATTERN = re.compile(
+    "\\b(?:random|randomblob|changes|total_changes|last_insert_rowid) \\(|\\bcurrent_(?:timestamp|date|time)\\b|'now'|\\b(?:date|time|datetime|julianday|unixepoch) \\( \\)|\\bstrftime \\( (?:'(?:[^']|'')*'|[^,()' ])+ \\)"
+    , re.IGNORECASE)
+RESULT_COLUMNS_END = {'from', 'where', 'group', 'having', 'window', 'order',
+    'limit', 'union', 'intersect', 'except'}
+_entries = OrderedDict()
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'uncacheable': 0, 'stores': 0,
+    'skipped_stores': 0, 'evictions': 0}
+_bytes = 0
+
+
+def canonicalize(sql_query):
+    """Spelling-independent form of a SQL statement, for use as a key.
+
+    Comments, whitespace runs and trailing semicolons are dropped, SQL
+    keywords are lowercased, and backtick/bracket identifiers are unquoted
+    when they are plain names and backtick-quoted otherwise. Double-quoted
+    words always stay double-quoted, since SQLite reads one that names no
+    column as a string literal: `"active"` and `active` are different
+    queries. Identifiers, quoted names and string literals keep the
+    spelling they were written with.
+    """
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(sql_query):
+        kind = match.lastgroup
+        text = match.group()
+        if kind in ('comment', 'space'):
+            continue
+        if kind == 'word':
+            tokens.append(text.lower() if text.lower() in KEYWORDS else text)
+        elif kind == 'quoted':
+            name = text[1:-1]
+            if text[0] in '"`':
+                name = name.replace(text[0] * 2, text[0])
+            if text[0] == '"':
+                tokens.append('"' + name.replace('"', '""') + '"')
+            elif SIMPLE_IDENTIFIER.fullmatch(name):
+                tokens.append(name)
+            else:
+                tokens.append('`' + name.replace('`', '``') + '`')
+        else:
+            tokens.append(text)
+    while tokens and tokens[-1] == ';':
+        tokens.pop()
+    return ' '.join(tokens)
+
+
+def result_columns(sql_query):
+    """Result-column list of the leading SELECT, exactly as written.
+
+    SQLite names an unaliased expression column after its source text
+    (`a+b` and `a + b` give different column names), so this part of a
+    statement cannot be normalized without changing the result.
+    """
+    depth = 0
+    start = None
+    for match in TOKEN_PATTERN.finditer(sql_query):
+        text = match.group()
+        if text == '(':
+            depth += 1
+        elif text == ')':
+            depth -= 1
+        elif depth == 0 and match.lastgroup == 'word':
+            if start is None and text.lower() == 'select':
+                start = match.end()
+            elif start is not None and text.lower() in RESULT_COLUMNS_END:
+                return sql_query[start:match.start()].strip()
+    return '' if start is None else sql_query[start:].strip().rstrip(';'
+        ).strip()
+
+
+def is_deterministic(canonical_sql):
+    """False when a canonical statement reads the clock or random numbers."""
+    return NONDETERMINISTIC_PATTERN.search(canonical_sql) is None
+
+
+def make_key(sql_query, database_signature, *options):
+    """Cache key for a statement, or None when its results can vary.
+
+    The key covers the canonical statement plus its result columns as
+    written, so a hit always carries the column names the current spelling
+    would have produced.
+    """
+    canonical_sql = canonicalize(sql_query)
+    if not is_deterministic(canonical_sql):
+        return None
+    payload = json.dumps([canonical_sql, result_columns(sql_query),
+        database_signature, options], separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get(key):
+    """Cached (column_names, rows, meta) for `key`, or None."""
+    if not SQL_RESULT_CACHE_ENABLED:
+        return None
+    if key is None:
+        with _lock:
+            _stats['uncacheable'] += 1
+        return None
+    with _lock:
+        encoded = _entries.get(key)
+        if encoded is None:
+            _stats['misses'] += 1
+            return None
+        _entries.move_to_end(key)
+        _stats['hits'] += 1
+    payload = json.loads(zlib.decompress(encoded))
+    return payload['c'], [tuple(row) for row in payload['r']], payload['m']
+
+
+def put(key, column_names, rows, meta):
+    """Store a result as zlib-compressed column-name + row-list JSON."""
+    global _bytes
+    if not SQL_RESULT_CACHE_ENABLED or key is None:
+        return False
+    try:
+        encoded = zlib.compress(json.dumps({'c': column_names, 'r': rows,
+            'm': meta}, separators=(',', ':')).encode('utf-8'))
+    except (TypeError, ValueError):
+        with _lock:
+            _stats['skipped_stores'] += 1
+        return False
+    if len(encoded) > SQL_RESULT_CACHE_BYTES:
+        with _lock:
+            _stats['skipped_stores'] += 1
+        return False
+    with _lock:
+        previous = _entries.pop(key, None)
+        if previous is not None:
+            _bytes -= len(previous)
+        _entries[key] = encoded
+        _bytes += len(encoded)
+        _stats['stores'] += 1
+        while _entries and (len(_entries) > SQL_RESULT_CACHE_ENTRIES or
+            _bytes > SQL_RESULT_CACHE_BYTES):
+            _, evicted = _entries.popitem(last=False)
+            _bytes -= len(evicted)
+            _stats['evictions'] += 1
+    return True
+
+
+def clear():
+    global _bytes
+    with _lock:
+        _entries.clear()
+        _bytes = 0
+
+
+def get_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats.update({'entries': len(_entries), 'bytes': _bytes})
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    stats.update({'enabled': SQL_RESULT_CACHE_ENABLED, 'max_entries':
+        SQL_RESULT_CACHE_ENTRIES, 'max_bytes': SQL_RESULT_CACHE_BYTES})
+    return stats
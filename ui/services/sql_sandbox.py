@@ -0,0 +1,321 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import traceback
+from urllib.parse import quote
+from . import result_format
+from . import sql_result_cache
+os.makedirs('logs', exist_ok=True)
+logging.basicConfig(filename='logs/sql_sandbox.log', level=logging.INFO,
+    format=
+    '%(asctime)s - %(levelname)s - %(pathname)s:%(lineno)d - %(message)s')
+logger = logging.getLogger(__name__)
+SQLITE_DB_PATH = '../.venv/BIRD'
+SQL_TIMEOUT_SECONDS = float(os.environ.get('SQL_TIMEOUT_SECONDS', 15))
+SQL_MAX_ROWS = int(os.environ.get('SQL_MAX_ROWS', 1000))
+SQL_MAX_RESULT_BYTES = int(os.environ.get('SQL_MAX_RESULT_BYTES', 8 * 1024 *
+    1024))
+SQL_CACHE_KIB = int(os.environ.get('SQL_CACHE_KIB', 64 * 1024))
+SQL_MMAP_BYTES = int(os.environ.get('SQL_MMAP_BYTES', 256 * 1024 * 1024))
+SQL_TEMP_STORE = os.environ.get('SQL_TEMP_STORE', 'FILE').upper()
+SQL_IMMUTABLE = os.environ.get('SQL_IMMUTABLE', '1') == '1'
+SQL_POOL_SIZE = int(os.environ.get('SQL_POOL_SIZE', 8))
+SQL_WARM_CONNECTIONS = int(os.environ.get('SQL_WARM_CONNECTIONS', 2))
+SQL_WARM_SCAN = os.environ.get('SQL_WARM_SCAN', '0') == '1'
+PROGRESS_INTERVAL = 10000
+FETCH_BATCH_SIZE = 256
+_running = {}
+_lock = threading.Lock()
+_idle = {}
+_pool_lock = threading.Lock()
+_pool_stats = {'created': 0, 'reused': 0, 'discarded': 0, 'reopened': 0}
+
+
+class _Guard:
+    """Progress handler state: aborts the statement on deadline or cancel."""
+
+    def __init__(self, deadline, cancel_event):
+        self.deadline = deadline
+        self.cancel_event = cancel_event
+        self.calls = 0
+        self.reason = None
+
+    def __call__(self):
+        self.calls += 1
+        if self.cancel_event.is_set():
+            self.reason = 'cancelled'
+            return 1
+        if time.monotonic() > self.deadline:
+            self.reason = 'timeout'
+            return 1
+        return 0
+
+
+def connect(db_path=SQLITE_DB_PATH):
+    """Read-only connection to a SQLite database file.
+
+    The file is opened through a `mode=ro` URI (plus `immutable=1` unless
+    SQL_IMMUTABLE=0, which skips locking for a database nobody writes) and
+    ATTACH is disabled. Page cache, mmap window and temp storage come from
+    SQL_CACHE_KIB, SQL_MMAP_BYTES and SQL_TEMP_STORE; with the default
+    file-backed temp store a runaway sort spills to disk rather than
+    growing the process.
+    """
+    uri = f"file:{quote(os.path.abspath(db_path))}?mode=ro"
+    if SQL_IMMUTABLE:
+        uri += '&immutable=1'
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    conn.setlimit(sqlite3.SQLITE_LIMIT_ATTACHED, 0)
+    conn.execute('PRAGMA query_only=1')
+    conn.execute(f'PRAGMA cache_size=-{SQL_CACHE_KIB}')
+    conn.execute(f'PRAGMA mmap_size={SQL_MMAP_BYTES}')
+    conn.execute(f'PRAGMA temp_store={SQL_TEMP_STORE}')
+    return conn
+
+
+def _file_signature(db_path):
+    try:
+        stat = os.stat(db_path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _checkout(db_path):
+    """Idle pooled connection for `db_path`, or a new one.
+
+    Connections opened before the database file last changed are dropped,
+    since an immutable connection would keep serving the old contents.
+    """
+    key = os.path.abspath(db_path)
+    signature = _file_signature(db_path)
+    with _pool_lock:
+        idle = _idle.setdefault(key, [])
+        while idle:
+            conn, conn_signature = idle.pop()
+            if conn_signature == signature:
+                _pool_stats['reused'] += 1
+                return conn, signature
+            _pool_stats['reopened'] += 1
+            conn.close()
+        _pool_stats['created'] += 1
+    return connect(db_path), signature
+
+
+def _checkin(db_path, conn, signature, healthy=True):
+    conn.set_progress_handler(None, 0)
+    key = os.path.abspath(db_path)
+    with _pool_lock:
+        idle = _idle.setdefault(key, [])
+        if healthy and not conn.in_transaction and len(idle) < SQL_POOL_SIZE:
+            idle.append((conn, signature))
+            return
+        _pool_stats['discarded'] += 1
+    conn.close()
+
+
+def warm_up(db_path=SQLITE_DB_PATH, connections=None, scan=None):
+    """Open pooled connections ahead of the first query.
+
+    Each connection loads the schema; with SQL_WARM_SCAN=1 the first one
+    also counts every table's rows, which pulls the table pages into the
+    OS page cache and the mmap window.
+    """
+    connections = SQL_WARM_CONNECTIONS if connections is None else connections
+    scan = SQL_WARM_SCAN if scan is None else scan
+    if not os.path.exists(db_path):
+        logger.warning(f'Skipping SQLite warm-up, {db_path} does not exist')
+        return 0
+    start_time = time.time()
+    opened = []
+    try:
+        for position in range(connections):
+            conn, signature = _checkout(db_path)
+            opened.append((conn, signature))
+            tables = [row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'")]
+            if scan and position == 0:
+                for table_name in tables:
+                    conn.execute(f'SELECT COUNT(*) FROM "{table_name}"'
+                        ).fetchone()
+    except sqlite3.Error as e:
+        logger.warning(f'SQLite warm-up failed: {str(e)}')
+    finally:
+        for conn, signature in opened:
+            _checkin(db_path, conn, signature)
+    logger.info(
+        f'Warmed {len(opened)} SQLite connection(s) to {db_path} in {time.time() - start_time:.2f}s'
+        )
+    return len(opened)
+
+
+def warm_up_async(db_path=SQLITE_DB_PATH):
+    threading.Thread(target=warm_up, args=(db_path,), daemon=True, name=
+        'sqlite-warm-up').start()
+
+
+def get_stats():
+    with _pool_lock:
+        stats = dict(_pool_stats)
+        stats['idle'] = {path: len(idle) for path, idle in _idle.items()}
+    stats['result_cache'] = sql_result_cache.get_stats()
+    stats.update({'pool_size': SQL_POOL_SIZE, 'cache_kib': SQL_CACHE_KIB,
+        'mmap_bytes': SQL_MMAP_BYTES, 'temp_store': SQL_TEMP_STORE,
+        'immutable': SQL_IMMUTABLE})
+    with _lock:
+        stats['running'] = sum(len(events) for events in _running.values())
+    return stats
+
+
+def _register(cancel_key):
+    event = threading.Event()
+    if cancel_key is not None:
+        with _lock:
+            _running.setdefault(cancel_key, set()).add(event)
+    return event
+
+
+def _unregister(cancel_key, event):
+    if cancel_key is None:
+        return
+    with _lock:
+        events = _running.get(cancel_key)
+        if events is not None:
+            events.discard(event)
+            if not events:
+                del _running[cancel_key]
+
+
+def make_cancel_key(user_id, operation):
+    if not user_id:
+        return None
+    return str(user_id), operation
+
+
+def cancel(user_id, operation):
+    """Interrupt every running query started under (user_id, operation)."""
+    with _lock:
+        events = list(_running.get(make_cancel_key(user_id, operation), ()))
+    for event in events:
+        event.set()
+    if events:
+        logger.info(
+            f'Cancelled {len(events)} running quer(ies) for user={user_id}, operation={operation}'
+            )
+    return len(events)
+
+
+def _full_scans(cursor, sql_query):
+    try:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql_query}')
+        return [row[-1] for row in cursor.fetchall() if str(row[-1]).
+            startswith('SCAN')]
+    except sqlite3.Error:
+        return []
+
+
+def _row_bytes(row):
+    return sum(len(value) if isinstance(value, (str, bytes)) else 8 for
+        value in row)
+
+
+def execute(sql_query, db_path=SQLITE_DB_PATH, cancel_key=None, timeout=
+    None, max_rows=None, max_bytes=None):
+    """Run model-generated SQL under a deadline, row cap and byte cap.
+
+    Returns the execution_details dict stored with each query, with rows in
+    result_format's columnar layout under `result`. Rows beyond
+    the caps are not fetched; `truncated` and `truncation_reason` say so.
+    `stats` records elapsed time, VM steps (a measure of rows scanned,
+    counted in PROGRESS_INTERVAL units), rows fetched, result bytes and the
+    full table scans in the query plan.
+
+    Successful results are kept in sql_result_cache under the canonical SQL
+    and the database file's size and mtime; `result_cache` is 'hit' or
+    'miss' accordingly ('skipped' for SQL using random() or the clock),
+    and a hit carries the stats of the run that filled the entry under
+    `stats.cached_run`.
+    """
+    timeout = SQL_TIMEOUT_SECONDS if timeout is None else timeout
+    max_rows = SQL_MAX_ROWS if max_rows is None else max_rows
+    max_bytes = SQL_MAX_RESULT_BYTES if max_bytes is None else max_bytes
+    start_time = time.time()
+    cache_key = sql_result_cache.make_key(sql_query, [os.path.abspath(
+        db_path), _file_signature(db_path)], max_rows, max_bytes)
+    cached = sql_result_cache.get(cache_key)
+    if cached is not None:
+        column_names, rows, meta = cached
+        elapsed_time = time.time() - start_time
+        return {'success': True, 'result': result_format.to_columnar(
+            column_names, rows), 'row_count': len(rows), 'elapsed_time': elapsed_time,
+            'truncated': meta['truncation_reason'] is not None,
+            'truncation_reason': meta['truncation_reason'], 'result_cache':
+            'hit', 'stats': {'elapsed_ms': round(elapsed_time * 1000, 2),
+            'cached_run': meta['stats']}}
+    guard = _Guard(time.monotonic() + timeout, _register(cancel_key))
+    stats = {'timeout_seconds': timeout, 'max_rows': max_rows}
+    sqlite_conn = None
+    healthy = True
+    try:
+        sqlite_conn, signature = _checkout(db_path)
+        cursor = sqlite_conn.cursor()
+        stats['full_scans'] = _full_scans(cursor, sql_query)
+        sqlite_conn.set_progress_handler(guard, PROGRESS_INTERVAL)
+        cursor.execute(sql_query)
+        column_names = [description[0] for description in cursor.description
+            ] if cursor.description else []
+        rows = []
+        result_bytes = 0
+        truncation_reason = None
+        while True:
+            batch = cursor.fetchmany(FETCH_BATCH_SIZE)
+            if not batch:
+                break
+            for row in batch:
+                if len(rows) >= max_rows:
+                    truncation_reason = 'max_rows'
+                    break
+                result_bytes += _row_bytes(row)
+                if result_bytes > max_bytes:
+                    truncation_reason = 'max_bytes'
+                    break
+                rows.append(row)
+            if truncation_reason:
+                break
+        elapsed_time = time.time() - start_time
+        stats.update({'elapsed_ms': round(elapsed_time * 1000, 2),
+            'vm_steps': guard.calls * PROGRESS_INTERVAL, 'rows_fetched':
+            len(rows), 'result_bytes': result_bytes})
+        if truncation_reason:
+            logger.info(
+                f'Truncated result at {len(rows)} rows ({truncation_reason})')
+        sql_result_cache.put(cache_key, column_names, rows, {
+            'truncation_reason': truncation_reason, 'stats': stats})
+        return {'success': True, 'result': result_format.to_columnar(
+            column_names, rows), 'row_count': len(rows),
+            'elapsed_time': elapsed_time, 'truncated': truncation_reason is not
+            None, 'truncation_reason': truncation_reason, 'result_cache':
+            'miss' if cache_key else 'skipped', 'stats': stats}
+    except sqlite3.Error as e:
+        healthy = isinstance(e, sqlite3.OperationalError)
+        elapsed_time = time.time() - start_time
+        stats.update({'elapsed_ms': round(elapsed_time * 1000, 2),
+            'vm_steps': guard.calls * PROGRESS_INTERVAL})
+        if guard.reason == 'timeout':
+            error = f'Query exceeded the {timeout:g}s execution limit'
+        elif guard.reason == 'cancelled':
+            error = 'Query cancelled by user'
+        else:
+            error = str(e)
+        logger.error(f'SQLite error executing query: {error}')
+        return {'success': False, 'error': error, 'traceback': traceback.
+            format_exc(), 'timed_out': guard.reason == 'timeout',
+            'cancelled': guard.reason == 'cancelled', 'elapsed_time':
+            elapsed_time, 'stats': stats}
+    finally:
+        _unregister(cancel_key, guard.cancel_event)
+        if sqlite_conn is not None:
+            cursor.close()
+            _checkin(db_path, sqlite_conn, signature, healthy)
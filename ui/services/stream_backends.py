@@ -0,0 +1,282 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+logger = logging.getLogger(__name__)
+
+
+class StreamBackend:
+
+    def append(self, key, update):
+        raise NotImplementedError
+
+    def read(self, key, last_index=0):
+        raise NotImplementedError
+
+    def wait(self, key, last_index=0, timeout=None):
+        raise NotImplementedError
+
+    def clear(self, key):
+        raise NotImplementedError
+
+    def clear_user(self, user_key):
+        raise NotImplementedError
+
+    def cleanup(self, max_age_seconds):
+        raise NotImplementedError
+
+
+class InMemoryStreamBackend(StreamBackend):
+
+    def __init__(self):
+        self.stream_updates = {}
+        self.lock = threading.Lock()
+        self.stream_conditions = {}
+        self.stream_waiters = {}
+
+    def _get_condition(self, key):
+        condition = self.stream_conditions.get(key)
+        if condition is None:
+            condition = threading.Condition(self.lock)
+            self.stream_conditions[key] = condition
+        return condition
+
+    def _notify(self, key):
+        condition = self.stream_conditions.get(key)
+        if condition is not None:
+            condition.notify_all()
+
+    def _slice(self, key, last_index):
+        updates = self.stream_updates.get(key, [])
+        if len(updates) < last_index:
+            last_index = 0
+        return updates[last_index:], len(updates)
+
+    def append(self, key, update):
+        with self.lock:
+            self.stream_updates.setdefault(key, []).append(update)
+            self._notify(key)
+            return len(self.stream_updates[key])
+
+    def read(self, key, last_index=0):
+        with self.lock:
+            return self._slice(key, last_index)
+
+    def wait(self, key, last_index=0, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.lock:
+            condition = self._get_condition(key)
+            self.stream_waiters[key] = self.stream_waiters.get(key, 0) + 1
+            try:
+                while True:
+                    new_updates, new_index = self._slice(key, last_index)
+                    if new_updates:
+                        return new_updates, new_index
+                    last_index = new_index
+                    if deadline is None:
+                        condition.wait()
+                        continue
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return [], last_index
+                    condition.wait(remaining)
+            finally:
+                self.stream_waiters[key] -= 1
+                if not self.stream_waiters[key]:
+                    del self.stream_waiters[key]
+
+    def clear(self, key):
+        with self.lock:
+            if key not in self.stream_updates:
+                return False
+            del self.stream_updates[key]
+            self._notify(key)
+            return True
+
+    def clear_user(self, user_key):
+        with self.lock:
+            keys_to_remove = [key for key in self.stream_updates.keys() if
+                key[0] == user_key]
+            for key in keys_to_remove:
+                del self.stream_updates[key]
+                self._notify(key)
+            return len(keys_to_remove)
+
+    def cleanup(self, max_age_seconds):
+        with self.lock:
+            current_time = time.time()
+            keys_to_remove = []
+            for key, updates in self.stream_updates.items():
+                if not updates or current_time - updates[-1]['timestamp'
+                    ] > max_age_seconds:
+                    keys_to_remove.append(key)
+            for key in keys_to_remove:
+                del self.stream_updates[key]
+            for key in list(self.stream_conditions.keys()):
+                if (key not in self.stream_updates and key not in self.
+                    stream_waiters):
+                    del self.stream_conditions[key]
+            return len(keys_to_remove)
+
+
+class SQLiteStreamBackend(StreamBackend):
+
+    def __init__(self, db_path, poll_interval=0.05, busy_timeout=5.0,
+        append_attempts=5):
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.busy_timeout = busy_timeout
+        self.append_attempts = append_attempts
+        self.local = threading.local()
+        self.local_condition = threading.Condition()
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS stream_events (
+                user_key TEXT NOT NULL,
+                operation TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (user_key, operation, seq)
+            )
+            """
+            )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS stream_events_created ON stream_events (created)'
+            )
+
+    def _connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout,
+                isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        return conn
+
+    def _data_version(self):
+        return self._connection().execute('PRAGMA data_version').fetchone()[0
+            ]
+
+    def _count(self, conn, key):
+        return conn.execute(
+            'SELECT COALESCE(MAX(seq), -1) + 1 FROM stream_events WHERE user_key = ? AND operation = ?'
+            , key).fetchone()[0]
+
+    def append(self, key, update):
+        """Store `update` as the next event of `key` and return the count.
+
+        The next seq is read and written inside one BEGIN IMMEDIATE
+        transaction, so appends from several processes are serialized on
+        the write lock instead of racing on MAX(seq); a busy database or a
+        seq collision on the primary key is retried rather than dropped.
+        """
+        conn = self._connection()
+        for attempt in range(1, self.append_attempts + 1):
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute(
+                    """
+                    INSERT INTO stream_events (user_key, operation, seq, payload, created)
+                    SELECT ?, ?, COALESCE(MAX(seq), -1) + 1, ?, ?
+                    FROM stream_events WHERE user_key = ? AND operation = ?
+                    """
+                    , (key[0], key[1], json.dumps(update), update.get(
+                    'timestamp', time.time()), key[0], key[1]))
+                count = self._count(conn, key)
+                conn.execute('COMMIT')
+                break
+            except (sqlite3.OperationalError, sqlite3.IntegrityError) as e:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                if attempt == self.append_attempts:
+                    raise
+                logger.warning(
+                    f'Retrying stream append for {key} (attempt {attempt}): {str(e)}'
+                    )
+                time.sleep(self.poll_interval * attempt)
+        with self.local_condition:
+            self.local_condition.notify_all()
+        return count
+
+    def read(self, key, last_index=0):
+        conn = self._connection()
+        count = self._count(conn, key)
+        if count < last_index:
+            last_index = 0
+        if count <= last_index:
+            return [], last_index
+        rows = conn.execute(
+            'SELECT payload FROM stream_events WHERE user_key = ? AND operation = ? AND seq >= ? ORDER BY seq'
+            , (key[0], key[1], last_index)).fetchall()
+        return [json.loads(row[0]) for row in rows], last_index + len(rows)
+
+    def wait(self, key, last_index=0, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        seen_version = self._data_version()
+        new_updates, last_index = self.read(key, last_index)
+        while not new_updates:
+            wait_for = self.poll_interval
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return [], last_index
+                wait_for = min(wait_for, remaining)
+            with self.local_condition:
+                self.local_condition.wait(wait_for)
+            current_version = self._data_version()
+            if current_version != seen_version:
+                seen_version = current_version
+                new_updates, last_index = self.read(key, last_index)
+        return new_updates, last_index
+
+    def clear(self, key):
+        cursor = self._connection().execute(
+            'DELETE FROM stream_events WHERE user_key = ? AND operation = ?',
+            key)
+        with self.local_condition:
+            self.local_condition.notify_all()
+        return cursor.rowcount > 0
+
+    def clear_user(self, user_key):
+        conn = self._connection()
+        count = conn.execute(
+            'SELECT COUNT(DISTINCT operation) FROM stream_events WHERE user_key = ?'
+            , (user_key,)).fetchone()[0]
+        conn.execute('DELETE FROM stream_events WHERE user_key = ?', (
+            user_key,))
+        with self.local_condition:
+            self.local_condition.notify_all()
+        return count
+
+    def cleanup(self, max_age_seconds):
+        conn = self._connection()
+        stale = conn.execute(
+            'SELECT user_key, operation FROM stream_events GROUP BY user_key, operation HAVING MAX(created) < ?'
+            , (time.time() - max_age_seconds,)).fetchall()
+        for user_key, operation in stale:
+            conn.execute(
+                'DELETE FROM stream_events WHERE user_key = ? AND operation = ?'
+                , (user_key, operation))
+        return len(stale)
+
+
+def create_backend(backend_name=None, db_path=None):
+    backend_name = (backend_name or os.environ.get('STREAM_BACKEND',
+        'memory')).lower()
+    if backend_name == 'sqlite':
+        db_path = db_path or os.environ.get('STREAM_SQLITE_PATH',
+            'run/stream_updates.db')
+        logger.info(f'Using SQLite stream backend at {db_path}')
+        return SQLiteStreamBackend(db_path)
+    if backend_name != 'memory':
+        logger.warning(
+            f'Unknown stream backend {backend_name}, falling back to memory')
+    return InMemoryStreamBackend()
@@ -5,6 +5,7 @@ import logging
 import os
 import traceback
 from . import stream_manager
+from . import sql_sandbox
 import json
 import os
 os.makedirs('logs', exist_ok=True)
@@ -13,6 +14,7 @@ logging.basicConfig(filename='logs/streaming_service.log', level=logging.
     '%(asctime)s - %(levelname)s - %(pathname)s:%(lineno)d - %(message)s')
 logger = logging.getLogger(__name__)
 bp = Blueprint('streaming', __name__, url_prefix='/api/stream')
+STREAM_IDLE_TIMEOUT_SECONDS = 12
 
 
 def get_friendly_message(operation, status='starting'):
@@ -62,30 +64,34 @@ def stream_updates(operation, dataset_id):
                 f'SSE initial event sent for: user={user_id}, dataset={dataset_id}, operation={operation}'
                 )
             last_index = 0
-            retry_count = 0
-            max_retries = 120
+            timed_out = True
+            deadline = time.monotonic() + STREAM_IDLE_TIMEOUT_SECONDS
             yield ' ' * 2048 + '\n\n'
-            while retry_count < max_retries:
-                new_updates, last_index = stream_manager.get_stream_updates(
-                    user_id, dataset_id, operation, last_index)
-                if new_updates:
-                    for update in new_updates:
-                        event_data = json.dumps(update)
-                        logger.info(f'Sending event: {event_data[:100]}...')
-                        yield f'data: {event_data}\n\n'
-                        yield f': padding {time.time()}\n\n'
-                    retry_count = 0
-                    last_update = new_updates[-1]
-                    if last_update['status'] in ['complete', 'error']:
-                        logger.info(
-                            f'Sending close event for: user={user_id}, dataset={dataset_id}, operation={operation}'
-                            )
-                        yield f"event: close\ndata: {json.dumps({'status': 'closed'})}\n\n"
-                        break
-                else:
-                    retry_count += 1
-                time.sleep(0.1)
-            if retry_count >= max_retries:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                new_updates, last_index = (stream_manager.
+                    wait_for_stream_updates(user_id, dataset_id, operation,
+                    last_index, timeout=remaining))
+                if not new_updates:
+                    continue
+                for update in new_updates:
+                    event_data = json.dumps(update)
+                    logger.info(f'Sending event: {event_data[:100]}...')
+                    yield f'data: {event_data}\n\n'
+                    yield f': padding {time.time()}\n\n'
+                deadline = time.monotonic() + STREAM_IDLE_TIMEOUT_SECONDS
+                last_update = new_updates[-1]
+                if last_update['status'] in ['complete', 'error',
+                    'cancelled']:
+                    logger.info(
+                        f'Sending close event for: user={user_id}, dataset={dataset_id}, operation={operation}'
+                        )
+                    yield f"event: close\ndata: {json.dumps({'status': 'closed'})}\n\n"
+                    timed_out = False
+                    break
+            if timed_out:
                 logger.warning(
                     f'Stream timeout: user={user_id}, dataset={dataset_id}, operation={operation}'
                     )
@@ -118,13 +124,15 @@ def cancel_stream(operation, dataset_id):
             dataset_id = int(dataset_id)
         except ValueError:
             return {'success': False, 'error': 'Invalid dataset ID'}, 400
+        interrupted = sql_sandbox.cancel(user_id, operation)
+        stream_manager.clear_stream(user_id, operation)
         stream_manager.update_stream(user_id, dataset_id, operation,
             'cancelled', 'Operation cancelled by user', 100)
-        stream_manager.clear_stream(user_id, dataset_id, operation)
         logger.info(
             f'Stream cancelled: user={user_id}, dataset={dataset_id}, operation={operation}'
             )
-        return {'success': True, 'message': 'Stream cancelled'}
+        return {'success': True, 'message': 'Stream cancelled',
+            'interrupted_queries': interrupted}
     except Exception as e:
         logger.error(f'Cancel stream error: {str(e)}')
         logger.error(traceback.format_exc())
@@ -2,30 +2,31 @@ from flask import Blueprint, request, jsonify
 import json
 import logging
 import mysql.connector
-import sqlite3
 import os
 import traceback
 import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from google import genai
-from google.genai import types
 from . import stream_manager
+from . import db_pool
+from . import resource_registry
+from . import prompt_assembly
+from . import singleflight
+from . import jobs
+from . import result_format
+from . import sql_sandbox
+from . import speculation
+from common import json_stream
+from common import llm_client
+from common import sql_validator
 os.makedirs('logs', exist_ok=True)
 logging.basicConfig(filename='logs/suggestions_service.log', level=logging.
     INFO, format=
     '%(asctime)s - %(levelname)s - %(pathname)s:%(lineno)d - %(message)s')
 logger = logging.getLogger(__name__)
 bp = Blueprint('suggestions', __name__, url_prefix='/api/suggestions')
-DB_CONFIG = {
-    'host': 'YOUR_DATABASE_HOST',
-    'port': 'YOUR_DATABASE_POST',
-    'user': 'YOUR_DATABASE_USER',
-    'password': 'YOUR_DATABASE_PASSWORD',
-    'database': 'YOUR_DATABASE_NAME'
-}
-
 SQLITE_DB_PATH = '../.venv/BIRD'
-streaming_id = None
 FLASH_CLIENT = genai.Client(project="your-gcp-project-id")
 FLASH_MODEL = 'gemini-2.0-flash-001'
 PROMPT_DIR = '../resources/prompts/'
@@ -44,88 +45,76 @@ SUGGESTIONS_PROMPT_PATH = os.path.join(PROMPT_DIR, 'suggestions_prompt.json')
 SQL_GENERATION_PROMPT_PATH = os.path.join(PROMPT_DIR,
     'sql_generation_prompt.json')
 SQL_RETRY_PROMPT_PATH = os.path.join(PROMPT_DIR, 'sql_retry_prompt.json')
+SUGGESTION_WORKERS = int(os.environ.get('SUGGESTION_WORKERS', 4))
+SUGGESTION_EXECUTOR = ThreadPoolExecutor(max_workers=SUGGESTION_WORKERS,
+    thread_name_prefix='suggestion-sql')
 os.makedirs(PROMPT_DIR, exist_ok=True)
 
 
 def get_db_connection():
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        return conn
+        return db_pool.get_request_connection()
     except mysql.connector.Error as e:
         logger.error(f'Database connection error: {str(e)}')
         raise
 
 
-def get_sqlite_connection():
+def ensure_prompt_files():
     try:
-        conn = sqlite3.connect(SQLITE_DB_PATH)
-        conn.row_factory = sqlite3.Row
-        return conn
-    except sqlite3.Error as e:
-        logger.error(f'SQLite connection error: {str(e)}')
-        raise
+        if not os.path.exists(SUGGESTIONS_PROMPT_PATH):
+            default_suggestions_prompt = {'system_message':
+                'You are a data science expert specialized in generating precise, insightful questions that lead to robust data-driven decisions.'
+                , 'task_description':
+                'For the given decision scenario, generate both a direct question and refinement questions.'
+                }
+            with open(SUGGESTIONS_PROMPT_PATH, 'w') as f:
+                json.dump(default_suggestions_prompt, f, indent=2)
+        if not os.path.exists(SQL_GENERATION_PROMPT_PATH):
+            default_sql_prompt = {'system_message':
+                'You are a database expert who knows every intricacy of SQL query generation.'
+                , 'task_description':
+                'Generate a SQL query to answer the following question.'}
+            with open(SQL_GENERATION_PROMPT_PATH, 'w') as f:
+                json.dump(default_sql_prompt, f, indent=2)
+        if not os.path.exists(SQL_RETRY_PROMPT_PATH):
+            default_retry_prompt = {'system_message':
+                'You are a database expert who needs to fix a SQL query that failed.'
+                , 'task_description':
+                'Analyze the error message provided and fix the SQL query that failed.'
+                }
+            with open(SQL_RETRY_PROMPT_PATH, 'w') as f:
+                json.dump(default_retry_prompt, f, indent=2)
+    except Exception as e:
+        logger.error(f'Error writing default prompt files: {str(e)}')
+
+
+ensure_prompt_files()
 
 
 def load_files():
     try:
-        with open(SCHEMA_FILE_PATH, 'r') as f:
-            schema_data = json.load(f)
-        try:
-            with open(CLEAN_SCHEMA_FILE_PATH, 'r') as f:
-                clean_schema_data = json.load(f)
-                logger.info('Successfully loaded clean schema details')
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            logger.warning(f'Failed to load clean schema details: {str(e)}')
-            clean_schema_data = {}
-        try:
-            with open(COMPACT_STATS_FILE_PATH, 'r') as f:
-                compact_stats_data = json.load(f)
-                logger.info('Successfully loaded compact dataset statistics')
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            logger.warning(
-                f'Failed to load compact dataset statistics: {str(e)}')
-            compact_stats_data = {}
+        schema_data = resource_registry.get_json(SCHEMA_FILE_PATH)
+        clean_schema_data = resource_registry.get_json(CLEAN_SCHEMA_FILE_PATH,
+            {})
+        compact_stats_data = resource_registry.get_json(
+            COMPACT_STATS_FILE_PATH, {})
         pillar_files = {'toulmin': TOULMIN_FILE_PATH, 'dataset_schema':
             DATASET_SCHEMA_FILE_PATH, 'vulnerability':
             VULNERABILITY_FILE_PATH, 'counterargument':
             COUNTERARGUMENT_FILE_PATH}
         pillar_data = {}
         for key, path in pillar_files.items():
-            if not os.path.exists(path):
+            data = resource_registry.get_json(path, None)
+            if data is None:
                 logger.warning(f'Pillar file not found: {path}')
                 continue
-            with open(path, 'r') as f:
-                pillar_data[key] = json.load(f)
+            pillar_data[key] = data
         try:
-            if not os.path.exists(SUGGESTIONS_PROMPT_PATH):
-                default_suggestions_prompt = {'system_message':
-                    'You are a data science expert specialized in generating precise, insightful questions that lead to robust data-driven decisions.'
-                    , 'task_description':
-                    'For the given decision scenario, generate both a direct question and refinement questions.'
-                    }
-                with open(SUGGESTIONS_PROMPT_PATH, 'w') as f:
-                    json.dump(default_suggestions_prompt, f, indent=2)
-            if not os.path.exists(SQL_GENERATION_PROMPT_PATH):
-                default_sql_prompt = {'system_message':
-                    'You are a database expert who knows every intricacy of SQL query generation.'
-                    , 'task_description':
-                    'Generate a SQL query to answer the following question.'}
-                with open(SQL_GENERATION_PROMPT_PATH, 'w') as f:
-                    json.dump(default_sql_prompt, f, indent=2)
-            if not os.path.exists(SQL_RETRY_PROMPT_PATH):
-                default_retry_prompt = {'system_message':
-                    'You are a database expert who needs to fix a SQL query that failed.'
-                    , 'task_description':
-                    'Analyze the error message provided and fix the SQL query that failed.'
-                    }
-                with open(SQL_RETRY_PROMPT_PATH, 'w') as f:
-                    json.dump(default_retry_prompt, f, indent=2)
-            with open(SUGGESTIONS_PROMPT_PATH, 'r') as f:
-                suggestions_prompt = json.load(f)
-            with open(SQL_GENERATION_PROMPT_PATH, 'r') as f:
-                sql_generation_prompt = json.load(f)
-            with open(SQL_RETRY_PROMPT_PATH, 'r') as f:
-                sql_retry_prompt = json.load(f)
+            suggestions_prompt = resource_registry.get_json(
+                SUGGESTIONS_PROMPT_PATH)
+            sql_generation_prompt = resource_registry.get_json(
+                SQL_GENERATION_PROMPT_PATH)
+            sql_retry_prompt = resource_registry.get_json(SQL_RETRY_PROMPT_PATH)
             prompts = {'suggestions': suggestions_prompt, 'sql_generation':
                 sql_generation_prompt, 'sql_retry': sql_retry_prompt}
         except Exception as e:
@@ -185,186 +174,97 @@ def get_flash_sql_response_schema():
 
 
 def call_flash_api(prompt, response_schema, max_tokens=8192, user_id=None,
-    dataset_id=None):
+    dataset_id=None, stream_paths=(), on_element=None, label='suggestions'):
+    """Call Flash and return the parsed JSON response (None on failure).
+
+    Elements at `stream_paths` are parsed while the response streams in and
+    passed to on_element(path, value) as soon as each one closes. `label`
+    names the call in the LLM client's metrics and recordings.
+    """
     try:
         logger.info('Calling Flash (Gemini) API')
         if user_id and dataset_id:
             stream_manager.update_stream(user_id, dataset_id, 'suggestions',
                 'model_api_call', 'Asking AI to generate suggestions', 40)
         logger.info(f'Prompt (abbreviated): {prompt[:200]}...')
-        generate_content_config = types.GenerateContentConfig(temperature=0,
-            top_p=0.95, max_output_tokens=max_tokens, response_modalities=[
-            'TEXT'], safety_settings=[types.SafetySetting(category=
-            'HARM_CATEGORY_HATE_SPEECH', threshold='OFF'), types.
-            SafetySetting(category='HARM_CATEGORY_DANGEROUS_CONTENT',
-            threshold='OFF'), types.SafetySetting(category=
-            'HARM_CATEGORY_SEXUALLY_EXPLICIT', threshold='OFF'), types.
-            SafetySetting(category='HARM_CATEGORY_HARASSMENT', threshold=
-            'OFF')], response_mime_type='application/json', response_schema
-            =response_schema)
-        contents = [types.Content(role='user', parts=[types.Part.from_text(
-            text=prompt)])]
-        response_text = ''
-        for chunk in FLASH_CLIENT.models.generate_content_stream(model=
-            FLASH_MODEL, contents=contents, config=generate_content_config):
-            chunk_text = chunk.text if chunk.text else ''
-            response_text += chunk_text
+        parser = json_stream.JsonStreamParser(*stream_paths)
+
+        def on_text(chunk):
+            for path, value in parser.feed(chunk):
+                if on_element is not None:
+                    on_element(path, value)
+        response_text = llm_client.generate_flash(FLASH_CLIENT, FLASH_MODEL,
+            prompt, llm_client.flash_config(response_schema, max_tokens),
+            deadline=llm_client.INTERACTIVE_DEADLINE_SECONDS, on_text=
+            on_text if on_element is not None else None, label=label)
+        if on_element is not None and not parser.text():
+            on_text(response_text)
         logger.info(
             f'Flash API response received: {len(response_text)} characters')
         logger.info(f'Response (abbreviated): {response_text[:200]}...')
-        try:
-            parsed_response = json.loads(response_text)
-            return parsed_response
-        except json.JSONDecodeError as e:
-            logger.error(f'Failed to parse JSON from Flash response: {str(e)}')
-            json_start = response_text.find('```json')
-            if json_start != -1:
-                json_start += 7
-                json_end = response_text.find('```', json_start)
-                if json_end != -1:
-                    json_str = response_text[json_start:json_end].strip()
-                    try:
-                        return json.loads(json_str)
-                    except json.JSONDecodeError:
-                        pass
-            json_start = response_text.find('```')
-            if json_start != -1:
-                json_start += 3
-                json_end = response_text.find('```', json_start)
-                if json_end != -1:
-                    json_str = response_text[json_start:json_end].strip()
-                    try:
-                        return json.loads(json_str)
-                    except json.JSONDecodeError:
-                        pass
+        parsed_response = llm_client.parse_json(response_text)
+        if parsed_response is None:
+            logger.error('Failed to parse JSON from Flash response')
             logger.error(f'Raw response: {response_text[:1000]}...')
-            return None
+        return parsed_response
     except Exception as e:
         logger.error(f'Error calling Flash API: {str(e)}')
         logger.error(traceback.format_exc())
         return None
 
 
+def primary_suggestion(primary_question):
+    if not primary_question or 'question' not in primary_question:
+        return None
+    return {'question': primary_question.get('question', ''), 'pillar':
+        'Primary Question', 'component': 'Direct Question', 'purpose':
+        primary_question.get('explanation', ''), 'rationale':
+        'This question directly addresses the core information need.'}
+
+
+def client_suggestion(suggestion, temp_id):
+    return {'temp_id': temp_id, 'question': suggestion.get('question', ''),
+        'pillar': suggestion.get('pillar', ''), 'component': suggestion.get
+        ('component', ''), 'purpose': suggestion.get('purpose', ''),
+        'rationale': suggestion.get('rationale', '')}
+
+
 def generate_suggestions(question, decision, schema_data, clean_schema_data,
-    compact_stats_data, pillar_data, prompts):
+    compact_stats_data, pillar_data, prompts, on_suggestion=None):
+    """Generate suggestions; on_suggestion(temp_id, suggestion) is called
+    for each one while the model is still writing the rest.
+
+    The primary question is required by the response schema, so it is
+    always temp_id 1 and refinement question i is temp_id i + 2, the same
+    numbering the final list gets.
+    """
     try:
-        vulnerability_data = pillar_data.get('vulnerability', {})
-        vulnerability_categories = []
-        if 'categories' in vulnerability_data:
-            for category in vulnerability_data.get('categories', []):
-                items = []
-                for item in category.get('items', []):
-                    items.append({'name': item.get('item_name', ''), 'id':
-                        item.get('vulnerability_id', 0), 'description':
-                        item.get('item_description', '')})
-                vulnerability_categories.append({'name': category.get(
-                    'category_name', ''), 'description': category.get(
-                    'category_description', ''), 'items': items})
-        toulmin_data = pillar_data.get('toulmin', {})
-        toulmin_components = []
-        if 'categories' in toulmin_data:
-            for category in toulmin_data.get('categories', []):
-                if category.get('category_name') == 'Argument Components':
-                    for item in category.get('items', []):
-                        sub_items = []
-                        for sub_item in item.get('sub_items', []):
-                            sub_items.append({'name': sub_item.get(
-                                'aspect_name', ''), 'description': sub_item
-                                .get('description', '')})
-                        toulmin_components.append({'name': item.get(
-                            'item_name', ''), 'description': item.get(
-                            'item_description', ''), 'aspects': sub_items})
-        dataset_schema_data = pillar_data.get('dataset_schema', {})
-        schema_categories = []
-        if 'categories' in dataset_schema_data:
-            for category in dataset_schema_data.get('categories', []):
-                item_details = []
-                for item in category.get('items', []):
-                    item_details.append({'name': item.get('item_name', ''),
-                        'description': item.get('item_description', '')})
-                schema_categories.append({'name': category.get(
-                    'category_name', ''), 'description': category.get(
-                    'category_description', ''), 'items': item_details})
-        counterargument_data = pillar_data.get('counterargument', {})
-        counterargument_categories = []
-        if 'categories' in counterargument_data:
-            for category in counterargument_data.get('categories', []):
-                item_details = []
-                for item in category.get('items', []):
-                    item_details.append({'name': item.get('item_name', ''),
-                        'description': item.get('item_description', '')})
-                counterargument_categories.append({'name': category.get(
-                    'category_name', ''), 'description': category.get(
-                    'category_description', ''), 'items': item_details})
-        suggestions_prompt = prompts.get('suggestions', {})
-        prompt = f"""
-{suggestions_prompt.get('system_message', 'You are a data science expert specialized in generating precise, insightful questions.')}
-
-{suggestions_prompt.get('task_description', 'For the given decision scenario, generate questions that help make better decisions.')}
-
-Original Question: "{question}"
-Decision Context: "{decision}"
-
-{json.dumps(schema_data, indent=2)}
-
-{json.dumps(clean_schema_data, indent=2)}
-
-{json.dumps(compact_stats_data, indent=2)}
-
-{suggestions_prompt.get('hard_to_vary_definition', 'A hard-to-vary explanation has specific, data-constrained, non-arbitrary components.')}
-
-"""
-        if 'computational_algorithm' in suggestions_prompt:
-            for step in suggestions_prompt.get('computational_algorithm', []):
-                prompt += (
-                    f"\n## {step.get('stage', '')}\n{step.get('description', '')}\n"
-                    )
-        else:
-            prompt += """
-Systematically analyze the decision scenario for potential cognitive biases using this reference:
-"""
-            prompt += json.dumps(vulnerability_categories, indent=2)
-            prompt += (
-                '\nFor each bias pattern identified, map to the database schema:\n'
-                )
-            prompt += json.dumps(schema_categories, indent=2)
-            prompt += """
-Classify each potential question according to these argument components:
-"""
-            prompt += json.dumps(toulmin_components, indent=2)
-            prompt += """
-Evaluate each potential question against these counter-argument frameworks:
-"""
-            prompt += json.dumps(counterargument_categories, indent=2)
-            prompt += """
-Produce a final set of questions by:
-- Removing redundancies while preserving distinctness
-- Ensuring comprehensive coverage across bias types and argument components
-- Formulating questions in clear, precise natural language
-- Ensuring each question contributes to a hard-to-vary explanation
-"""
-        prompt += '\n# Important Guidelines\n'
-        for guideline in suggestions_prompt.get('important_guidelines', [
-            'Generate 3-5 refinement questions that will help improve the decision-making process'
-            ,
-            'Each question must be clear, specific, and answerable using SQL queries against the database'
-            ,
-            'The questions should address different types of potential biases or limitations'
-            , 'Ensure your response follows the required format exactly']):
-            prompt += f'- {guideline}\n'
+        prompt = prompt_assembly.build_suggestions_prompt(question,
+            decision, schema_data, clean_schema_data, compact_stats_data,
+            pillar_data, prompts)
         response_schema = get_flash_suggestions_response_schema()
-        response_data = call_flash_api(prompt, response_schema)
+        on_element = None
+        if on_suggestion is not None:
+
+            def on_element(path, value):
+                if path == ('primary_question',):
+                    suggestion = primary_suggestion(value)
+                    temp_id = 1
+                else:
+                    suggestion = value if isinstance(value, dict) else None
+                    temp_id = path[1] + 2
+                if suggestion:
+                    on_suggestion(temp_id, suggestion)
+        response_data = call_flash_api(prompt, response_schema,
+            stream_paths=(('primary_question',), ('refinement_questions',
+            json_stream.WILDCARD)), on_element=on_element)
         if not response_data:
             return None
-        primary_question = response_data.get('primary_question', {})
+        primary = primary_suggestion(response_data.get('primary_question', {})
+            )
         refinement_questions = response_data.get('refinement_questions', [])
         suggestions = []
-        if primary_question and 'question' in primary_question:
-            primary = {'question': primary_question.get('question', ''),
-                'pillar': 'Primary Question', 'component':
-                'Direct Question', 'purpose': primary_question.get(
-                'explanation', ''), 'rationale':
-                'This question directly addresses the core information need.'}
+        if primary:
             suggestions.append(primary)
         suggestions.extend(refinement_questions)
         return suggestions
@@ -377,69 +277,12 @@ Produce a final set of questions by:
 def generate_sql_with_flash(question, schema_data, clean_schema_data,
     compact_stats_data, prompts, is_retry=False, error_info=None):
     try:
-        prompt_data = prompts.get('sql_retry' if is_retry else
-            'sql_generation', {})
-        prompt = f"""
-{prompt_data.get('system_message', 'You are a database expert who knows every intricacy of SQL query generation for SQLite databases.')}
-
-{prompt_data.get('task_description', 'Generate a SQL query to answer the following question:')}
-"{question}"
-
-{json.dumps(schema_data, indent=2)}
-
-{json.dumps(clean_schema_data, indent=2)}
-
-{json.dumps(compact_stats_data, indent=2)}
-
-"""
-        for guideline in prompt_data.get('sqlite_guidelines', [
-            'SQLite does not support RIGHT JOIN or FULL OUTER JOIN - use LEFT JOIN instead'
-            ,
-            'Use double quotes for identifiers (table and column names) and single quotes for string literals'
-            ,
-            'For date operations, use SQLite date functions like strftime()',
-            'SQLite supports LIMIT and OFFSET for pagination',
-            'SQLite does not support advanced window functions - keep aggregations simple'
-            ,
-            'IMPORTANT: Always include LIMIT 10 when retrieving lists of data',
-            'Use clear column aliases for readability (e.g., COUNT(*) AS total_count)'
-            ]):
-            prompt += f'- {guideline}\n'
-        prompt += '\n# CRITICAL: Column Name Rules\n'
-        for rule in prompt_data.get('column_name_rules', [
-            'Use EXACTLY the column names as they appear in the schema - check each column name carefully'
-            , 'Do NOT use spaces in column names',
-            'Always double-check aliases when using table.column notation',
-            'Verify all column names against the schema before finalizing any query'
-            ]):
-            prompt += f'- {rule}\n'
-        if is_retry and error_info:
-            prompt += f"""
-```sql
-{error_info.get('previous_sql', '')}
-```
-
-{error_info.get('error', '')}
-
-{error_info.get('traceback', '')}
-
-"""
-            for error in prompt_data.get('common_errors_to_fix', [
-                'Incorrect column or table names',
-                'Missing quotes around identifiers with spaces',
-                'Invalid SQL syntax', 'Type mismatches in comparisons',
-                'Missing or incorrect join conditions']):
-                prompt += f'- {error}\n'
-            prompt += '\n# Analysis Instructions\n'
-            for instruction in prompt_data.get('analysis_instructions', [
-                'Carefully examine the error message to identify the exact issue'
-                , 'Check if column or table names are incorrect',
-                'Verify that all syntax is valid for SQLite',
-                'Ensure all column references are properly quoted if they contain spaces'
-                , 'Check for type mismatches in comparisons or calculations']):
-                prompt += f'- {instruction}\n'
+        prompt = prompt_assembly.build_sql_prompt(question, schema_data,
+            clean_schema_data, compact_stats_data, prompts, is_retry,
+            error_info)
         response_schema = get_flash_sql_response_schema()
-        response_data = call_flash_api(prompt, response_schema)
+        response_data = call_flash_api(prompt, response_schema, label=
+            'suggestion_sql')
         if not response_data:
             return None, None, 'Failed to get response from Flash API'
         sql = response_data.get('sql_query', '')
@@ -452,33 +295,39 @@ def generate_sql_with_flash(question, schema_data, clean_schema_data,
         return None, None, f'Error: {str(e)}'
 
 
-def execute_sql_query(sql_query):
-    import time
-    try:
-        sqlite_conn = get_sqlite_connection()
-        cursor = sqlite_conn.cursor()
-        start_time = time.time()
-        cursor.execute(sql_query)
-        rows = cursor.fetchall()
-        elapsed_time = time.time() - start_time
-        column_names = [description[0] for description in cursor.description
-            ] if cursor.description else []
-        formatted_results = []
-        for row in rows:
-            row_dict = {}
-            for i, column_name in enumerate(column_names):
-                value = row[i]
-                row_dict[column_name] = value
-            formatted_results.append(row_dict)
-        cursor.close()
-        sqlite_conn.close()
-        return {'success': True, 'result_rows': formatted_results,
-            'column_names': column_names, 'row_count': len(rows),
-            'elapsed_time': elapsed_time}
-    except sqlite3.Error as e:
-        logger.error(f'SQLite error executing query: {str(e)}')
-        return {'success': False, 'error': str(e), 'traceback': traceback.
-            format_exc()}
+def validate_sql(sql_query):
+    validator = sql_validator.get_validator(resource_registry.get_json(
+        SCHEMA_FILE_PATH), resource_registry.get_json(
+        COMPACT_STATS_FILE_PATH, None))
+    validation = validator.validate(sql_query)
+    for fix in validation.fixes:
+        logger.info(
+            f"Validator fixed {fix['kind']} {fix['from']!r} -> {fix['to']!r} ({fix['reason']})"
+            )
+    return validation.sql, validation
+
+
+def execute_sql_query(sql_query, cancel_key=None, validation=None):
+    execution_result = sql_sandbox.execute(sql_query, SQLITE_DB_PATH,
+        cancel_key)
+    if validation is not None:
+        sql_validator.record_outcome(validation, execution_result.get(
+            'success'))
+        if validation.fixes or validation.issues:
+            execution_result['validation'] = validation.to_dict()
+    return execution_result
+
+
+def execute_unless_cancelled(sql_query, cancel_key, validation, cancelled):
+    """execute_sql_query, skipped once `cancelled()` is true.
+
+    The sandbox cancel key only interrupts a query that is already running,
+    so work abandoned during a model call is checked for here.
+    """
+    if cancelled is not None and cancelled():
+        return {'success': False, 'cancelled': True, 'error':
+            'Query cancelled before execution'}
+    return execute_sql_query(sql_query, cancel_key, validation)
 
 
 def format_answer_from_results(results):
@@ -551,21 +400,31 @@ def update_query_with_execution_results(conn, query_id, sql,
         return False
 
 
+def resolve_streaming_id(data):
+    streaming_id = data.get('streaming_id') or data.get('dataset_id')
+    if not streaming_id and data.get('user_id'):
+        import time
+        streaming_id = f"{data.get('user_id')}_{int(time.time())}"
+    return streaming_id
+
+
 @bp.route('', methods=['POST'])
 def get_suggestions():
+    data = request.json
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+    if jobs.wants_async(data):
+        data = dict(data, streaming_id=resolve_streaming_id(data))
+        return jobs.submit_response('suggestions', run_get_suggestions, (
+            data,), (data.get('user_id'), data['streaming_id'], 'suggestions'))
+    return run_get_suggestions(data)
+
+
+def run_get_suggestions(data):
     try:
-        data = request.json
-        if not data:
-            return jsonify({'error': 'No data provided'}), 400
         user_id = data.get('user_id')
         dataset_id = data.get('dataset_id')
-        global streaming_id
-        streaming_id = data.get('streaming_id')
-        if not streaming_id:
-            streaming_id = dataset_id
-            if not streaming_id and user_id:
-                import time
-                streaming_id = f'{user_id}_{int(time.time())}'
+        streaming_id = resolve_streaming_id(data)
         if user_id and streaming_id:
             stream_manager.update_stream(user_id, streaming_id,
                 'suggestions', 'starting', 'Starting suggestion generation', 0)
@@ -640,30 +499,41 @@ def get_suggestions():
         (schema_data, clean_schema_data, compact_stats_data, pillar_data,
             prompts) = load_files()
         logger.info(f'Generating new suggestions for question: {question}')
-        if user_id and streaming_id:
-            stream_manager.update_stream(user_id, streaming_id,
-                'suggestions', 'generating_suggestions',
+
+        def run_generation(flight):
+            flight.progress('generating_suggestions',
                 'Custom crafting suggestions', 60)
-        suggestions_data = generate_suggestions(question, decision,
-            schema_data, clean_schema_data, compact_stats_data, pillar_data,
-            prompts)
-        if user_id and streaming_id:
-            stream_manager.update_stream(user_id, streaming_id,
-                'suggestions', 'processing_suggestions',
+
+            def publish(temp_id, suggestion):
+                flight.progress('suggestion', f'Suggestion {temp_id} ready',
+                    65, client_suggestion(suggestion, temp_id))
+            result = generate_suggestions(question, decision, schema_data,
+                clean_schema_data, compact_stats_data, pillar_data, prompts,
+                on_suggestion=publish)
+            flight.progress('processing_suggestions',
                 'Processing generated suggestions', 70)
+            return result
+        suggestions_data, shared = singleflight.do(('suggestions',
+            singleflight.fingerprint(question, decision)), run_generation,
+            (user_id, streaming_id, 'suggestions'))
+        if shared:
+            logger.info(
+                f'Reused in-flight suggestion generation for question: {question}'
+                )
         if not suggestions_data:
             return jsonify({'success': False, 'error':
                 'Failed to generate suggestions', 'message':
                 'Could not generate suggestions for this question and decision'
                 }), 500
         logger.info(f'Generated {len(suggestions_data)} suggestions')
-        client_suggestions = []
-        for idx, suggestion in enumerate(suggestions_data, start=1):
-            client_suggestions.append({'temp_id': idx, 'question':
-                suggestion.get('question', ''), 'pillar': suggestion.get(
-                'pillar', ''), 'component': suggestion.get('component', ''),
-                'purpose': suggestion.get('purpose', ''), 'rationale':
-                suggestion.get('rationale', '')})
+        client_suggestions = [client_suggestion(suggestion, idx) for idx,
+            suggestion in enumerate(suggestions_data, start=1)]
+        if dataset_id:
+            speculation.schedule(dataset_id, [(suggestion['question'], (
+                dataset_id, suggestion, (schema_data, clean_schema_data,
+                compact_stats_data, pillar_data, prompts))) for suggestion in
+                client_suggestions], speculate_suggestion_sql,
+                discard_speculative_query)
         if user_id and streaming_id:
             stream_manager.update_stream(user_id, streaming_id,
                 'suggestions', 'complete', 'Suggestion generation complete',
@@ -699,155 +569,49 @@ def process_selected_suggestions():
             )
         logger.info(f'Selected suggestions: {len(selected_suggestions)}')
         conn = get_db_connection()
-        schema_data, clean_schema_data, compact_stats_data, _, prompts = (
-            load_files())
-        answers = []
-        queries = []
-        for suggestion in selected_suggestions:
+        files = load_files()
+        total_suggestions = len(selected_suggestions)
+        results = [None] * total_suggestions
+        pending = []
+        for position, suggestion in enumerate(selected_suggestions):
             try:
-                total_suggestions = len(selected_suggestions)
-                suggestion_progress_increment = 70 / max(total_suggestions, 1)
-                question = suggestion.get('question', '')
-                current_index = selected_suggestions.index(suggestion)
-                progress = 20 + current_index * suggestion_progress_increment
-                progress_message = (
-                    f'Processing suggestion {current_index + 1} of {total_suggestions}'
-                    )
-                if user_id and dataset_id:
-                    stream_manager.update_stream(user_id, dataset_id,
-                        'process_selected_suggestions', 'progress',
-                        progress_message, int(progress))
-                if 'query_id' in suggestion and suggestion['query_id']:
-                    query_id = suggestion['query_id']
-                    logger.info(
-                        f'Processing existing suggestion with query_id={query_id}'
-                        )
-                    cursor = conn.cursor(dictionary=True)
-                    cursor.execute(
-                        """
-                        SELECT q.id, q.NL_question, q.COT_details, q.current_sql_options, 
-                               q.execution_details, q.execution_status, q.framework_details
-                        FROM query q
-                        WHERE q.id = %s 
-                        AND q.dataset_id = %s
-                        AND q.status = 'active'
-                    """
-                        , (query_id, dataset_id))
-                    query_record = cursor.fetchone()
-                    cursor.close()
-                    if not query_record:
-                        logger.warning(
-                            f'Query with id={query_id} not found in database')
-                        answers.append({'query_id': query_id, 'question':
-                            question, 'error': 'Query not found'})
-                        queries.append({'query_id': query_id, 'error':
-                            'Query not found'})
-                        continue
-                    if query_record.get('execution_status'
-                        ) == 'success' and query_record.get('execution_details'
-                        ) and query_record.get('current_sql_options'):
-                        logger.info(
-                            f'Using existing execution results for query_id={query_id}'
-                            )
-                        try:
-                            current_sql_options = json.loads(query_record[
-                                'current_sql_options']) if query_record.get(
-                                'current_sql_options') else {}
-                        except (json.JSONDecodeError, TypeError) as e:
-                            logger.error(
-                                f'Error parsing current_sql_options for query_id={query_id}: {str(e)}'
-                                )
-                            current_sql_options = {}
-                        try:
-                            execution_details = json.loads(query_record[
-                                'execution_details']) if query_record.get(
-                                'execution_details') else {}
-                        except (json.JSONDecodeError, TypeError) as e:
-                            logger.error(
-                                f'Error parsing execution_details for query_id={query_id}: {str(e)}'
-                                )
-                            execution_details = {}
-                        try:
-                            cot_details = json.loads(query_record[
-                                'COT_details']) if query_record.get(
-                                'COT_details') else {}
-                        except (json.JSONDecodeError, TypeError) as e:
-                            logger.error(
-                                f'Error parsing COT_details for query_id={query_id}: {str(e)}'
-                                )
-                            cot_details = {}
-                        sql = current_sql_options.get('sql_query', '')
-                        results = execution_details.get('result_rows', [])
-                        explanation = cot_details.get('explanation', '')
-                        answer_text = format_answer_from_results(results)
-                        answers.append({'query_id': query_id, 'question':
-                            query_record['NL_question'], 'answer':
-                            answer_text, 'results': results})
-                        queries.append({'query_id': query_id, 'sql': sql,
-                            'explanation': explanation})
-                    else:
-                        question = query_record['NL_question']
-                        result = generate_and_execute_sql(conn, query_id,
-                            question, schema_data, clean_schema_data,
-                            compact_stats_data, prompts)
-                        if result:
-                            answers.append(result['answer'])
-                            queries.append(result['query'])
-                else:
-                    logger.info(f'Processing new suggestion: {question}')
-                    pillar = suggestion.get('pillar', 'Refinement Question')
-                    component = suggestion.get('component', 'General')
-                    purpose = suggestion.get('purpose', '')
-                    rationale = suggestion.get('rationale', '')
-                    framework_details = {'pillar': pillar, 'component':
-                        component, 'purpose': purpose, 'rationale':
-                        rationale, 'type': 'refinement_question'}
-                    if 'Cognitive Vulnerability' in pillar:
-                        framework_factor = 'Bias Mitigation'
-                    elif 'Dataset Schema' in pillar:
-                        framework_factor = 'Data Structure Validation'
-                    elif 'Toulmin Argument' in pillar:
-                        framework_factor = 'Argument Enhancement'
-                    elif 'Counter-Argument' in pillar:
-                        framework_factor = 'Counter-Argument Testing'
-                    else:
-                        framework_factor = 'Refinement Question'
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        """
-                        SELECT MAX(model_query_sequence_index) as max_idx
-                        FROM query
-                        WHERE dataset_id = %s AND query_model = 'baqr'
-                    """
-                        , (dataset_id,))
-                    result = cursor.fetchone()
-                    max_idx = result[0] if result[0] else 0
-                    sequence_index = max_idx + 1
-                    insert_query = """
-                    INSERT INTO query 
-                    (dataset_id, query_model, NL_question, model_query_sequence_index, 
-                    framework_details, framework_contribution_factor_name, sql_generation_status, status)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    """
-                    cursor.execute(insert_query, (dataset_id, 'baqr',
-                        question, sequence_index, json.dumps(
-                        framework_details), framework_factor, 'pending',
-                        'active'))
-                    query_id = cursor.lastrowid
-                    cursor.close()
-                    conn.commit()
-                    logger.info(f'Created new query record with ID {query_id}')
-                    result = generate_and_execute_sql(conn, query_id,
-                        question, schema_data, clean_schema_data,
-                        compact_stats_data, prompts)
-                    if result:
-                        answers.append(result['answer'])
-                        queries.append(result['query'])
+                results[position], work = prepare_selected_suggestion(conn,
+                    dataset_id, suggestion)
+                if work:
+                    pending.append((position,) + work)
             except Exception as e:
                 logger.error(f'Error processing suggestion: {str(e)}')
                 logger.error(traceback.format_exc())
-                continue
         conn.close()
+        completed = total_suggestions - len(pending)
+        cancel_key = sql_sandbox.make_cancel_key(user_id,
+            'process_selected_suggestions')
+        futures = {SUGGESTION_EXECUTOR.submit(run_suggestion_sql, query_id,
+            question, files, cancel_key): position for position, query_id,
+            question in pending}
+        logger.info(
+            f'Generating SQL for {len(pending)} of {total_suggestions} suggestions with up to {SUGGESTION_WORKERS} workers'
+            )
+        for future in as_completed(futures):
+            position = futures[future]
+            try:
+                results[position] = future.result()
+            except Exception as e:
+                logger.error(f'Error processing suggestion: {str(e)}')
+                logger.error(traceback.format_exc())
+            completed += 1
+            stream_manager.update_stream(user_id, dataset_id,
+                'process_selected_suggestions', 'progress',
+                f'Processed suggestion {position + 1} ({completed} of {total_suggestions} done)'
+                , int(20 + completed * 70 / total_suggestions))
+        speculation.discard_dataset(dataset_id)
+        answers = [result['answer'] for result in results if result]
+        columnar = result_format.wants_columnar(data)
+        for answer in answers:
+            if 'results' in answer:
+                answer['results'] = result_format.present(answer['results'],
+                    columnar)
+        queries = [result['query'] for result in results if result]
         reasoning = (
             'Results for selected refinement queries. Each query provides additional insights related to your question and decision context.'
             )
@@ -859,12 +623,254 @@ def process_selected_suggestions():
         return jsonify({'error': str(e)}), 500
 
 
+def prepare_selected_suggestion(conn, dataset_id, suggestion):
+    """Resolve one selection to a finished result or to SQL work.
+
+    Returns (result, work): stored results and missing queries come back as
+    a result; anything that still needs SQL comes back as a
+    (query_id, question) work item. New suggestions take over their stored
+    speculative row when there is one, otherwise they get their query row
+    here; either way on the request connection, so sequence indexes stay
+    in selection order.
+    """
+    question = suggestion.get('question', '')
+    speculated = False
+    if not suggestion.get('query_id') and speculation.SPECULATIVE_SQL_ENABLED:
+        conn.close()
+        try:
+            claimed = speculation.claim(dataset_id, question)
+        finally:
+            conn.reopen()
+        query_id = promote_speculative_query(conn, dataset_id, question
+            ) if claimed is not False else None
+        if query_id:
+            suggestion = dict(suggestion, query_id=query_id)
+            speculated = True
+        else:
+            speculation.record_selection(False)
+    if 'query_id' in suggestion and suggestion['query_id']:
+        query_id = suggestion['query_id']
+        logger.info(f'Processing existing suggestion with query_id={query_id}')
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(
+            """
+            SELECT q.id, q.NL_question, q.COT_details, q.current_sql_options, 
+                   q.execution_details, q.execution_status, q.framework_details
+            FROM query q
+            WHERE q.id = %s 
+            AND q.dataset_id = %s
+            AND q.status = 'active'
+        """
+            , (query_id, dataset_id))
+        query_record = cursor.fetchone()
+        cursor.close()
+        if not query_record:
+            logger.warning(f'Query with id={query_id} not found in database')
+            return {'answer': {'query_id': query_id, 'question': question,
+                'error': 'Query not found'}, 'query': {'query_id': query_id,
+                'error': 'Query not found'}}, None
+        if query_record.get('execution_status'
+            ) == 'success' and query_record.get('execution_details'
+            ) and query_record.get('current_sql_options'):
+            logger.info(
+                f'Using existing execution results for query_id={query_id}')
+            try:
+                current_sql_options = json.loads(query_record[
+                    'current_sql_options']) if query_record.get(
+                    'current_sql_options') else {}
+            except (json.JSONDecodeError, TypeError) as e:
+                logger.error(
+                    f'Error parsing current_sql_options for query_id={query_id}: {str(e)}'
+                    )
+                current_sql_options = {}
+            try:
+                execution_details = json.loads(query_record[
+                    'execution_details']) if query_record.get(
+                    'execution_details') else {}
+            except (json.JSONDecodeError, TypeError) as e:
+                logger.error(
+                    f'Error parsing execution_details for query_id={query_id}: {str(e)}'
+                    )
+                execution_details = {}
+            try:
+                cot_details = json.loads(query_record['COT_details']
+                    ) if query_record.get('COT_details') else {}
+            except (json.JSONDecodeError, TypeError) as e:
+                logger.error(
+                    f'Error parsing COT_details for query_id={query_id}: {str(e)}'
+                    )
+                cot_details = {}
+            sql = current_sql_options.get('sql_query', '')
+            results = result_format.columnar_of(execution_details)
+            explanation = cot_details.get('explanation', '')
+            answer_text = format_answer_from_results(result_format.to_rows(
+                results))
+            if speculated:
+                speculation.record_selection(True)
+            return {'answer': {'query_id': query_id, 'question':
+                query_record['NL_question'], 'answer': answer_text,
+                'results': results}, 'query': {'query_id': query_id, 'sql':
+                sql, 'explanation': explanation}}, None
+        if speculated:
+            speculation.record_selection(False)
+        return None, (query_id, query_record['NL_question'])
+    logger.info(f'Processing new suggestion: {question}')
+    query_id = insert_suggestion_query(conn, dataset_id, suggestion)
+    return None, (query_id, question)
+
+
+def next_sequence_index(conn, dataset_id):
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT MAX(model_query_sequence_index) as max_idx
+        FROM query
+        WHERE dataset_id = %s AND query_model = 'baqr'
+    """
+        , (dataset_id,))
+    result = cursor.fetchone()
+    cursor.close()
+    max_idx = result[0] if result[0] else 0
+    return max_idx + 1
+
+
+def insert_suggestion_query(conn, dataset_id, suggestion, status='active'):
+    """Create the baqr query row for a suggestion and return its id.
+
+    Speculative rows get no sequence index until they are selected, so they
+    never shift the numbering of the questions the user actually picked.
+    """
+    question = suggestion.get('question', '')
+    pillar = suggestion.get('pillar', 'Refinement Question')
+    component = suggestion.get('component', 'General')
+    purpose = suggestion.get('purpose', '')
+    rationale = suggestion.get('rationale', '')
+    framework_details = {'pillar': pillar, 'component': component,
+        'purpose': purpose, 'rationale': rationale, 'type':
+        'refinement_question'}
+    if 'Cognitive Vulnerability' in pillar:
+        framework_factor = 'Bias Mitigation'
+    elif 'Dataset Schema' in pillar:
+        framework_factor = 'Data Structure Validation'
+    elif 'Toulmin Argument' in pillar:
+        framework_factor = 'Argument Enhancement'
+    elif 'Counter-Argument' in pillar:
+        framework_factor = 'Counter-Argument Testing'
+    else:
+        framework_factor = 'Refinement Question'
+    sequence_index = next_sequence_index(conn, dataset_id
+        ) if status == 'active' else None
+    cursor = conn.cursor()
+    insert_query = """
+    INSERT INTO query 
+    (dataset_id, query_model, NL_question, model_query_sequence_index, 
+    framework_details, framework_contribution_factor_name, sql_generation_status, status)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """
+    cursor.execute(insert_query, (dataset_id, 'baqr', question,
+        sequence_index, json.dumps(framework_details), framework_factor,
+        'pending', status))
+    query_id = cursor.lastrowid
+    cursor.close()
+    conn.commit()
+    logger.info(f'Created new {status} query record with ID {query_id}')
+    return query_id
+
+
+def promote_speculative_query(conn, dataset_id, question):
+    """Turn the stored speculative row for a selected question into an active one."""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT id FROM query
+        WHERE dataset_id = %s AND query_model = 'baqr'
+        AND NL_question = %s AND status = 'speculative'
+        ORDER BY id DESC LIMIT 1
+    """
+        , (dataset_id, question))
+    row = cursor.fetchone()
+    if not row:
+        cursor.close()
+        return None
+    cursor.execute(
+        "UPDATE query SET status = 'active', model_query_sequence_index = %s WHERE id = %s AND status = 'speculative'"
+        , (next_sequence_index(conn, dataset_id), row[0]))
+    promoted = cursor.rowcount
+    cursor.close()
+    conn.commit()
+    if not promoted:
+        return None
+    logger.info(f'Promoted speculative query {row[0]} for: {question}')
+    return row[0]
+
+
+def speculate_suggestion_sql(payload, entry):
+    """Background body for speculation: store a suggestion's SQL and results."""
+    dataset_id, suggestion, files = payload
+    if speculation.is_cancelled(entry):
+        return None
+    schema_data, clean_schema_data, compact_stats_data, _, prompts = files
+    conn = db_pool.get_connection()
+    try:
+        query_id = insert_suggestion_query(conn, dataset_id, suggestion,
+            'speculative')
+        entry['query_id'] = query_id
+        generate_and_execute_sql(conn, query_id, suggestion.get('question',
+            ''), schema_data, clean_schema_data, compact_stats_data,
+            prompts, entry['cancel_key'], lambda : speculation.
+            is_cancelled(entry))
+        return query_id
+    finally:
+        conn.close()
+
+
+def discard_speculative_query(entry):
+    """Delete the row of an abandoned speculative run unless it was promoted."""
+    query_id = entry.get('query_id')
+    if query_id is None:
+        return
+    conn = db_pool.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "DELETE FROM query WHERE id = %s AND status = 'speculative'", (
+            query_id,))
+        deleted = cursor.rowcount
+        cursor.close()
+        conn.commit()
+    finally:
+        conn.close()
+    if deleted:
+        logger.info(f'Deleted abandoned speculative query {query_id}')
+
+
+def run_suggestion_sql(query_id, question, files, cancel_key=None):
+    """Worker body: generate and execute SQL on a connection of its own."""
+    schema_data, clean_schema_data, compact_stats_data, _, prompts = files
+    conn = db_pool.get_connection()
+    try:
+        return generate_and_execute_sql(conn, query_id, question,
+            schema_data, clean_schema_data, compact_stats_data, prompts,
+            cancel_key)
+    finally:
+        conn.close()
+
+
 def generate_and_execute_sql(conn, query_id, question, schema_data,
-    clean_schema_data, compact_stats_data, prompts):
+    clean_schema_data, compact_stats_data, prompts, cancel_key=None,
+    cancelled=None):
+    """Generate, run and store SQL for a query row.
+
+    `conn` is closed before every model call and SQL run and reopened for
+    each write, so it is only held while rows are written. Once
+    `cancelled()` is true no further SQL is run.
+    """
     try:
+        conn.close()
         sql, thought_process, explanation = generate_sql_with_flash(question,
             schema_data, clean_schema_data, compact_stats_data, prompts)
         if not sql:
+            conn.reopen()
             update_query_with_execution_results(conn, query_id, '', 
                 thought_process or '', explanation or '', {'success': False,
                 'error': 'Failed to generate SQL query'}, 'a1_done')
@@ -873,15 +879,26 @@ def generate_and_execute_sql(conn, query_id, question, schema_data,
                 'Sorry, we could not generate a SQL query for this question'
                 }, 'query': {'query_id': query_id, 'error':
                 'Failed to generate SQL query'}}
-        execution_result = execute_sql_query(sql)
+        sql, validation = validate_sql(sql)
+        execution_result = execute_unless_cancelled(sql, cancel_key,
+            validation, cancelled)
+        conn.reopen()
         if execution_result.get('success'):
             update_query_with_execution_results(conn, query_id, sql,
                 thought_process, explanation, execution_result, 'a1_done')
-            results = execution_result.get('result_rows', [])
-            answer_text = format_answer_from_results(results)
+            results = execution_result['result']
+            answer_text = format_answer_from_results(result_format.to_rows(
+                results))
             return {'answer': {'query_id': query_id, 'question': question,
                 'answer': answer_text, 'results': results}, 'query': {
                 'query_id': query_id, 'sql': sql, 'explanation': explanation}}
+        if execution_result.get('cancelled'):
+            update_query_with_execution_results(conn, query_id, sql,
+                thought_process, explanation, execution_result, 'a1_done')
+            return {'answer': {'query_id': query_id, 'question': question,
+                'error': execution_result.get('error')}, 'query': {
+                'query_id': query_id, 'sql': sql, 'error': execution_result
+                .get('error')}}
         logger.info(
             f"First SQL execution failed. Error: {execution_result.get('error')}. Attempting retry."
             )
@@ -889,10 +906,12 @@ def generate_and_execute_sql(conn, query_id, question, schema_data,
             thought_process, explanation, execution_result, 'a1_done')
         error_info = {'previous_sql': sql, 'error': execution_result.get(
             'error', ''), 'traceback': execution_result.get('traceback', '')}
+        conn.close()
         sql, thought_process, explanation = generate_sql_with_flash(question,
             schema_data, clean_schema_data, compact_stats_data, prompts,
             is_retry=True, error_info=error_info)
         if not sql:
+            conn.reopen()
             update_query_with_execution_results(conn, query_id, '', 
                 thought_process or '', explanation or '', {'success': False,
                 'error': 'Failed to generate valid SQL on retry'}, 'a2_done')
@@ -902,12 +921,16 @@ def generate_and_execute_sql(conn, query_id, question, schema_data,
                 }, 'query': {'query_id': query_id, 'error':
                 'The query could not be executed with the current dataset schema'
                 }}
-        execution_result = execute_sql_query(sql)
+        sql, validation = validate_sql(sql)
+        execution_result = execute_unless_cancelled(sql, cancel_key,
+            validation, cancelled)
+        conn.reopen()
         update_query_with_execution_results(conn, query_id, sql,
             thought_process, explanation, execution_result, 'a2_done')
         if execution_result.get('success'):
-            results = execution_result.get('result_rows', [])
-            answer_text = format_answer_from_results(results)
+            results = execution_result['result']
+            answer_text = format_answer_from_results(result_format.to_rows(
+                results))
             return {'answer': {'query_id': query_id, 'question': question,
                 'answer': answer_text, 'results': results}, 'query': {
                 'query_id': query_id, 'sql': sql, 'explanation': explanation}}
@@ -4,26 +4,18 @@ import logging
 import mysql.connector
 import os
 from datetime import datetime
+from . import db_pool
 os.makedirs('logs', exist_ok=True)
 logging.basicConfig(filename='logs/user_feedback_service.log', level=
     logging.INFO, format=
     '%(asctime)s - %(levelname)s - %(pathname)s:%(lineno)d - %(message)s')
 logger = logging.getLogger(__name__)
 bp = Blueprint('user_feedback', __name__, url_prefix='/api/user_feedback')
-DB_CONFIG = {
-    'host': 'YOUR_DATABASE_HOST',
-    'port': 'YOUR_DATABASE_POST',
-    'user': 'YOUR_DATABASE_USER',
-    'password': 'YOUR_DATABASE_PASSWORD',
-    'database': 'YOUR_DATABASE_NAME'
-}
-
 
 
 def get_db_connection():
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        return conn
+        return db_pool.get_request_connection()
     except mysql.connector.Error as e:
         logger.error(f'Database connection error: {str(e)}')
         raise